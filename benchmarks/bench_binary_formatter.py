@@ -0,0 +1,132 @@
+"""
+Compares the size and encode time of BinaryFormatter frames with the JSON
+Lines JSONFormatter writes with each installed backend, on a corpus of
+generated request logs.
+
+    python benchmarks/bench_binary_formatter.py [--records 20000]
+"""
+import argparse
+import gzip
+import io
+import logging
+import random
+import time
+
+from nephthys import RequestLogRecord
+from nephthys.formatters.backends import available_backends
+from nephthys.formatters.binary import BinaryFormatter, BinaryReader
+from nephthys.formatters.json import JSONFormatter
+
+FMT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+ROUTES = [
+    ("GET", "/users/{id}", 200, 0, 800),
+    ("GET", "/users/{id}/transactions", 200, 0, 6000),
+    ("POST", "/payments", 201, 400, 300),
+    ("PUT", "/users/{id}/settings", 204, 200, 0),
+    ("GET", "/health", 200, 0, 20),
+    ("POST", "/auth/token", 401, 100, 60),
+]
+AGENTS = ["okhttp/4.9.0", "Oval/3.12 (iPhone; iOS 14.4)", "python-requests/2.25.1"]
+
+
+def make_body(rnd, size):
+    words = [
+        "amount",
+        "currency",
+        "EUR",
+        "description",
+        "Payment to Mario Rossi",
+        "booked",
+        "true",
+    ]
+    parts = []
+    while sum(map(len, parts)) < size:
+        parts.append('"{}": "{}"'.format(rnd.choice(words), rnd.choice(words)))
+    return "{" + ", ".join(parts) + "}"
+
+
+def make_record(rnd, i):
+    method, route, status, req_size, res_size = rnd.choice(ROUTES)
+    user = rnd.randrange(1, 100000)
+    path = route.replace("{id}", str(user))
+    start = 1548936000 + i * 0.01
+    duration = rnd.randrange(1000000, 900000000)
+
+    rec = RequestLogRecord(extra_tags=["api"])
+    rec.set_request_timing(start, start + duration / 1e9, duration)
+    rec.method = method
+    rec.url = "https://api.ovalmoney.com" + path
+    rec.route = route
+    if "{id}" in route:
+        rec.add_route_match("id", str(user))
+    rec.add_request_header("Accept", "application/json")
+    rec.add_request_header("User-Agent", rnd.choice(AGENTS))
+    rec.add_request_header("X-Request-Id", "{:032x}".format(rnd.getrandbits(128)))
+    rec.user = user
+    if req_size:
+        rec.add_request_header("Content-Type", "application/json")
+        body = make_body(rnd, req_size)
+        rec.request_body = body
+        rec.request_body_size = len(body)
+    rec.status_code = status
+    rec.add_response_header("Content-Type", "application/json")
+    rec.add_response_header("Server", "nginx")
+    if res_size:
+        body = make_body(rnd, res_size)
+        rec.response_body = body
+        rec.response_body_size = len(body)
+    return rec
+
+
+def make_corpus(count):
+    rnd = random.Random(0)
+    return [
+        logging.LogRecord(
+            "requests_in", logging.INFO, __file__, 1, make_record(rnd, i), [], None
+        )
+        for i in range(count)
+    ]
+
+
+def measure(formatter, corpus):
+    start = time.perf_counter()
+    chunks = [formatter.format_bytes(record) for record in corpus]
+    elapsed = time.perf_counter() - start
+    separator = getattr(formatter, "record_separator", b"\n")
+    data = separator.join(chunks) + separator
+    return data, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.records)
+    formatters = [
+        ("json ({})".format(name), JSONFormatter(fmt=FMT, json_backend=name))
+        for name in available_backends()
+    ]
+    formatters.append(("binary", BinaryFormatter(fmt=FMT)))
+
+    print(
+        "{:<18} {:>12} {:>12} {:>14}".format(
+            "formatter", "bytes", "gzip bytes", "us/record"
+        )
+    )
+    for name, formatter in formatters:
+        data, elapsed = measure(formatter, corpus)
+        print(
+            "{:<18} {:>12} {:>12} {:>14.2f}".format(
+                name, len(data), len(gzip.compress(data)), elapsed / len(corpus) * 1e6
+            )
+        )
+        if name == "binary":
+            start = time.perf_counter()
+            decoded = sum(1 for _ in BinaryReader().read(io.BytesIO(data)))
+            elapsed = time.perf_counter() - start
+            print("{:<18} {:>40.2f}".format("binary (decode)", elapsed / decoded * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares logging.FileHandler and nephthys' BatchFileHandler writing request
+logs formatted by JSONFormatter, from one or more threads.
+
+    python benchmarks/bench_file_handler.py [--records 100000] [--threads 1]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from nephthys import FilterLoggerAdapter, Log, RequestLogRecord
+from nephthys.formatters.json import JSONFormatter
+from nephthys.handlers import BatchFileHandler
+
+
+def make_record(i):
+    rec = RequestLogRecord()
+    rec.set_request_timing(1548936000.123, 1548936000.223, 100000000)
+    rec.method = "GET"
+    rec.url = "https://bench.local/items?page={}".format(i)
+    rec.add_request_header("Accept", "application/json")
+    rec.status_code = 200
+    rec.add_response_header("Content-Type", "application/json")
+    rec.response_body = '{"items": []}'
+    return rec
+
+
+def measure(handler, total, threads):
+    handler.setFormatter(JSONFormatter())
+    log = logging.getLogger("bench_file_handler")
+    log.handlers = [handler]
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    adapter = FilterLoggerAdapter(log)
+    per_thread = total // threads
+
+    def run():
+        for i in range(per_thread):
+            adapter.info(Log(make_record(i)))
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    logged = time.perf_counter() - start
+    handler.close()
+    return logged, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    for name, factory in [
+        ("FileHandler", logging.FileHandler),
+        ("BatchFileHandler", BatchFileHandler),
+    ]:
+        path = os.path.join(directory, name + ".log")
+        logged, closed = measure(factory(path), args.records, args.threads)
+        with open(path, "rb") as fp:
+            lines = sum(1 for _ in fp)
+        print(
+            "{:<18} {:>9.0f} records/s logged, {:>9.0f} records/s written ({} lines)".format(
+                name, args.records / logged, args.records / closed, lines
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
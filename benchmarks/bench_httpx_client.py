@@ -0,0 +1,96 @@
+"""
+Measures the throughput of concurrent requests made with httpx.AsyncClient
+and with nephthys' AsyncClient, against an in-process mock transport.
+Log records are written to a file handler, the way they would be in production.
+
+    python benchmarks/bench_httpx_client.py [--requests 5000] [--concurrency 100]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+
+from nephthys.clients.httpx import AsyncClient, default_dispatcher
+from nephthys.formatters.json import JSONFormatter
+
+BODY = (
+    b'{"items": ['
+    + b",".join(b'{"id": %d, "name": "item"}' % i for i in range(20))
+    + b"]}"
+)
+
+
+def handler(request):
+    return httpx.Response(
+        200, headers={"Content-Type": "application/json"}, content=BODY
+    )
+
+
+async def run(client, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            response = await client.get("https://bench.local/items?page={}".format(i))
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start
+
+
+def measure(client_class, total, concurrency):
+    async def main():
+        async with client_class(transport=httpx.MockTransport(handler)) as client:
+            return await run(client, total, concurrency)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    handler_ = logging.FileHandler(path)
+    handler_.setFormatter(JSONFormatter())
+    log = logging.getLogger("httpx_out")
+    log.addHandler(handler_)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+    try:
+        print("{:>12} {:>12} {:>12}".format("client", "seconds", "req/s"))
+        for name, client_class in (
+            ("httpx", httpx.AsyncClient),
+            ("nephthys", AsyncClient),
+        ):
+            elapsed = measure(client_class, args.requests, args.concurrency)
+            print(
+                "{:>12} {:>12.3f} {:>12.0f}".format(
+                    name, elapsed, args.requests / elapsed
+                )
+            )
+
+        start = time.perf_counter()
+        default_dispatcher().flush()
+        print(
+            "dispatcher drained {:.3f}s after the last response, {} records dropped".format(
+                time.perf_counter() - start, default_dispatcher().dropped
+            )
+        )
+    finally:
+        log.removeHandler(handler_)
+        handler_.close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Compares JsonBodyFilter's streaming redaction with parsing and dumping
+the whole body, on generated bodies from 1 KB to 50 MB, then checks that
+the time of redacting every element of a long array grows linearly with
+the number of elements.
+
+    python benchmarks/bench_json_body.py [--max-size 50000000]
+"""
+import argparse
+import random
+import time
+import timeit
+import tracemalloc
+
+import rapidjson
+
+from nephthys.filters.jsonstream import SchemaAutomaton, redact
+from nephthys.filters.requests import JSON_BODY_FILTERED, filter_json_body
+
+SIZES = [1000, 10000, 100000, 1000000, 10000000, 50000000]
+ITEM_COUNTS = [1000, 5000, 20000, 100000]
+SCHEMA = {"iban": True, "owner": {"fiscal_code": True}, "token": True}
+AUTOMATON = SchemaAutomaton(SCHEMA)
+REPLACEMENT = rapidjson.dumps(JSON_BODY_FILTERED)
+
+
+def make_item(rnd, i):
+    return {
+        "id": i,
+        "iban": "IT60X0542811101000000{:06d}".format(i),
+        "amount": round(rnd.uniform(-1000, 1000), 2),
+        "currency": "EUR",
+        "description": "Payment n. {} to Mario Rossi".format(i),
+        "owner": {
+            "name": "Mario",
+            "surname": "Rossi",
+            "fiscal_code": "RSSMRA80A01H501U",
+        },
+        "tags": ["groceries", "card"],
+        "booked": bool(i % 2),
+    }
+
+
+def make_body(size, seed=0):
+    rnd = random.Random(seed)
+    item_size = len(rapidjson.dumps(make_item(rnd, 0)))
+    items = [make_item(rnd, i) for i in range(max(1, size // item_size))]
+    # Top level keys are redacted, items are copied through
+    return rapidjson.dumps(
+        {"token": "secret", "owner": {"fiscal_code": "x"}, "items": items}
+    )
+
+
+def tree_filter(body):
+    json_body = rapidjson.loads(body)
+    filter_json_body(SCHEMA, json_body)
+    return rapidjson.dumps(json_body)
+
+
+def stream_filter(body):
+    return redact(body, AUTOMATON, REPLACEMENT)
+
+
+def measure(func, body):
+    repeat = max(1, min(200, 2000000 // len(body)))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(body)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def items_scaling():
+    """
+    :return: list of (item count, ms per item) redacting {"items": [...]}
+        with every element's iban redacted
+    """
+    automaton = SchemaAutomaton({"items": {"iban": True}})
+    results = []
+    for count in ITEM_COUNTS:
+        body = rapidjson.dumps(
+            {"items": [{"iban": "IT60", "n": i} for i in range(count)]}
+        )
+        elapsed = min(
+            timeit.repeat(
+                lambda: redact(body, automaton, REPLACEMENT), number=1, repeat=3
+            )
+        )
+        results.append((count, elapsed * 1000 / count))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-size", type=int, default=SIZES[-1])
+    args = parser.parse_args()
+
+    print(
+        "{:>10} {:>12} {:>12} {:>12} {:>12}".format(
+            "size", "tree ms", "stream ms", "tree peak", "stream peak"
+        )
+    )
+    for size in SIZES:
+        if size > args.max_size:
+            break
+
+        body = make_body(size)
+        assert stream_filter(body) == tree_filter(body)
+
+        tree_time, tree_peak = measure(tree_filter, body)
+        stream_time, stream_peak = measure(stream_filter, body)
+        print(
+            "{:>10} {:>12.3f} {:>12.3f} {:>12} {:>12}".format(
+                len(body), tree_time * 1000, stream_time * 1000, tree_peak, stream_peak
+            )
+        )
+
+    print()
+    print("{:>10} {:>12}".format("items", "us per item"))
+    scaling = items_scaling()
+    for count, per_item in scaling:
+        print("{:>10} {:>12.3f}".format(count, per_item * 1000))
+    # Linear: the time per item stays flat, where it would grow with the
+    # count if each element cost a pass over the ones before it
+    if scaling[-1][1] > scaling[0][1] * 4:
+        raise SystemExit("Redacting long arrays is not linear")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+End-to-end load harness: threads send requests to a local HTTP server on
+loopback through a plain requests.Session and through nephthys' Session
+configured with different filters, formatters and handlers, and the
+throughput and latency percentiles of each configuration are compared
+with the plain Session's.
+
+    python benchmarks/bench_load.py [--threads 8] [--requests 500] [--rounds 3]
+        [--response-size 2000] [--only NAME] [--output load.json]
+
+Configurations: logging disabled, JSONFormatter with and without every
+filter, a response body limit, PrettyFormatter, a BatchFileHandler and a
+LogDispatcher, all logging the dicts adapters log.
+
+The server runs in its own process so that it does not compete with the
+clients for the GIL. Configurations are run in turn for every round so
+that drifts of the machine affect all of them alike.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+
+from nephthys.clients import requests as nephthys_requests
+from nephthys.dispatch import LogDispatcher
+from nephthys.filters.message import MessageBlacklist
+from nephthys.filters.requests import HeaderFilter, JsonBodyFilter, QueryStringFilter
+from nephthys.formatters.json import JSONFormatter
+from nephthys.formatters.pretty import PrettyFormatter
+from nephthys.handlers import BatchFileHandler
+
+PERCENTILES = (50, 90, 99, 99.9)
+BODY_SCHEMA = {"token": True, "items": {"iban": True}}
+HEADERS = {
+    "Authorization": "Bearer 0123456789abcdef",
+    "Content-Type": "application/json",
+}
+
+
+def make_body(size):
+    rnd = random.Random(0)
+    items = []
+    while len(json.dumps(items)) < size:
+        items.append(
+            {
+                "id": len(items),
+                "iban": "IT60X05428111010000{:08d}".format(rnd.randrange(10 ** 8)),
+            }
+        )
+    return json.dumps({"token": "secret", "items": items}).encode("utf-8")
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(port_queue, response_size):
+    body = make_body(response_size)
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so that connections are reused as in production
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes, which Nagle's algorithm delays
+        disable_nagle_algorithm = True
+
+        def _respond(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = _respond
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingServer(("127.0.0.1", 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class Configuration:
+    """
+    Way of sending requests: make_session is called once per client thread,
+    setup configures the requests_out logger and returns a cleanup function.
+    """
+
+    def __init__(self, name, make_session, setup=None):
+        self.name = name
+        self.make_session = make_session
+        self.setup = setup
+
+
+def logger_setup(handler_factory, formatter=None, level=logging.INFO):
+    def setup():
+        handler = handler_factory()
+        if formatter is not None:
+            handler.setFormatter(formatter)
+        log = logging.getLogger("requests_out")
+        log.handlers = [handler]
+        log.setLevel(level)
+        log.propagate = False
+
+        def cleanup():
+            log.handlers = []
+            handler.close()
+
+        return cleanup
+
+    return setup
+
+
+def devnull_handler():
+    return logging.StreamHandler(open(os.devnull, "w"))
+
+
+def make_configurations(directory):
+    all_filters = [
+        HeaderFilter(["Authorization", "Set-Cookie"]),
+        QueryStringFilter(["token"]),
+        JsonBodyFilter(BODY_SCHEMA),
+        MessageBlacklist(["secret"], filter_bodies=True),
+    ]
+    dispatcher = LogDispatcher()
+
+    def batch_file_handler():
+        return BatchFileHandler(os.path.join(directory, "load.log"))
+
+    return [
+        Configuration("requests", requests.Session),
+        Configuration(
+            "nephthys.disabled",
+            nephthys_requests.Session,
+            logger_setup(devnull_handler, JSONFormatter(), level=logging.WARNING),
+        ),
+        Configuration(
+            "nephthys.json",
+            nephthys_requests.Session,
+            logger_setup(devnull_handler, JSONFormatter()),
+        ),
+        Configuration(
+            "nephthys.json.filters",
+            lambda: nephthys_requests.Session(log_filters=all_filters),
+            logger_setup(devnull_handler, JSONFormatter()),
+        ),
+        Configuration(
+            "nephthys.json.body_limit",
+            lambda: nephthys_requests.Session(log_response_body_limit=1024),
+            logger_setup(devnull_handler, JSONFormatter()),
+        ),
+        Configuration(
+            "nephthys.pretty",
+            nephthys_requests.Session,
+            logger_setup(devnull_handler, PrettyFormatter()),
+        ),
+        Configuration(
+            "nephthys.batch_file",
+            nephthys_requests.Session,
+            logger_setup(batch_file_handler, JSONFormatter()),
+        ),
+        Configuration(
+            "nephthys.dispatcher",
+            lambda: nephthys_requests.Session(log_dispatcher=dispatcher),
+            logger_setup(devnull_handler, JSONFormatter()),
+        ),
+    ]
+
+
+def drive(configuration, url, threads, per_thread, request_body):
+    """
+    :return: latencies in ns and elapsed seconds
+    """
+    cleanup = configuration.setup() if configuration.setup is not None else None
+    sessions = [configuration.make_session() for _ in range(threads)]
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def run(session, out):
+        # The connection is opened before timing starts
+        session.get(url)
+        barrier.wait()
+        for i in range(per_thread):
+            start = time.perf_counter_ns()
+            if i % 2:
+                session.post(
+                    url + "?page={}&token=secret".format(i),
+                    data=request_body,
+                    headers=HEADERS,
+                )
+            else:
+                session.get(url + "?page={}&token=secret".format(i), headers=HEADERS)
+            out.append(time.perf_counter_ns() - start)
+
+    workers = [
+        threading.Thread(target=run, args=(session, out))
+        for session, out in zip(sessions, latencies)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    # Records still queued on a dispatcher are part of the work done
+    dispatchers = {
+        session._log_dispatcher
+        for session in sessions
+        if getattr(session, "_log_dispatcher", None)
+    }
+    for dispatcher in dispatchers:
+        dispatcher.flush()
+    elapsed = time.perf_counter() - start
+
+    for session in sessions:
+        session.close()
+    if cleanup is not None:
+        cleanup()
+    return [latency for out in latencies for latency in out], elapsed
+
+
+def percentile(ordered, value):
+    index = min(len(ordered) - 1, max(0, int(round(value / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput": len(ordered) / elapsed,
+        "latency_us": {str(p): percentile(ordered, p) / 1000 for p in PERCENTILES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--requests", type=int, default=500, help="requests per thread and round"
+    )
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--response-size", type=int, default=2000)
+    parser.add_argument("--request-size", type=int, default=500)
+    parser.add_argument(
+        "--only", action="append", help="only run configurations whose name contains it"
+    )
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(port_queue, args.response_size), daemon=True
+    )
+    server.start()
+    url = "http://127.0.0.1:{}/users/1".format(port_queue.get(timeout=10))
+
+    directory = tempfile.mkdtemp()
+    configurations = [
+        configuration
+        for configuration in make_configurations(directory)
+        if configuration.name == "requests"
+        or not args.only
+        or any(only in configuration.name for only in args.only)
+    ]
+    request_body = make_body(args.request_size)
+
+    samples = {configuration.name: ([], 0.0) for configuration in configurations}
+    try:
+        for _ in range(args.rounds):
+            for configuration in configurations:
+                latencies, elapsed = drive(
+                    configuration, url, args.threads, args.requests, request_body
+                )
+                previous, total = samples[configuration.name]
+                samples[configuration.name] = (previous + latencies, total + elapsed)
+    finally:
+        server.terminate()
+
+    results = {
+        name: summarize(latencies, elapsed)
+        for name, (latencies, elapsed) in samples.items()
+    }
+    baseline = results["requests"]
+
+    print(
+        "{:<26} {:>10} {:>9}".format("configuration", "req/s", "delta")
+        + "".join(" {:>16}".format("p{} us (delta)".format(p)) for p in PERCENTILES)
+    )
+    for name, result in results.items():
+        throughput_delta = result["throughput"] / baseline["throughput"] - 1
+        line = "{:<26} {:>10.0f} {:>+8.1%}".format(
+            name, result["throughput"], throughput_delta
+        )
+        for p in PERCENTILES:
+            latency = result["latency_us"][str(p)]
+            line += " {:>8.0f} ({:>+5.0f})".format(
+                latency, latency - baseline["latency_us"][str(p)]
+            )
+        print(line)
+
+    if args.output:
+        document = {
+            "python": sys.version.split()[0],
+            "threads": args.threads,
+            "requests_per_thread": args.requests,
+            "rounds": args.rounds,
+            "response_size": args.response_size,
+            "request_size": args.request_size,
+            "results": results,
+        }
+        with open(args.output, "w") as fp:
+            json.dump(document, fp, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures the per record cost of timing a request and of rendering its
+timestamp: datetime.utcnow().timestamp() against time.time() and
+perf_counter_ns(), and logging.Formatter.formatTime against the cached
+ISO-8601 rendering of the formatters.
+
+    python benchmarks/bench_record_timing.py [--records 1000000]
+"""
+import argparse
+import logging
+import time
+from datetime import datetime
+
+from nephthys import RequestLogRecord
+from nephthys.clock import Stopwatch
+from nephthys.formatters.json import JSONFormatter
+
+
+def wall_clock_timing(total):
+    start = time.perf_counter()
+    for _ in range(total):
+        record = RequestLogRecord()
+        record.request_start = datetime.utcnow().timestamp()
+        record.request_end = datetime.utcnow().timestamp()
+    return time.perf_counter() - start
+
+
+def monotonic_timing(total):
+    start = time.perf_counter()
+    for _ in range(total):
+        record = RequestLogRecord()
+        stopwatch = Stopwatch().stop()
+        record.set_request_timing(stopwatch.start, stopwatch.end, stopwatch.duration_ns)
+    return time.perf_counter() - start
+
+
+def format_time(formatter, total):
+    record = logging.LogRecord("bench", logging.INFO, __file__, 1, "message", [], None)
+    created = record.created
+
+    start = time.perf_counter()
+    for i in range(total):
+        # Records logged at 1000 per second
+        record.created = created + i / 1000
+        record.msecs = i % 1000
+        formatter.formatTime(record)
+    return time.perf_counter() - start
+
+
+def report(name, elapsed, total, baseline=None):
+    line = "{:<28} {:>8.0f} ns/record".format(name, elapsed / total * 10 ** 9)
+    if baseline is not None:
+        line += "  x{:.2f}".format(baseline / elapsed)
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1000000)
+    args = parser.parse_args()
+    total = args.records
+
+    baseline = wall_clock_timing(total)
+    report("utcnow().timestamp()", baseline, total)
+    report("time() + perf_counter_ns()", monotonic_timing(total), total, baseline)
+
+    baseline = format_time(JSONFormatter(fmt="%(asctime)s"), total)
+    report("formatTime (strftime)", baseline, total)
+    iso_formatter = JSONFormatter(fmt="%(asctime)s", iso_time=True)
+    report("formatTime (iso_time)", format_time(iso_formatter, total), total, baseline)
+
+
+if __name__ == "__main__":
+    main()
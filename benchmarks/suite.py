@@ -0,0 +1,457 @@
+"""
+Benchmark suite of the per record costs of nephthys: FilterLoggerAdapter
+processing, every request and message filter, the formatters and the
+requests client logging a request, on generated workloads.
+Results are written as JSON so that two runs can be compared.
+
+    python benchmarks/suite.py run [--output results.json] [--only NAME]
+    python benchmarks/suite.py compare baseline.json results.json
+
+Each benchmark reports the best ns/record over its repeats, the peak
+memory allocated while handling a record and the memory blocks it leaves
+allocated, both measured with tracemalloc on separate runs.
+"""
+import argparse
+import datetime
+import json
+import logging
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from nephthys import FilterLoggerAdapter, Log, RequestLogRecord
+from nephthys.clients.requests import Session
+from nephthys.filters.message import MessageBlacklist
+from nephthys.filters.requests import (
+    BodyTypeFilter,
+    HeaderFilter,
+    JsonBodyFilter,
+    QueryStringFilter,
+)
+from nephthys.formatters.backends import available_backends
+from nephthys.formatters.json import JSONFormatter
+from nephthys.formatters.pretty import PrettyFormatter
+
+FMT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+URL = "https://api.ovalmoney.com/users/1234/transactions?page=2&limit=50&token=secret&sort=date"
+BODY_SCHEMA = {"token": True, "items": {"iban": True, "owner": {"fiscal_code": True}}}
+FILTERED_HEADERS = ["Authorization", "Cookie", "X-Api-Key"]
+
+
+def make_item(rnd, i):
+    return {
+        "id": i,
+        "iban": "IT60X0542811101000000{:06d}".format(i),
+        "amount": round(rnd.uniform(-1000, 1000), 2),
+        "currency": "EUR",
+        "description": "Payment n. {} to Mario Rossi".format(i),
+        "owner": {
+            "name": "Mario",
+            "surname": "Rossi",
+            "fiscal_code": "RSSMRA80A01H501U",
+        },
+        "booked": bool(i % 2),
+    }
+
+
+def make_body(items, seed=0):
+    rnd = random.Random(seed)
+    return json.dumps(
+        {"token": "secret", "items": [make_item(rnd, i) for i in range(items)]}
+    )
+
+
+class Workload:
+    """
+    Request and response captured by a client, from which every benchmark
+    builds fresh records.
+    """
+
+    def __init__(self, name, request_body, response_body, extra_headers=0):
+        self.name = name
+        self.request_headers = {
+            "Accept": "application/json",
+            "Authorization": "Bearer 0123456789abcdef",
+            "Content-Type": "application/json",
+            "User-Agent": "python-requests/2.25.1",
+        }
+        self.response_headers = {
+            "Content-Type": "application/json",
+            "Server": "nginx",
+            "Set-Cookie": "id=1",
+        }
+        for i in range(extra_headers):
+            self.request_headers["X-Header-{}".format(i)] = "value-{}".format(i)
+            self.response_headers["X-Header-{}".format(i)] = "value-{}".format(i)
+        self.request_body = request_body
+        self.response_body = response_body
+
+    def make_record(self):
+        rec = RequestLogRecord(message="request to api.ovalmoney.com")
+        rec.set_request_timing(1548936000.123, 1548936000.223, 100000000)
+        rec.method = "POST"
+        rec.url = URL
+        rec.route = "/users/{id}/transactions"
+        rec.add_route_match("id", "1234")
+        for name, value in self.request_headers.items():
+            rec.add_request_header(name, value)
+        for key, value in (
+            ("page", "2"),
+            ("limit", "50"),
+            ("token", "secret"),
+            ("sort", "date"),
+        ):
+            rec.add_request_querystring(key, value)
+        rec.request_body = self.request_body
+        rec.request_body_size = len(self.request_body)
+        rec.status_code = 200
+        for name, value in self.response_headers.items():
+            rec.add_response_header(name, value)
+        rec.response_body = self.response_body
+        rec.response_body_size = len(self.response_body)
+        return rec
+
+    def make_request(self):
+        return requests.Request(
+            "POST", URL, headers=self.request_headers, data=self.request_body
+        ).prepare()
+
+    def make_response(self):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict(self.response_headers)
+        response.encoding = "utf-8"
+        response._content = self.response_body.encode("utf-8")
+        return response
+
+
+def make_workloads():
+    small = make_body(2)
+    large = make_body(2000)
+    return [
+        Workload("small", small, small),
+        Workload("large_body", small, large),
+        Workload("many_headers", small, small, extra_headers=100),
+    ]
+
+
+def make_blacklist(size):
+    rnd = random.Random(1)
+    words = ["{:x}".format(rnd.getrandbits(48)) for _ in range(size)]
+    # A few of them show up in the bodies
+    return words + ["Mario Rossi", "RSSMRA80A01H501U"]
+
+
+def null_logger(name, formatter=None):
+    """
+    Logger formatting records like a handler writing them would, without
+    writing them.
+    """
+
+    class FormattingHandler(logging.Handler):
+        def emit(self, record):
+            self.format(record)
+
+    handler = FormattingHandler()
+    if formatter is not None:
+        handler.setFormatter(formatter)
+
+    log = logging.getLogger(name)
+    log.handlers = [handler]
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    return log
+
+
+class Benchmark:
+    """
+    Benchmark calling func once per record, with a fresh argument made by
+    make_argument for each call.
+    """
+
+    def __init__(self, name, func, make_argument):
+        self.name = name
+        self.func = func
+        self.make_argument = make_argument
+
+    def run(self, iterations, repeat, alloc_iterations):
+        best = None
+        for _ in range(repeat):
+            arguments = [self.make_argument() for _ in range(iterations)]
+            func = self.func
+            start = time.perf_counter()
+            for argument in arguments:
+                func(argument)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        peak, blocks = self._allocations(alloc_iterations)
+        return {
+            "ns_per_record": best / iterations * 10 ** 9,
+            "peak_bytes_per_record": peak,
+            "blocks_per_record": blocks / alloc_iterations,
+            "iterations": iterations,
+            "repeat": repeat,
+        }
+
+    def _allocations(self, iterations):
+        arguments = [self.make_argument() for _ in range(iterations)]
+        func = self.func
+        # Warm up caches, so that they are not counted as allocations
+        func(self.make_argument())
+
+        tracemalloc.start()
+        try:
+            peak = 0
+            start_blocks = sys.getallocatedblocks()
+            for argument in arguments:
+                before = tracemalloc.get_traced_memory()[0]
+                reset_peak = getattr(tracemalloc, "reset_peak", None)
+                if reset_peak is not None:
+                    reset_peak()
+                else:
+                    tracemalloc.clear_traces()
+                    before = 0
+                func(argument)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+            blocks = sys.getallocatedblocks() - start_blocks
+        finally:
+            tracemalloc.stop()
+        # Blocks of the arguments themselves are freed with them
+        del arguments
+        return peak, max(blocks, 0)
+
+
+def adapter_benchmarks(workload):
+    plain = FilterLoggerAdapter(null_logger("bench.adapter"))
+    filtered = FilterLoggerAdapter(
+        null_logger("bench.adapter"),
+        filters=[
+            BodyTypeFilter(),
+            HeaderFilter(FILTERED_HEADERS),
+            QueryStringFilter(["token"]),
+            JsonBodyFilter(BODY_SCHEMA),
+            MessageBlacklist(make_blacklist(20), filter_bodies=True),
+        ],
+    )
+
+    def make_log():
+        return Log(workload.make_record())
+
+    return [
+        Benchmark(
+            "adapter.process.no_filters", lambda msg: plain.process(msg, {}), make_log
+        ),
+        Benchmark(
+            "adapter.process.all_filters",
+            lambda msg: filtered.process(msg, {}),
+            make_log,
+        ),
+    ]
+
+
+def filter_benchmarks(workload):
+    filters = [
+        ("filter.header", HeaderFilter(FILTERED_HEADERS)),
+        ("filter.query_string", QueryStringFilter(["token", "key"])),
+        ("filter.body_type", BodyTypeFilter()),
+        ("filter.body_type.not_loggable", BodyTypeFilter(allowed_types=["text/plain"])),
+        ("filter.json_body", JsonBodyFilter(BODY_SCHEMA)),
+        ("filter.json_body.no_match", JsonBodyFilter({"password": True})),
+        ("filter.message_blacklist", MessageBlacklist(make_blacklist(20))),
+        (
+            "filter.message_blacklist.bodies",
+            MessageBlacklist(make_blacklist(20), filter_bodies=True),
+        ),
+        (
+            "filter.message_blacklist.bodies_long",
+            MessageBlacklist(make_blacklist(1000), filter_bodies=True),
+        ),
+    ]
+
+    def make_record():
+        record = workload.make_record()
+        record.materialize()
+        return record
+
+    return [Benchmark(name, f.filter, make_record) for name, f in filters]
+
+
+def formatter_benchmarks(workload):
+    formatters = [
+        (
+            "formatter.json.{}".format(backend),
+            JSONFormatter(fmt=FMT, json_backend=backend),
+        )
+        for backend in available_backends()
+    ]
+    formatters.append(("formatter.pretty", PrettyFormatter(fmt=FMT)))
+
+    def make_dict_log():
+        # As logged by FilterLoggerAdapter
+        return logging.LogRecord(
+            "bench",
+            logging.INFO,
+            __file__,
+            1,
+            workload.make_record().asdict(),
+            [],
+            None,
+        )
+
+    return [Benchmark(name, f.format, make_dict_log) for name, f in formatters]
+
+
+def client_benchmarks(workload):
+    request = workload.make_request()
+    response = workload.make_response()
+
+    def send_log_record(formatter):
+        session = Session(log_tag="bench", log_filters=[HeaderFilter(FILTERED_HEADERS)])
+        session._logger.logger = null_logger("bench.requests_out", formatter)
+
+        def send(_):
+            session._send_log_record(
+                1548936000.123,
+                1548936000.223,
+                request=request,
+                response=response,
+                duration_ns=100000000,
+            )
+
+        return send
+
+    return [
+        Benchmark("client.send_log_record", send_log_record(None), lambda: None),
+        Benchmark(
+            "client.send_log_record.json",
+            send_log_record(JSONFormatter(fmt=FMT)),
+            lambda: None,
+        ),
+    ]
+
+
+GROUPS = [
+    adapter_benchmarks,
+    filter_benchmarks,
+    formatter_benchmarks,
+    client_benchmarks,
+]
+
+
+def run(args):
+    results = {}
+    for workload in make_workloads():
+        for group in GROUPS:
+            for benchmark in group(workload):
+                name = "{}[{}]".format(benchmark.name, workload.name)
+                if args.only and not any(only in name for only in args.only):
+                    continue
+                # Large bodies take milliseconds per record
+                iterations = (
+                    args.iterations
+                    if workload.name != "large_body"
+                    else max(1, args.iterations // 20)
+                )
+                result = benchmark.run(
+                    iterations, args.repeat, min(iterations, args.alloc_iterations)
+                )
+                results[name] = result
+                print(
+                    "{:<60} {:>12.0f} ns/record {:>10.0f} peak B {:>8.1f} blocks".format(
+                        name,
+                        result["ns_per_record"],
+                        result["peak_bytes_per_record"],
+                        result["blocks_per_record"],
+                    )
+                )
+
+    document = {
+        "created": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "backends": available_backends(),
+        "results": results,
+    }
+    with open(args.output, "w") as fp:
+        json.dump(document, fp, indent=2, sort_keys=True)
+    print("Results written to {}".format(args.output))
+
+
+def compare(args):
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.results) as fp:
+        results = json.load(fp)
+
+    print(
+        "{:<60} {:>12} {:>12} {:>8} {:>12}".format(
+            "benchmark", "baseline ns", "ns", "ratio", "peak B delta"
+        )
+    )
+    regressions = 0
+    for name, result in sorted(results["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            print("{:<60} {:>12} {:>12.0f}".format(name, "-", result["ns_per_record"]))
+            continue
+
+        ratio = result["ns_per_record"] / base["ns_per_record"]
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  slower"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "  faster"
+        print(
+            "{:<60} {:>12.0f} {:>12.0f} {:>8.2f} {:>+12.0f}{}".format(
+                name,
+                base["ns_per_record"],
+                result["ns_per_record"],
+                ratio,
+                result["peak_bytes_per_record"] - base["peak_bytes_per_record"],
+                flag,
+            )
+        )
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--iterations", type=int, default=2000)
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--alloc-iterations", type=int, default=200)
+    run_parser.add_argument(
+        "--only", action="append", help="only run benchmarks whose name contains it"
+    )
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="ratio flagged as a change"
+    )
+    compare_parser.add_argument("--fail-on-regression", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,11 @@
-import itertools
 from logging import LoggerAdapter
-from webob.multidict import MultiDict
 from urllib.parse import urlparse
 
+from .filters.filter import IFilter
+from .instrumentation import TimedStage
+from .multidict import HeaderDict, MultiDict
+from .periodic import PeriodicFlusher
+
 
 class BaseLoggerAdapter(LoggerAdapter):
     def __init__(self, logger, extra_tags=None, *args, **kwargs):
@@ -17,6 +20,7 @@ class BaseLoggerAdapter(LoggerAdapter):
 
         if isinstance(msg, Log):
             log_rec = msg.log_record
+            log_rec.materialize()
             log_rec.add_tags(self._extra_tags)
 
         return msg
@@ -26,10 +30,13 @@ class BaseLoggerAdapter(LoggerAdapter):
         proc_msg = self._process(msg)
 
         if isinstance(proc_msg, Log):
-            return proc_msg.log_record.asdict(), kwargs
+            return self._message(proc_msg.log_record), kwargs
 
         return proc_msg, kwargs
 
+    def _message(self, log_rec):
+        return log_rec.asdict()
+
 
 def apply_filters(log_record, filters):
     for f in filters:
@@ -39,44 +46,400 @@ def apply_filters(log_record, filters):
             f(log_record)
 
 
+_HEADER_ATTRS = ("_req_headers", "_res_headers")
+_BODY_ATTRS = ("_req_body", "_res_body")
+_TRUNCATED_ATTRS = ("_req_body_truncated", "_res_body_truncated")
+_CONTENT_TYPE = "content-type"
+
+
+class FilterContext:
+    """
+    Per-record state shared by the stages of a FilterPipeline.
+    """
+
+    __slots__ = ("_log_record", "_content_types", "replaced")
+
+    def __init__(self, log_record):
+        self._log_record = log_record
+        self._content_types = [None, None]
+        self.replaced = [False, False]
+
+    def content_type(self, direction):
+        content_type = self._content_types[direction]
+        if content_type is None:
+            headers = getattr(self._log_record, _HEADER_ATTRS[direction])
+            content_type = (
+                "" if headers is None else ",".join(headers.getall("Content-Type"))
+            )
+            self._content_types[direction] = content_type
+
+        return content_type
+
+    def headers_changed(self, direction):
+        self._content_types[direction] = None
+
+
+class _ReplaceStage:
+    def __init__(self, attrs, replacement):
+        self.keys = [set() for _ in attrs]
+        self.replacement = replacement
+        self._attrs = attrs
+
+    def __call__(self, log_record, context):
+        for direction, keys in enumerate(self.keys):
+            container = getattr(log_record, self._attrs[direction])
+            if (
+                keys
+                and container is not None
+                and container.replace_all(keys, self.replacement)
+            ):
+                if self._attrs is _HEADER_ATTRS and _CONTENT_TYPE in keys:
+                    context.headers_changed(direction)
+
+
+class _BodyStage:
+    def __init__(self, func, directions, content_type, replaces, truncated):
+        self._func = func
+        self._directions = directions
+        self._content_type = content_type
+        self._replaces = replaces
+        self._truncated = truncated
+
+    def __call__(self, log_record, context):
+        for direction in self._directions:
+            if context.replaced[direction]:
+                continue
+
+            attr = _BODY_ATTRS[direction]
+            body = getattr(log_record, attr)
+            if not body:
+                continue
+
+            content_type = context.content_type(direction)
+            if (
+                self._content_type is not None
+                and self._content_type not in content_type
+            ):
+                continue
+
+            if self._truncated:
+                new_body = self._func(
+                    body, content_type, getattr(log_record, _TRUNCATED_ATTRS[direction])
+                )
+            else:
+                new_body = self._func(body, content_type)
+            if new_body is not body:
+                setattr(log_record, attr, new_body)
+                context.replaced[direction] = self._replaces
+
+
+def _compiles(f):
+    """
+    :return: whether f is added through its compile method, which is only
+        the case for an IFilter whose filter method is the one compile
+        stands for: a subclass overriding filter alone is called as is
+    """
+    if not isinstance(f, IFilter):
+        return False
+
+    cls = type(f)
+
+    owner = next((klass for klass in cls.__mro__ if "compile" in vars(klass)), cls)
+    return getattr(cls, "filter", None) is getattr(owner, "filter", None)
+
+
+class FilterPipeline:
+    """
+    Compiles a list of filters once into a list of stages.
+    IFilter instances register fused stages through compile(pipeline) and
+    the add_* methods, unless a subclass overrides filter without compile,
+    anything else is called as is.
+    """
+
+    def __init__(self, filters=None, instrumentation=None, prefix="filter"):
+        """
+        :param instrumentation: Times each stage under the name of the
+            filters it comes from, prefix.<index>.<filter class>
+        :type instrumentation: nephthys.instrumentation.Instrumentation
+        """
+        self._stages = []
+        self._record_stages = []
+        self._header_stage = None
+        self._query_stage = None
+        self._body_since_headers = False
+
+        self._instrumentation = instrumentation
+        self._prefix = prefix
+        self._filter_name = None
+        self._filter_count = 0
+        self._timed_stages = {}
+
+        for f in filters or []:
+            self.add_filter(f)
+
+    def add_filter(self, f):
+        if self._instrumentation is not None:
+            name = getattr(f, "__qualname__", None) or type(f).__name__
+            self._filter_name = "{}.{}.{}".format(
+                self._prefix, self._filter_count, name
+            )
+            self._filter_count += 1
+
+        if _compiles(f):
+            f.compile(self)
+        elif hasattr(f, "filter"):
+            self.add_stage(f.filter)
+        else:
+            self.add_stage(f)
+
+        self._filter_name = None
+
+    def add_stage(self, func, request_only=False, barrier=True):
+        """
+        Appends func(log_record) to the pipeline.
+        :param request_only: Only run func on RequestLogRecords
+        :param barrier: Whether func may read headers or query string, in which
+            case later header and query filters are not merged before it
+        """
+
+        def stage(log_record, context):
+            func(log_record)
+
+        self._append(stage, request_only)
+
+        if barrier:
+            self._header_stage = None
+            self._query_stage = None
+
+    def add_header_filter(self, names, replacement, request=True, response=True):
+        """
+        Merges header names whose values are replaced by replacement into the
+        current header stage.
+        """
+        names = {name.lower() for name in names}
+
+        stage = self._header_stage
+        if (
+            stage is None
+            or stage.replacement != replacement
+            # Body stages read Content-Type, it can't be filtered before them
+            or (self._body_since_headers and _CONTENT_TYPE in names)
+        ):
+            stage = self._header_stage = _ReplaceStage(_HEADER_ATTRS, replacement)
+            self._body_since_headers = False
+            self._append(stage, True)
+        else:
+            self._merged(stage)
+
+        if request:
+            stage.keys[0].update(names)
+        if response:
+            stage.keys[1].update(names)
+
+    def add_query_filter(self, keys, replacement):
+        stage = self._query_stage
+        if stage is None or stage.replacement != replacement:
+            stage = self._query_stage = _ReplaceStage(("_req_query",), replacement)
+            self._append(stage, True)
+        else:
+            self._merged(stage)
+
+        stage.keys[0].update(keys)
+
+    def add_body_filter(
+        self,
+        func,
+        request=True,
+        response=True,
+        content_type=None,
+        replaces=False,
+        truncated=False,
+    ):
+        """
+        Appends a stage calling func(body, content_type) for each non empty body.
+        Bodies already replaced by an earlier stage with replaces=True are skipped.
+        :param content_type: Only call func if the Content-Type contains it
+        :param replaces: Whether a changed body is a placeholder, not a body anymore
+        :param truncated: Also pass whether the body was truncated when captured,
+            func(body, content_type, truncated)
+        """
+        directions = [d for d, enabled in enumerate((request, response)) if enabled]
+        self._append(
+            _BodyStage(func, directions, content_type, replaces, truncated), True
+        )
+        self._body_since_headers = True
+
+    def _append(self, stage, request_only):
+        if self._instrumentation is not None:
+            name = self._filter_name or "{}.stage.{}".format(
+                self._prefix, len(self._stages)
+            )
+            timed_stage = self._timed_stages[stage] = TimedStage(
+                stage, self._instrumentation, name
+            )
+            stage = timed_stage
+
+        self._stages.append(stage)
+        if not request_only:
+            self._record_stages.append(stage)
+
+    def _merged(self, stage):
+        # The stage now also runs the current filter
+        timed_stage = self._timed_stages.get(stage)
+        if timed_stage is not None and self._filter_name is not None:
+            timed_stage.add_name(self._filter_name)
+
+    def __call__(self, log_record, context=None):
+        if context is None:
+            context = FilterContext(log_record)
+
+        if isinstance(log_record, RequestLogRecord):
+            stages = self._stages
+        else:
+            stages = self._record_stages
+
+        for stage in stages:
+            stage(log_record, context)
+
+        return context
+
+
 class FilterLoggerAdapter(BaseLoggerAdapter):
-    def __init__(self, logger, filters=None, *args, **kwargs):
+    def __init__(
+        self,
+        logger,
+        filters=None,
+        sampler=None,
+        dedupe=None,
+        instrumentation=None,
+        *args,
+        **kwargs
+    ):
+        """
+        :param sampler: Sampler deciding which RequestLogRecords are logged,
+            before they are filtered and formatted
+        :type sampler: nephthys.sampling.Sampler
+        :param dedupe: Suppresses repeated logs once filtered, records logged
+            with exception info are never suppressed. Summaries of windows
+            are logged once they expire, pending ones when the interpreter
+            exits
+        :type dedupe: nephthys.dedupe.Deduplicator
+        :param instrumentation: Times the filters and the processing phases
+            of the records logged, and logs its stats periodically
+        :type instrumentation: nephthys.instrumentation.Instrumentation
+        """
         super().__init__(logger=logger, *args, **kwargs)
 
         self._filters = filters or []
+        self._pipeline = FilterPipeline(self._filters, instrumentation)
+        self._sampler = sampler
+        self._dedupe = dedupe
+        self._dedupe_flusher = None
+        if dedupe is not None:
+            self._dedupe_flusher = PeriodicFlusher(
+                self._log_expired,
+                dedupe.sweep_interval,
+                "nephthys-dedupe",
+                on_exit=self.flush_repeated,
+            )
+
+        self._instrumentation = instrumentation
+        if instrumentation is not None:
+            self._run_pipeline = instrumentation.wrap("phase.filters", self._pipeline)
+            self._timed_message = instrumentation.wrap("phase.asdict", super()._message)
+            self._timed_log = instrumentation.wrap("phase.log", self._log)
 
     def _process(self, msg):
         msg = super()._process(msg)
 
         if isinstance(msg, Log):
             log_rec = msg.log_record
-            filters = self._filters
-
-            if isinstance(msg, FilterableLog):
-                filters = itertools.chain(filters, msg.filters)
+            instrumentation = self._instrumentation
+            if instrumentation is None:
+                context = self._pipeline(log_rec)
+            else:
+                context = self._run_pipeline(log_rec)
 
-            apply_filters(log_rec, filters)
+            if isinstance(msg, FilterableLog) and msg.filters:
+                FilterPipeline(msg.filters, instrumentation, "log_filter")(
+                    log_rec, context
+                )
 
         return msg
 
+    def _message(self, log_rec):
+        if self._instrumentation is None:
+            return super()._message(log_rec)
+        return self._timed_message(log_rec)
+
     def log(self, level, msg, *args, **kwargs):
+        instrumentation = self._instrumentation
+        if instrumentation is None or not self.isEnabledFor(level):
+            self._log(level, msg, *args, **kwargs)
+            return
+
+        self._timed_log(level, msg, *args, **kwargs)
+        if instrumentation.due():
+            self.logger.log(instrumentation.level, instrumentation.summary())
+
+    def _log(self, level, msg, *args, **kwargs):
         if isinstance(msg, FilterableLog) and msg.drop:
             return
 
-        super().log(level, msg, *args, **kwargs)
+        if (
+            self._sampler is not None
+            and isinstance(msg, Log)
+            and isinstance(msg.log_record, RequestLogRecord)
+            and not self._sampler.keep(msg.log_record, level)
+        ):
+            return
+
+        if self._dedupe is None:
+            super().log(level, msg, *args, **kwargs)
+            return
+
+        if not self.isEnabledFor(level):
+            return
+
+        msg, kwargs = self.process(msg, kwargs)
+        if not isinstance(msg, dict) or kwargs.get("exc_info"):
+            self.logger.log(level, msg, *args, **kwargs)
+            return
+
+        self._dedupe_flusher.start()
+        emit, summaries = self._dedupe.add(msg, level)
+        for summary_level, summary in summaries:
+            self.logger.log(summary_level, summary)
+
+        if emit:
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def _log_expired(self):
+        for level, summary in self._dedupe.expire():
+            self.logger.log(level, summary)
+
+    def flush_repeated(self):
+        """
+        Logs the summaries of every pending dedupe window.
+        """
+        if self._dedupe is not None:
+            for level, summary in self._dedupe.flush():
+                self.logger.log(level, summary)
 
 
 def join_multidict(multi_dict):
-    list_dict = multi_dict.dict_of_lists()
-    return {key: ",".join(value) for key, value in list_dict.items()}
+    if multi_dict is None:
+        return {}
+
+    return multi_dict.joined()
 
 
 def add_to_multidict(multi_dict, name, value):
     if isinstance(value, list):
         for val in value:
-            multi_dict.add(name, str(val))
+            multi_dict.add(name, val)
     else:
-        multi_dict.add(name, str(value))
+        multi_dict.add(name, value)
 
 
 class Log:
@@ -105,7 +468,35 @@ class FilterableLog(Log):
             self._filters.append(record_filters)
 
 
+class RecordPool:
+    """
+    Free-list of LogRecord instances.
+    Only release records that nothing else references anymore, e.g. once
+    they have been logged.
+    """
+
+    def __init__(self, record_class, max_size=256):
+        self._record_class = record_class
+        self._max_size = max_size
+        self._free = []
+
+    def acquire(self, *args, **kwargs):
+        try:
+            record = self._free.pop()
+        except IndexError:
+            return self._record_class(*args, **kwargs)
+
+        record.__init__(*args, **kwargs)
+        return record
+
+    def release(self, record):
+        if len(self._free) < self._max_size:
+            self._free.append(record)
+
+
 class LogRecord:
+    __slots__ = ("_extra_tags", "_message")
+
     def __init__(self, message="", extra_tags=None, *args, **kwargs):
         self._extra_tags = extra_tags or []
         self._message = message
@@ -115,6 +506,12 @@ class LogRecord:
 
         return msg_dict
 
+    def materialize(self):
+        """
+        Fills the record with any data whose capture was deferred.
+        """
+        pass
+
     def add_tags(self, tags):
         if isinstance(tags, list):
             self._extra_tags.extend(tags)
@@ -123,6 +520,32 @@ class LogRecord:
 
 
 class RequestLogRecord(LogRecord):
+    __slots__ = (
+        "_req_start",
+        "_req_end",
+        "_req_time",
+        "_method",
+        "_url",
+        "_path",
+        "_host",
+        "_route",
+        "_status_code",
+        "_user",
+        "_user_uuid",
+        "_req_query",
+        "_req_headers",
+        "_req_body",
+        "_req_body_size",
+        "_req_body_truncated",
+        "_res_headers",
+        "_res_body",
+        "_res_body_size",
+        "_res_body_truncated",
+        "_route_match",
+        "_timings",
+        "_deferred",
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -137,14 +560,36 @@ class RequestLogRecord(LogRecord):
         self._status_code = None
         self._user = None
         self._user_uuid = None
-        self._req_query = MultiDict()
-        self._req_headers = MultiDict()
+        # Header and query containers are only allocated when first used
+        self._req_query = None
+        self._req_headers = None
         self._req_body = None
-        self._res_headers = MultiDict()
+        self._req_body_size = None
+        self._req_body_truncated = False
+        self._res_headers = None
         self._res_body = None
-        self._route_match = {}
+        self._res_body_size = None
+        self._res_body_truncated = False
+        self._route_match = None
+        self._timings = None
+        self._deferred = None
+
+    def defer(self, decorator, source):
+        """
+        Postpones decorator(self, source) until the record is materialized,
+        so that nothing is extracted from source if the record is never logged.
+        """
+        if self._deferred is None:
+            self._deferred = []
+        self._deferred.append((decorator, source))
+
+    def materialize(self):
+        deferred, self._deferred = self._deferred, None
+        for decorator, source in deferred or ():
+            decorator(self, source)
 
     def asdict(self):
+        self.materialize()
         base_dict = super().asdict()
 
         req_dict = {
@@ -159,34 +604,61 @@ class RequestLogRecord(LogRecord):
                 "host": self._host,
                 "path": self._path,
                 "route": self._route,
-                "route_match": self._route_match,
+                "route_match": self._route_match or {},
+                "timings": self._timings or {},
                 "user": self._user,
                 "user_uuid": self._user_uuid,
                 "body": self._req_body,
+                "body_size": self._req_body_size,
+                "body_truncated": self._req_body_truncated,
             },
             "response": {
                 "status_code": self._status_code,
                 "header": join_multidict(self._res_headers),
                 "body": self._res_body,
+                "body_size": self._res_body_size,
+                "body_truncated": self._res_body_truncated,
             },
         }
 
         return {**base_dict, **req_dict}
 
     def add_request_querystring(self, name, value):
+        if self._req_query is None:
+            self._req_query = MultiDict()
         add_to_multidict(self._req_query, name, value)
 
     def add_request_header(self, name, value):
-        name = name.title()
+        if self._req_headers is None:
+            self._req_headers = HeaderDict()
         add_to_multidict(self._req_headers, name, value)
 
     def add_response_header(self, name, value):
-        name = name.title()
+        if self._res_headers is None:
+            self._res_headers = HeaderDict()
         add_to_multidict(self._res_headers, name, value)
 
     def add_route_match(self, name, value):
+        if self._route_match is None:
+            self._route_match = {}
         self._route_match[name] = value
 
+    def add_timing(self, name, value):
+        if self._timings is None:
+            self._timings = {}
+        self._timings[name] = value
+
+    def set_request_timing(self, start, end, duration_ns):
+        """
+        :param start: Wall clock start, in seconds since the epoch
+        :param end: Wall clock end, in seconds since the epoch
+        :param duration_ns: Duration measured with a monotonic clock, which
+            the request time is computed from instead of end - start
+        """
+        self._req_start = start
+        self._req_end = end
+        self._req_time = duration_ns / 10 ** 6
+
     def _set_request_start(self, value):
         self._req_start = value
 
@@ -205,6 +677,18 @@ class RequestLogRecord(LogRecord):
     def _set_response_body(self, body):
         self._res_body = body
 
+    def _set_request_body_size(self, size):
+        self._req_body_size = size
+
+    def _set_request_body_truncated(self, truncated):
+        self._req_body_truncated = truncated
+
+    def _set_response_body_size(self, size):
+        self._res_body_size = size
+
+    def _set_response_body_truncated(self, truncated):
+        self._res_body_truncated = truncated
+
     def _set_method(self, value):
         self._method = value.upper()
 
@@ -235,6 +719,10 @@ class RequestLogRecord(LogRecord):
     request_end = property(None, _set_request_end)
     request_body = property(None, _set_request_body)
     response_body = property(None, _set_response_body)
+    request_body_size = property(None, _set_request_body_size)
+    request_body_truncated = property(None, _set_request_body_truncated)
+    response_body_size = property(None, _set_response_body_size)
+    response_body_truncated = property(None, _set_response_body_truncated)
     method = property(None, _set_method)
     url = property(None, _set_url)
     route = property(None, _set_route)
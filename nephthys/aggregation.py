@@ -0,0 +1,367 @@
+import logging
+import time
+from array import array
+
+from nephthys import RequestLogRecord
+from nephthys.periodic import PeriodicFlusher
+
+DEFAULT_KEY_FIELDS = ("route", "host", "method")
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of integer values: every power of two range is split
+    in the same number of linear sub-buckets, so the relative error is
+    bounded (below 1% with 7 sub-bucket bits) and the memory is fixed by
+    max_value. Histograms with the same layout can be merged.
+    """
+
+    def __init__(self, max_value=3600 * 10 ** 6, sub_bucket_bits=7):
+        """
+        :param max_value: Highest value tracked exactly, higher values are
+            counted in the last bucket. Defaults to an hour in microseconds
+        :type max_value: int
+        :param sub_bucket_bits: log2 of the number of sub-buckets
+        :type sub_bucket_bits: int
+        """
+        self.max_value = max_value
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self._counts = array("q", bytes(8 * (self._index(max_value) + 1)))
+
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        return (shift + 1) * self._half + (value >> shift) - self._half
+
+    def _highest(self, index):
+        """
+        :return: the highest value counted in the bucket at index
+        """
+        if index < 2 * self._half:
+            return index
+        shift = index // self._half - 1
+        sub_bucket = index % self._half + self._half
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+
+        self._counts[min(self._index(value), len(self._counts) - 1)] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        :return: the value below which percent of the recorded values are,
+            None if the histogram is empty
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, -(-self.count * percent // 100))
+        last = len(self._counts) - 1
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                # The last bucket also counts values above max_value
+                return (
+                    self.max if index == last else min(self._highest(index), self.max)
+                )
+
+        return self.max
+
+    def _check_layout(self, max_value, sub_bucket_bits):
+        if (max_value, sub_bucket_bits) != (self.max_value, self.sub_bucket_bits):
+            raise ValueError("Histograms have different layouts")
+
+    def merge(self, other):
+        self._check_layout(other.max_value, other.sub_bucket_bits)
+
+        counts = self._counts
+        for index, count in enumerate(other._counts):
+            if count:
+                counts[index] += count
+
+        self._merge_stats(other.count, other.total, other.min, other.max)
+
+    def _merge_stats(self, count, total, min_value, max_value):
+        self.count += count
+        self.total += total
+        if min_value is not None and (self.min is None or min_value < self.min):
+            self.min = min_value
+        if max_value is not None and (self.max is None or max_value > self.max):
+            self.max = max_value
+
+    def snapshot(self):
+        """
+        :return: JSON serializable state of the histogram, only non empty
+            buckets are listed
+        """
+        return {
+            "max_value": self.max_value,
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "counts": [
+                [index, count] for index, count in enumerate(self._counts) if count
+            ],
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    def merge_snapshot(self, snapshot):
+        self._check_layout(snapshot["max_value"], snapshot["sub_bucket_bits"])
+
+        counts = self._counts
+        for index, count in snapshot["counts"]:
+            counts[index] += count
+
+        self._merge_stats(
+            snapshot["count"], snapshot["total"], snapshot["min"], snapshot["max"]
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        histogram = cls(snapshot["max_value"], snapshot["sub_bucket_bits"])
+        histogram.merge_snapshot(snapshot)
+        return histogram
+
+
+class _KeyStats:
+    __slots__ = ("histogram", "errors")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.errors = 0
+
+
+class LatencyAggregator:
+    """
+    Aggregates request times by key into LatencyHistograms, and turns them
+    into one summary per key and interval.
+    """
+
+    def __init__(
+        self,
+        key_fields=DEFAULT_KEY_FIELDS,
+        error_status=500,
+        histogram_factory=LatencyHistogram,
+    ):
+        """
+        :param key_fields: Fields summaries are grouped by, among route, host,
+            method and status_code
+        :type key_fields: tuple
+        :param error_status: Lowest status code counted as an error
+        :type error_status: int
+        :param histogram_factory: Callable returning an empty histogram
+        """
+        self._key_fields = tuple(key_fields)
+        self._error_status = error_status
+        self._histogram_factory = histogram_factory
+        self._stats = {}
+        self.interval_start = time.time()
+
+    def add(self, time_ms, error=False, **fields):
+        """
+        :param time_ms: Request time in milliseconds
+        :param error: Whether the request failed
+        :param fields: Values of the key fields
+        """
+        key = tuple(fields.get(field) for field in self._key_fields)
+
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _KeyStats(self._histogram_factory())
+
+        if time_ms is not None:
+            stats.histogram.record(time_ms * 1000)
+        if error:
+            stats.errors += 1
+
+    def add_record(self, log_record, error=False):
+        """
+        Adds the timing fields of a RequestLogRecord.
+        """
+        log_record.materialize()
+        status_code = log_record._status_code
+
+        self.add(
+            log_record._req_time,
+            error=error
+            or (status_code is not None and status_code >= self._error_status),
+            route=log_record._route
+            if log_record._route is not None
+            else log_record._path,
+            host=log_record._host,
+            method=log_record._method,
+            status_code=status_code,
+        )
+
+    def add_dict(self, log_dict, error=False):
+        """
+        Same as add_record for the dict a RequestLogRecord is logged as.
+        """
+        request, response = log_dict.get("request", {}), log_dict.get("response", {})
+        status_code = response.get("status_code")
+
+        self.add(
+            request.get("time"),
+            error=error
+            or (status_code is not None and status_code >= self._error_status),
+            route=request.get("route")
+            if request.get("route") is not None
+            else request.get("path"),
+            host=request.get("host"),
+            method=request.get("method"),
+            status_code=status_code,
+        )
+
+    def __len__(self):
+        return len(self._stats)
+
+    def snapshot(self, reset=False):
+        """
+        :param reset: Whether to start a new interval
+        :return: JSON serializable state, to be merged into another aggregator
+        """
+        snapshot = {
+            "interval_start": self.interval_start,
+            "interval_end": time.time(),
+            "key_fields": list(self._key_fields),
+            "keys": [
+                {
+                    "key": list(key),
+                    "errors": stats.errors,
+                    "histogram": stats.histogram.snapshot(),
+                }
+                for key, stats in self._stats.items()
+            ],
+        }
+
+        if reset:
+            self._stats = {}
+            self.interval_start = snapshot["interval_end"]
+
+        return snapshot
+
+    def merge(self, snapshot):
+        if list(self._key_fields) != snapshot["key_fields"]:
+            raise ValueError("Aggregators have different key fields")
+
+        self.interval_start = min(self.interval_start, snapshot["interval_start"])
+
+        for item in snapshot["keys"]:
+            key = tuple(item["key"])
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _KeyStats(self._histogram_factory())
+
+            stats.histogram.merge_snapshot(item["histogram"])
+            stats.errors += item["errors"]
+
+    def summaries(self, reset=False):
+        """
+        :return: a summary dict per key, times in milliseconds
+        """
+        interval_start, interval_end = self.interval_start, time.time()
+        summaries = []
+
+        for key, stats in self._stats.items():
+            histogram = stats.histogram
+            summary = dict(zip(self._key_fields, key))
+            summary.update(
+                {
+                    "interval_start": interval_start,
+                    "interval_end": interval_end,
+                    "count": histogram.count,
+                    "errors": stats.errors,
+                    "max": _to_ms(histogram.max),
+                }
+            )
+            for percent in PERCENTILES:
+                summary["p{}".format(percent)] = _to_ms(histogram.percentile(percent))
+            summaries.append(summary)
+
+        if reset:
+            self._stats = {}
+            self.interval_start = interval_end
+
+        return summaries
+
+
+def _to_ms(value):
+    return None if value is None else value / 1000
+
+
+class AggregationHandler(logging.Handler):
+    """
+    Handler aggregating request logs instead of emitting them: every interval
+    it logs one summary per key to target, from a background thread when no
+    record comes in, and once more when closed.
+    Records whose message is not a request log are ignored.
+    """
+
+    def __init__(self, target, interval=60, aggregator=None, level=logging.NOTSET):
+        """
+        :param target: Logger summaries are logged to, at INFO level
+        :type target: logging.Logger
+        :param interval: Seconds between summaries
+        :type interval: float
+        :type aggregator: LatencyAggregator
+        """
+        super().__init__(level=level)
+
+        self._target = target
+        self._interval = interval
+        self.aggregator = aggregator or LatencyAggregator()
+        self._next_flush = time.monotonic() + interval
+        # Checks at most every second whether the interval is over
+        self._flusher = PeriodicFlusher(
+            self._flush_due, min(interval, 1), "nephthys-aggregation"
+        )
+
+    def emit(self, record):
+        self._flusher.start()
+        msg = record.msg
+        try:
+            if isinstance(msg, RequestLogRecord):
+                self.aggregator.add_record(msg, error=bool(record.exc_info))
+            elif isinstance(msg, dict) and "request" in msg:
+                self.aggregator.add_dict(msg, error=bool(record.exc_info))
+            else:
+                return
+        except Exception:
+            self.handleError(record)
+            return
+
+        self._flush_due()
+
+    def _flush_due(self):
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self._next_flush = time.monotonic() + self._interval
+            summaries = self.aggregator.summaries(reset=True)
+
+        for summary in summaries:
+            self._target.info(summary)
+
+    def close(self):
+        self._flusher.close()
+        self.flush()
+        super().close()
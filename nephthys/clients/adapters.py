@@ -0,0 +1,262 @@
+import threading
+from time import perf_counter
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+_local = threading.local()
+
+
+def _current_timings():
+    return getattr(_local, "timings", None)
+
+
+class ConnectionTimings:
+    """
+    Phases of a request, measured with time.perf_counter by NephthysHTTPAdapter,
+    and the state of the connection pool when the connection was acquired.
+    Durations are summed over retries and redirects handled by urllib3.
+    """
+
+    __slots__ = (
+        "start",
+        "pool_wait",
+        "pool_maxsize",
+        "pool_in_use",
+        "reused",
+        "connect",
+        "tcp",
+        "headers",
+        "end",
+        "tls",
+    )
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.pool_wait = 0.0
+        self.pool_maxsize = None
+        self.pool_in_use = None
+        self.reused = None
+        self.connect = 0.0
+        self.tcp = 0.0
+        self.tls = False
+        self.headers = None
+        self.end = None
+
+    def asdict(self):
+        """
+        :return: phase durations in milliseconds, headers and body are
+            measured from the start of the request
+        """
+        return {
+            "pool_wait": self.pool_wait * 1000,
+            "pool_maxsize": self.pool_maxsize,
+            "pool_in_use": self.pool_in_use,
+            "connection_reused": self.reused,
+            "connect": self.connect * 1000,
+            "tls": (self.connect - self.tcp) * 1000 if self.tls else None,
+            "headers": None
+            if self.headers is None
+            else (self.headers - self.start) * 1000,
+            "body": None
+            if self.end is None or self.headers is None
+            else (self.end - self.headers) * 1000,
+        }
+
+
+class PoolStats:
+    """
+    Counters of the connections acquired from the pools of a host.
+    """
+
+    __slots__ = (
+        "acquired",
+        "exhausted",
+        "reused",
+        "wait_total",
+        "wait_max",
+        "in_use_max",
+        "maxsize",
+    )
+
+    def __init__(self):
+        self.acquired = 0
+        self.exhausted = 0
+        self.reused = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.in_use_max = 0
+        self.maxsize = None
+
+    def add(self, wait, maxsize, in_use, reused, exhausted):
+        self.acquired += 1
+        self.exhausted += exhausted
+        self.reused += reused
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.maxsize = maxsize
+        if in_use is not None:
+            self.in_use_max = max(self.in_use_max, in_use)
+
+    def asdict(self):
+        """
+        :return: the counters, waits in milliseconds
+        """
+        return {
+            "acquired": self.acquired,
+            "exhausted": self.exhausted,
+            "reused": self.reused,
+            "wait_total": self.wait_total * 1000,
+            "wait_max": self.wait_max * 1000,
+            "wait_avg": self.wait_total * 1000 / self.acquired
+            if self.acquired
+            else None,
+            "in_use_max": self.in_use_max,
+            "maxsize": self.maxsize,
+        }
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        timings = _current_timings()
+        if timings is None:
+            return super()._new_conn()
+
+        start = perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            timings.tcp += perf_counter() - start
+
+    def connect(self):
+        timings = _current_timings()
+        if timings is None:
+            return super().connect()
+
+        start = perf_counter()
+        try:
+            return super().connect()
+        finally:
+            timings.connect += perf_counter() - start
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedPoolMixin:
+    def _get_conn(self, timeout=None):
+        timings = _current_timings()
+        if timings is None:
+            return super()._get_conn(timeout)
+
+        slots = self.pool
+        # No free slot: wait for one, or open a connection that won't be pooled
+        exhausted = slots is not None and slots.empty()
+
+        start = perf_counter()
+        conn = super()._get_conn(timeout)
+        wait = perf_counter() - start
+
+        reused = getattr(conn, "sock", None) is not None
+        maxsize = in_use = None
+        if slots is not None:
+            maxsize = slots.maxsize
+            in_use = maxsize - slots.qsize()
+
+        timings.pool_wait += wait
+        timings.reused = reused
+        timings.pool_maxsize = maxsize
+        timings.pool_in_use = in_use
+
+        adapter = getattr(_local, "adapter", None)
+        if adapter is not None:
+            adapter._add_pool_stats(self, wait, maxsize, in_use, reused, exhausted)
+
+        return conn
+
+    def _make_request(self, *args, **kwargs):
+        response = super()._make_request(*args, **kwargs)
+
+        timings = _current_timings()
+        if timings is not None:
+            # Returned once the status line and headers are read
+            timings.headers = perf_counter()
+        return response
+
+
+class TimedHTTPConnectionPool(_TimedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(_TimedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class NephthysHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter measuring the phases of each request through instrumented
+    urllib3 pools and connections. The ConnectionTimings of a request are
+    set as the nephthys_timings attribute of its PreparedRequest and Response.
+    Per host pool counters are available from pool_stats().
+    Can be mounted on any requests.Session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._pool_stats = {}
+        self._pool_stats_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._pool_stats = {}
+        self._pool_stats_lock = threading.Lock()
+
+    def _add_pool_stats(self, pool, wait, maxsize, in_use, reused, exhausted):
+        host = "{}://{}:{}".format(pool.scheme, pool.host, pool.port)
+
+        with self._pool_stats_lock:
+            stats = self._pool_stats.get(host)
+            if stats is None:
+                stats = self._pool_stats[host] = PoolStats()
+            stats.add(wait, maxsize, in_use, reused, exhausted)
+
+    def pool_stats(self):
+        """
+        :return: dict of "scheme://host:port" to PoolStats.asdict()
+        """
+        with self._pool_stats_lock:
+            return {host: stats.asdict() for host, stats in self._pool_stats.items()}
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, *args, **kwargs):
+        timings = ConnectionTimings()
+        timings.tls = request.url.lower().startswith("https:")
+        request.nephthys_timings = timings
+
+        previous, _local.timings = _current_timings(), timings
+        previous_adapter, _local.adapter = getattr(_local, "adapter", None), self
+        try:
+            response = super().send(request, stream, *args, **kwargs)
+            if not stream:
+                # Read here what Session.send would read right after
+                response.content
+                timings.end = perf_counter()
+        finally:
+            _local.timings = previous
+            _local.adapter = previous_adapter
+
+        response.nephthys_timings = timings
+        return response
@@ -0,0 +1,50 @@
+import codecs
+
+from nephthys.filters.requests import BODY_NOT_LOGGABLE
+
+ROUTE_HEADER = "X-Route-Header"
+RAW_DATA = "<RAW Data>"
+
+DEFAULT_ALLOWED_TYPES = [
+    "application/json",
+    "text/plain",
+    "text/html",
+    "application/x-www-form-urlencoded",
+]
+
+
+def decode_body(body, encoding, limit=None):
+    """
+    Decodes at most limit bytes of body, a character cut by the limit is
+    dropped instead of failing to decode.
+    :return: the decoded text and whether body was truncated
+    """
+    if limit is None or len(body) <= limit:
+        return body.decode(encoding, errors="strict"), False
+
+    decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+    return decoder.decode(memoryview(body)[:limit], final=False), True
+
+
+def content_length(headers):
+    length = headers.get("Content-Length") if headers else None
+    if isinstance(length, str) and length.isdigit():
+        return int(length)
+    return None
+
+
+def capture_body(body, encoding, content_type, limit=None, body_type_filter=None):
+    """
+    Decodes a body for logging, bodies of a type body_type_filter does not
+    allow are replaced without being decoded.
+    :param limit: Maximum number of bytes decoded
+    :type body_type_filter: nephthys.filters.requests.BodyTypeFilter
+    :return: the logged text and whether body was truncated
+    """
+    if body_type_filter is not None and not body_type_filter.is_loggable(content_type):
+        return BODY_NOT_LOGGABLE.format(content_type), False
+
+    try:
+        return decode_body(body, encoding, limit)
+    except (TypeError, LookupError, UnicodeDecodeError):
+        return RAW_DATA, False
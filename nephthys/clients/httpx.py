@@ -0,0 +1,265 @@
+import logging
+import sys
+import threading
+from functools import partial
+
+import httpx
+
+from nephthys import FilterLoggerAdapter, Log, RequestLogRecord
+from nephthys.clock import Stopwatch
+from nephthys.clients.common import DEFAULT_ALLOWED_TYPES, ROUTE_HEADER, capture_body
+from nephthys.dispatch import LogDispatcher
+from nephthys.filters.requests import BodyTypeFilter
+
+logger = logging.getLogger("httpx_out")
+
+_default_dispatcher = None
+_default_dispatcher_lock = threading.Lock()
+
+
+def default_dispatcher():
+    """
+    :return: the LogDispatcher shared by clients configured without one
+    """
+    global _default_dispatcher
+
+    with _default_dispatcher_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = LogDispatcher()
+        return _default_dispatcher
+
+
+def decorate_log_request(log_record, request, body_limit=None, body_type_filter=None):
+    """
+    :type request: httpx.Request
+    :param body_limit: Maximum number of body bytes decoded into the record
+    :param body_type_filter: When set, bodies whose Content-Type it does not
+        allow are replaced without being decoded
+    :type body_type_filter: nephthys.filters.requests.BodyTypeFilter
+    """
+    log_record.method = request.method
+    log_record.url = str(request.url)
+
+    for name, value in request.headers.multi_items():
+        log_record.add_request_header(name, value)
+
+    for name, value in request.url.params.multi_items():
+        log_record.add_request_querystring(name, value)
+
+    try:
+        body = request.content
+    except httpx.RequestNotRead:
+        # Streamed uploads are not logged
+        return
+
+    if body:
+        log_record.request_body_size = len(body)
+        log_record.request_body, truncated = capture_body(
+            body,
+            "UTF-8",
+            request.headers.get("Content-Type", ""),
+            body_limit,
+            body_type_filter,
+        )
+        if truncated:
+            log_record.request_body_truncated = True
+
+
+def decorate_log_response(log_record, response, body_limit=None, body_type_filter=None):
+    """
+    :type response: httpx.Response
+    :param body_limit: Maximum number of body bytes decoded into the record
+    :param body_type_filter: When set, bodies whose Content-Type it does not
+        allow are replaced without being decoded
+    :type body_type_filter: nephthys.filters.requests.BodyTypeFilter
+    """
+    log_record.status_code = response.status_code
+
+    for name, value in response.headers.multi_items():
+        log_record.add_response_header(name, value)
+
+    try:
+        body = response.content
+    except httpx.ResponseNotRead:
+        # Streamed responses are logged before their body is read
+        return
+
+    if body:
+        log_record.response_body_size = len(body)
+        log_record.response_body, truncated = capture_body(
+            body,
+            response.charset_encoding or "utf-8",
+            response.headers.get("Content-Type", ""),
+            body_limit,
+            body_type_filter,
+        )
+        if truncated:
+            log_record.response_body_truncated = True
+
+
+class AsyncNephthysMixin:
+    """
+    Adds Nephthys logging to an httpx.AsyncClient.
+    Records are built, filtered and emitted on a LogDispatcher worker thread,
+    so logging never blocks the event loop. The logger is configured with
+    the same default BodyTypeFilter as nephthys.clients.requests.NephthysMixin.
+    """
+
+    _logger = None
+    _log_dispatcher = None
+    _log_sampler = None
+
+    def __init__(
+        self,
+        log_tag=None,
+        log_filters=None,
+        log_dispatcher=None,
+        log_request_body_limit=None,
+        log_response_body_limit=None,
+        log_sampler=None,
+        log_instrumentation=None,
+        *args,
+        **kwargs
+    ):
+        """
+        :param log_tag: The tag that will identify logs from this client
+        :type log_tag: string
+        :param log_filters: List of additional IRequestFilter
+        :type log_filters: list
+        :param log_dispatcher: Dispatcher logs are emitted from, defaults to
+            one shared by every client
+        :type log_dispatcher: nephthys.dispatch.LogDispatcher
+        :param log_request_body_limit: Maximum number of request body bytes
+            logged, longer bodies are truncated and flagged in the record
+        :type log_request_body_limit: int
+        :param log_response_body_limit: Same as log_request_body_limit for
+            response bodies
+        :type log_response_body_limit: int
+        :param log_sampler: Decides which requests are logged before anything
+            is captured from them, failed requests are always logged
+        :type log_sampler: nephthys.sampling.Sampler
+        :param log_instrumentation: Times the filters and processing phases
+            of the records logged
+        :type log_instrumentation: nephthys.instrumentation.Instrumentation
+        """
+        body_type_filter = BodyTypeFilter(allowed_types=DEFAULT_ALLOWED_TYPES)
+        _log_filters = [body_type_filter]
+
+        if isinstance(log_filters, list):
+            _log_filters.extend(log_filters)
+
+        self._logger = FilterLoggerAdapter(
+            logger=logger,
+            filters=_log_filters,
+            extra_tags=[log_tag],
+            instrumentation=log_instrumentation,
+        )
+        self._log_dispatcher = log_dispatcher
+        self._log_sampler = log_sampler
+
+        self._decorate_request = partial(
+            decorate_log_request,
+            body_limit=log_request_body_limit,
+            body_type_filter=body_type_filter,
+        )
+        self._decorate_response = partial(
+            decorate_log_response,
+            body_limit=log_response_body_limit,
+            body_type_filter=body_type_filter,
+        )
+        super().__init__(*args, **kwargs)
+
+    def _log_enabled(self, exception=False):
+        return self._logger.isEnabledFor(logging.ERROR if exception else logging.INFO)
+
+    def _send_log_record(
+        self,
+        start_time,
+        end_time,
+        duration_ns,
+        request,
+        route=None,
+        response=None,
+        exception=False,
+    ):
+        """
+        Builds a LogRecord and logs it with self._logger, on the dispatcher thread.
+        """
+        log_rec = RequestLogRecord()
+        log_rec.set_request_timing(start_time, end_time, duration_ns)
+
+        log_rec.defer(self._decorate_request, request)
+        if route is not None:
+            log_rec.route = route
+
+        if response is not None:
+            log_rec.defer(self._decorate_response, response)
+
+        if exception:
+            self._logger.exception(Log(log_rec), exc_info=exception)
+        else:
+            self._logger.info(Log(log_rec))
+
+    def _dispatch_log_record(self, exception=False, **kwargs):
+        if not self._log_enabled(exception):
+            return
+
+        if exception:
+            exception = sys.exc_info()
+
+        dispatcher = self._log_dispatcher or default_dispatcher()
+        dispatcher.submit(self._send_log_record, exception=exception, **kwargs)
+
+    async def send(self, request, **kwargs):
+        stopwatch = Stopwatch()
+        route = request.headers.pop(ROUTE_HEADER, None)
+
+        sampler = self._log_sampler
+        sampled = sampler is None or sampler.sample_request(
+            str(request.url), route, request.headers
+        )
+
+        try:
+            response = await super().send(request, **kwargs)
+        except Exception:
+            stopwatch.stop()
+            self._dispatch_log_record(
+                start_time=stopwatch.start,
+                end_time=stopwatch.end,
+                duration_ns=stopwatch.duration_ns,
+                request=request,
+                route=route,
+                exception=True,
+            )
+            raise
+
+        if not sampled and not sampler.is_error(response.status_code):
+            return response
+
+        stopwatch.stop()
+        self._dispatch_log_record(
+            start_time=stopwatch.start,
+            end_time=stopwatch.end,
+            duration_ns=stopwatch.duration_ns,
+            request=request,
+            route=route,
+            response=response,
+        )
+
+        return response
+
+    async def request(self, method, url, route=None, **kwargs):
+        if route is not None:
+            headers = httpx.Headers(kwargs.get("headers"))
+            headers[ROUTE_HEADER] = route
+            kwargs["headers"] = headers
+
+        return await super().request(method, url, **kwargs)
+
+
+class AsyncClient(AsyncNephthysMixin, httpx.AsyncClient):
+    """
+    Provides an httpx.AsyncClient with Nephthys Logging.
+    """
+
+    pass
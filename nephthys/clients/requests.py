@@ -1,21 +1,25 @@
 import logging
-from datetime import datetime
+import sys
+from functools import partial
 from urllib.parse import parse_qs, urlparse
 
 from requests.sessions import Session as RequestsSession
 
 from nephthys import FilterLoggerAdapter, Log, RequestLogRecord
-from nephthys.filters.requests import BodyTypeFilter
+from nephthys.clock import Stopwatch
+from nephthys.clients.adapters import ConnectionTimings, NephthysHTTPAdapter
+from nephthys.clients.common import (  # noqa: F401
+    DEFAULT_ALLOWED_TYPES,
+    ROUTE_HEADER,
+    capture_body,
+    content_length,
+    decode_body,
+)
+from nephthys.filters.requests import BODY_NOT_LOGGABLE, BodyTypeFilter
+from nephthys.retention import Retention
 
 logger = logging.getLogger("requests_out")
 
-DEFAULT_ALLOWED_TYPES = [
-    "application/json",
-    "text/plain",
-    "text/html",
-    "application/x-www-form-urlencoded",
-]
-
 
 def catch_logger_exception(function):
     def wrapper(*args, **kwargs):
@@ -27,13 +31,28 @@ def catch_logger_exception(function):
     return wrapper
 
 
-def decorate_log_request(log_record, request):
+def decorate_log_request_summary(log_record, request):
     log_record.method = request.method
     log_record.url = request.url
 
     if hasattr(request, "route"):
         log_record.route = request.route
 
+    timings = getattr(request, "nephthys_timings", None)
+    if isinstance(timings, ConnectionTimings):
+        for name, value in timings.asdict().items():
+            log_record.add_timing(name, value)
+
+
+def decorate_log_request(log_record, request, body_limit=None, body_type_filter=None):
+    """
+    :param body_limit: Maximum number of body bytes decoded into the record
+    :param body_type_filter: When set, bodies whose Content-Type it does not
+        allow are replaced without being decoded
+    :type body_type_filter: nephthys.filters.requests.BodyTypeFilter
+    """
+    decorate_log_request_summary(log_record, request)
+
     if request.headers:
         for name, value in request.headers.items():
             log_record.add_request_header(name, value)
@@ -43,31 +62,73 @@ def decorate_log_request(log_record, request):
         for name, value in querystring.items():
             log_record.add_request_querystring(name, value)
     if request.body:
-        try:
-            if isinstance(request.body, str):
-                log_record.request_body = request.body
+        body = request.body
+        content_type = (
+            request.headers.get("Content-Type", "") if request.headers else ""
+        )
+
+        if not isinstance(body, str):
+            if isinstance(body, (bytes, bytearray)):
+                log_record.request_body_size = len(body)
+            else:
+                log_record.request_body_size = content_length(request.headers)
+
+            log_record.request_body, truncated = capture_body(
+                body, "UTF-8", content_type, body_limit, body_type_filter
+            )
+            if truncated:
+                log_record.request_body_truncated = True
+            return
+
+        log_record.request_body_size = content_length(request.headers)
+        if body_type_filter is not None and not body_type_filter.is_loggable(
+            content_type
+        ):
+            log_record.request_body = BODY_NOT_LOGGABLE.format(content_type)
+            return
+
+        if body_limit is not None:
+            # Characters are at least one byte, only the prefix is encoded
+            encoded = body[:body_limit].encode("UTF-8")
+            if len(body) > body_limit or len(encoded) > body_limit:
+                body = decode_body(encoded, "UTF-8", body_limit)[0]
+                log_record.request_body_truncated = True
             else:
-                log_record.request_body = request.body.decode("UTF-8", errors="strict")
-        except UnicodeDecodeError:
-            log_record.request_body = "<RAW Data>"
+                log_record.request_body_size = len(encoded)
+        log_record.request_body = body
 
 
-def decorate_log_response(log_record, response):
+def decorate_log_response_summary(log_record, response):
     log_record.status_code = response.status_code
 
+
+def decorate_log_response(log_record, response, body_limit=None, body_type_filter=None):
+    """
+    :param body_limit: Maximum number of body bytes decoded into the record
+    :param body_type_filter: When set, bodies whose Content-Type it does not
+        allow are replaced without being decoded
+    :type body_type_filter: nephthys.filters.requests.BodyTypeFilter
+    """
+    decorate_log_response_summary(log_record, response)
+
     if response.headers:
         for name, value in response.headers.items():
             log_record.add_response_header(name, value)
 
     if response.content:
-        encoding = response.encoding or "utf-8"
-
-        try:
-            log_record.response_body = response.content.decode(
-                encoding, errors="strict"
-            )
-        except (TypeError, LookupError, UnicodeDecodeError):
-            log_record.response_body = "<RAW Data>"
+        content = response.content
+        if isinstance(content, (bytes, bytearray)):
+            log_record.response_body_size = len(content)
+
+        log_record.response_body, truncated = capture_body(
+            content,
+            response.encoding or "utf-8",
+            response.headers.get("Content-Type", "") if response.headers else "",
+            body_limit,
+            body_type_filter,
+        )
+        if truncated:
+            log_record.response_body_truncated = True
 
 
 class NephthysMixin:
@@ -79,74 +140,224 @@ class NephthysMixin:
     """
 
     _logger = None
-
-    def __init__(self, log_tag=None, log_filters=None, *args, **kwargs):
+    _log_dispatcher = None
+    _log_record_pool = None
+    _log_sampler = None
+    _log_retention = None
+
+    def __init__(
+        self,
+        log_tag=None,
+        log_filters=None,
+        log_dispatcher=None,
+        log_record_pool=None,
+        log_request_body_limit=None,
+        log_response_body_limit=None,
+        log_sampler=None,
+        log_retention=None,
+        log_instrumentation=None,
+        *args,
+        **kwargs
+    ):
         """
         :param log_tag: The tag that will identify logs from this Session
         :type log_tag: string
         :param log_filters: List of additional IRequestFilter
         :type log_filters: list
+        :param log_dispatcher: When set, records are built, filtered and emitted
+            on the dispatcher's worker thread instead of the caller's
+        :type log_dispatcher: nephthys.dispatch.LogDispatcher
+        :param log_record_pool: Pool RequestLogRecords are taken from and
+            returned to once logged
+        :type log_record_pool: nephthys.RecordPool
+        :param log_request_body_limit: Maximum number of request body bytes
+            logged, longer bodies are truncated and flagged in the record
+        :type log_request_body_limit: int
+        :param log_response_body_limit: Same as log_request_body_limit for
+            response bodies
+        :type log_response_body_limit: int
+        :param log_sampler: Decides which requests are logged before anything
+            is captured from them, failed requests are always logged
+        :type log_sampler: nephthys.sampling.Sampler
+        :param log_retention: Decides once requests are over whether they are
+            logged with headers and bodies, as a summary or not at all
+        :type log_retention: nephthys.retention.RetentionPolicy
+        :param log_instrumentation: Times the filters and processing phases
+            of the records logged
+        :type log_instrumentation: nephthys.instrumentation.Instrumentation
         """
-        _log_filters = [BodyTypeFilter(allowed_types=DEFAULT_ALLOWED_TYPES)]
+        body_type_filter = BodyTypeFilter(allowed_types=DEFAULT_ALLOWED_TYPES)
+        _log_filters = [body_type_filter]
 
         if isinstance(log_filters, list):
             _log_filters.extend(log_filters)
 
         self._logger = FilterLoggerAdapter(
-            logger=logger, filters=_log_filters, extra_tags=[log_tag]
+            logger=logger,
+            filters=_log_filters,
+            extra_tags=[log_tag],
+            instrumentation=log_instrumentation,
+        )
+        self._log_dispatcher = log_dispatcher
+        self._log_record_pool = log_record_pool
+        self._log_sampler = log_sampler
+        self._log_retention = log_retention
+
+        # Bodies of types the default BodyTypeFilter drops are never decoded
+        self._decorate_request = partial(
+            decorate_log_request,
+            body_limit=log_request_body_limit,
+            body_type_filter=body_type_filter,
+        )
+        self._decorate_response = partial(
+            decorate_log_response,
+            body_limit=log_response_body_limit,
+            body_type_filter=body_type_filter,
         )
         super().__init__(*args, **kwargs)
 
+    def _log_enabled(self, exception=False):
+        return self._logger.isEnabledFor(logging.ERROR if exception else logging.INFO)
+
     @catch_logger_exception
     def _send_log_record(
-        self, start_time, end_time, request=None, response=None, exception=False
+        self,
+        start_time,
+        end_time,
+        request=None,
+        response=None,
+        exception=False,
+        retention=Retention.FULL,
+        duration_ns=None,
     ):
         """
         Builds a LogRecord and logs it with self._logger.
+        Request and response are only decorated into the record once the
+        logger actually processes it, nothing is captured if it is disabled.
         Integrate this method in your class to enable Nephthys logging into it.
         :param start_time: timestamp of when the operation logged started
         :param end_time: timestamp of when the operation logged ended
         :type request: requests.models.Request
         :type response: requests.models.Response
-        :param exception: whether the log is an exception or not
+        :param exception: whether the log is an exception or not, an exc_info
+            tuple can be given when logging outside of the except block
+        :param retention: Retention.MINIMAL only logs timing, method, url,
+            route and status code
+        :type retention: nephthys.retention.Retention
+        :param duration_ns: monotonic duration of the operation, the request
+            time is computed from start_time and end_time without it
         """
-        log_rec = RequestLogRecord()
-        log_rec.request_start = start_time
-        log_rec.request_end = end_time
+        if retention == Retention.DROP or not self._log_enabled(exception):
+            return
+
+        if retention == Retention.MINIMAL:
+            decorate_request, decorate_response = (
+                decorate_log_request_summary,
+                decorate_log_response_summary,
+            )
+        else:
+            decorate_request, decorate_response = (
+                self._decorate_request,
+                self._decorate_response,
+            )
+
+        pool = self._log_record_pool
+        log_rec = RequestLogRecord() if pool is None else pool.acquire()
+        if duration_ns is None:
+            log_rec.request_start = start_time
+            log_rec.request_end = end_time
+        else:
+            log_rec.set_request_timing(start_time, end_time, duration_ns)
 
-        decorate_log_request(log_rec, request)
+        log_rec.defer(decorate_request, request)
 
         if response is not None:
-            decorate_log_response(log_rec, response)
+            log_rec.defer(decorate_response, response)
+
+        try:
+            if exception:
+                self._logger.exception(Log(log_rec), exc_info=exception)
+            else:
+                self._logger.info(Log(log_rec))
+        finally:
+            if pool is not None:
+                pool.release(log_rec)
+
+    def _dispatch_log_record(self, exception=False, **kwargs):
+        """
+        Logs synchronously, or hands the captured request/response over to
+        self._log_dispatcher when one is configured.
+        """
+        if not self._log_enabled(exception):
+            return
+
+        if self._log_dispatcher is None:
+            self._send_log_record(exception=exception, **kwargs)
+            return
 
         if exception:
-            self._logger.exception(Log(log_rec))
-        else:
-            self._logger.info(Log(log_rec))
+            exception = sys.exc_info()
+
+        response = kwargs.get("response")
+        if (
+            response is not None
+            and kwargs.get("retention", Retention.FULL) == Retention.FULL
+        ):
+            # Read streamed content here, the worker must not race the caller
+            response.content
+
+        self._log_dispatcher.submit(
+            self._send_log_record, exception=exception, **kwargs
+        )
 
     def send(self, request, **kwargs):
-        start_time = datetime.utcnow().timestamp()
+        stopwatch = Stopwatch()
 
-        if "X-Route-Header" in request.headers:
-            route = request.headers.pop("X-Route-Header")
+        if ROUTE_HEADER in request.headers:
+            route = request.headers.pop(ROUTE_HEADER)
             request.route = route
 
+        sampler = self._log_sampler
+        sampled = sampler is None or sampler.sample_request(
+            request.url, getattr(request, "route", None), request.headers
+        )
+
         try:
             response = super().send(request, **kwargs)
         except Exception as exc:
-            self._send_log_record(
-                start_time=start_time,
-                end_time=datetime.utcnow().timestamp(),
+            stopwatch.stop()
+            self._dispatch_log_record(
+                start_time=stopwatch.start,
+                end_time=stopwatch.end,
+                duration_ns=stopwatch.duration_ns,
                 request=request,
                 exception=True,
             )
             raise
 
-        self._send_log_record(
-            start_time=start_time,
-            end_time=datetime.utcnow().timestamp(),
+        if not sampled and not sampler.is_error(response.status_code):
+            return response
+
+        stopwatch.stop()
+
+        retention = Retention.FULL
+        if self._log_retention is not None:
+            retention = self._log_retention.request_retention(
+                request.url,
+                getattr(request, "route", None),
+                stopwatch.duration_ms,
+                response.status_code,
+            )
+            if retention == Retention.DROP:
+                return response
+
+        self._dispatch_log_record(
+            start_time=stopwatch.start,
+            end_time=stopwatch.end,
+            duration_ns=stopwatch.duration_ns,
             request=request,
             response=response,
+            retention=retention,
         )
 
         return response
@@ -157,9 +368,9 @@ class NephthysMixin:
 
         if route is not None:
             if "headers" in kwargs:
-                kwargs["headers"]["X-Route-Header"] = route
+                kwargs["headers"][ROUTE_HEADER] = route
             else:
-                kwargs["headers"] = {"X-Route-Header": route}
+                kwargs["headers"] = {ROUTE_HEADER: route}
 
         return super().request(method, url, **kwargs)
 
@@ -167,6 +378,12 @@ class NephthysMixin:
 class Session(NephthysMixin, RequestsSession):
     """
     Provides a requests.session.Session with Nephthys Logging.
+    Requests are sent through a NephthysHTTPAdapter, so that records include
+    the timing of each connection phase.
     """
 
-    pass
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.mount("https://", NephthysHTTPAdapter())
+        self.mount("http://", NephthysHTTPAdapter())
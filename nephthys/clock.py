@@ -0,0 +1,37 @@
+import time
+
+if hasattr(time, "perf_counter_ns"):
+
+    def perf_counter_ns():
+        # Looked up on each call so that time can be patched, e.g. in tests
+        return time.perf_counter_ns()
+
+
+else:  # Python 3.6
+
+    def perf_counter_ns():
+        return int(time.perf_counter() * 10 ** 9)
+
+
+class Stopwatch:
+    """
+    Wall clock start and end of an operation, for reporting, and its
+    duration measured with the monotonic perf_counter_ns.
+    """
+
+    __slots__ = ("start", "end", "_start_ns", "duration_ns")
+
+    def __init__(self):
+        self.start = time.time()
+        self._start_ns = perf_counter_ns()
+        self.end = None
+        self.duration_ns = None
+
+    def stop(self):
+        self.duration_ns = perf_counter_ns() - self._start_ns
+        self.end = time.time()
+        return self
+
+    @property
+    def duration_ms(self):
+        return None if self.duration_ns is None else self.duration_ns / 10 ** 6
@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_FIELDS = (
+    "request.method",
+    "request.host",
+    "request.path",
+    "request.route",
+    "response.status_code",
+    "request.body",
+    "response.body",
+)
+REPEATED_MESSAGE = "repeated {} times"
+
+# Longer values are fingerprinted by their digest instead of kept as is
+_MAX_VALUE_LENGTH = 128
+
+
+def _get_field(log_dict, path):
+    value = log_dict
+    for part in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _fingerprint_value(value):
+    if isinstance(value, str) and len(value) > _MAX_VALUE_LENGTH:
+        return (
+            "blake2b:"
+            + hashlib.blake2b(
+                value.encode("utf-8", "surrogatepass"), digest_size=16
+            ).hexdigest()
+        )
+    if isinstance(value, (dict, list)):
+        return _fingerprint_value(repr(value))
+    return value
+
+
+class _Window:
+    __slots__ = (
+        "start",
+        "level",
+        "extra_tags",
+        "fields",
+        "repeated",
+        "min",
+        "max",
+        "total",
+    )
+
+    def __init__(self, start, level, extra_tags, fields):
+        self.start = start
+        self.level = level
+        self.extra_tags = extra_tags
+        self.fields = fields
+        self.repeated = 0
+        self.min = None
+        self.max = None
+        self.total = 0
+
+    def add(self, time_ms):
+        self.repeated += 1
+        if time_ms is None:
+            return
+
+        self.total += time_ms
+        if self.min is None or time_ms < self.min:
+            self.min = time_ms
+        if self.max is None or time_ms > self.max:
+            self.max = time_ms
+
+    def summary(self, paths):
+        times = self.repeated if self.min is not None else 0
+        return {
+            "extra_tags": self.extra_tags,
+            "message": REPEATED_MESSAGE.format(self.repeated),
+            "repeated": self.repeated,
+            "fingerprint": dict(zip(paths, self.fields)),
+            "time": {
+                "min": self.min,
+                "max": self.max,
+                "avg": self.total / times if times else None,
+            },
+        }
+
+
+class Deduplicator:
+    """
+    Suppresses log dicts identical on a set of fields within a time window:
+    the first one is logged, the following ones are only counted and
+    summarized in a single record when the window closes, found by add or
+    expire, which FilterLoggerAdapter calls every sweep_interval seconds.
+    At most max_size windows are tracked, the least recently used one is
+    closed early to make room.
+    """
+
+    def __init__(
+        self, fields=DEFAULT_FIELDS, window=60, max_size=1024, clock=time.monotonic
+    ):
+        """
+        :param fields: Dotted paths in the logged dict the fingerprint is made of
+        :type fields: tuple
+        :param window: Seconds during which repeated records are suppressed
+        :type window: float
+        :param max_size: Maximum number of fingerprints tracked
+        :type max_size: int
+        """
+        self._fields = tuple(fields)
+        self._paths = [tuple(field.split(".")) for field in self._fields]
+        self._window = window
+        self._max_size = max_size
+        self._clock = clock
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        # Expired windows are looked for at most every second
+        self.sweep_interval = min(window, 1)
+        self._next_sweep = clock() + self.sweep_interval
+
+    def _fingerprint(self, log_dict):
+        return tuple(
+            _fingerprint_value(_get_field(log_dict, path)) for path in self._paths
+        )
+
+    def _close(self, key, window, summaries):
+        del self._windows[key]
+        if window.repeated:
+            summaries.append((window.level, window.summary(self._fields)))
+
+    def add(self, log_dict, level):
+        """
+        :return: whether log_dict has to be logged, and a list of (level,
+            summary) of the windows closed meanwhile
+        """
+        fingerprint = self._fingerprint(log_dict)
+        with self._lock:
+            return self._add(log_dict, level, fingerprint)
+
+    def _add(self, log_dict, level, fingerprint):
+        now = self._clock()
+        summaries = []
+
+        if now >= self._next_sweep:
+            self._sweep(now, summaries)
+
+        key = (level, fingerprint)
+        window = self._windows.get(key)
+
+        if window is not None and now - window.start >= self._window:
+            self._close(key, window, summaries)
+            window = None
+
+        if window is not None:
+            self._windows.move_to_end(key)
+            window.add(_get_field(log_dict, ("request", "time")))
+            return False, summaries
+
+        self._windows[key] = _Window(now, level, log_dict.get("extra_tags"), key[1])
+        if len(self._windows) > self._max_size:
+            oldest_key, oldest = next(iter(self._windows.items()))
+            self._close(oldest_key, oldest, summaries)
+
+        return True, summaries
+
+    def _sweep(self, now, summaries):
+        self._next_sweep = now + self.sweep_interval
+        for key, window in list(self._windows.items()):
+            if now - window.start >= self._window:
+                self._close(key, window, summaries)
+
+    def expire(self):
+        """
+        Closes the windows whose time is up.
+        :return: a list of (level, summary)
+        """
+        summaries = []
+        with self._lock:
+            self._sweep(self._clock(), summaries)
+        return summaries
+
+    def flush(self):
+        """
+        Closes every window.
+        :return: a list of (level, summary)
+        """
+        summaries = []
+        with self._lock:
+            for key, window in list(self._windows.items()):
+                self._close(key, window, summaries)
+        return summaries
+
+    def __len__(self):
+        return len(self._windows)
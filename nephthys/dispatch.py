@@ -0,0 +1,163 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from enum import Enum
+
+logger = logging.getLogger("nephthys")
+
+_STOP = object()
+_dispatchers = weakref.WeakSet()
+
+
+class FullPolicy(Enum):
+    DROP = 1
+    BLOCK = 2
+
+
+class LogDispatcher:
+    """
+    Runs log emission jobs on a background worker thread fed by a bounded queue.
+    The worker is started lazily, restarted in forked children and every
+    pending job is flushed when the interpreter exits.
+    """
+
+    def __init__(
+        self, queue_size=1024, full_policy=FullPolicy.DROP, block_timeout=None
+    ):
+        """
+        :param queue_size: Maximum number of pending jobs, 0 means unbounded
+        :type queue_size: int
+        :param full_policy: What to do with a job when the queue is full
+        :type full_policy: FullPolicy
+        :param block_timeout: Seconds to wait for a free slot with FullPolicy.BLOCK
+            before dropping the job, None waits forever
+        :type block_timeout: float
+        """
+        self._queue_size = queue_size
+        self._full_policy = full_policy
+        self._block_timeout = block_timeout
+        self._closed = False
+        self._reset()
+
+        self.dropped = 0
+
+        _dispatchers.add(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() and self._worker is not None:
+            return self._queue
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: parent's queue and thread are not ours to use
+                self._queue = None
+                self._worker = None
+
+            if self._worker is None:
+                self._queue = queue.Queue(maxsize=self._queue_size)
+                self._worker = threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name="nephthys-dispatcher",
+                    daemon=True,
+                )
+                self._worker.start()
+                self._pid = os.getpid()
+
+        return self._queue
+
+    def _run(self, job_queue):
+        while True:
+            item = job_queue.get()
+            try:
+                if item is _STOP:
+                    return
+
+                job, args, kwargs = item
+                job(*args, **kwargs)
+            except Exception:
+                logger.exception("Failed to log")
+            finally:
+                job_queue.task_done()
+
+    def submit(self, job, *args, **kwargs):
+        """
+        Queues job(*args, **kwargs) for execution on the worker thread.
+        :return: False if the job was dropped
+        """
+        if self._closed:
+            return False
+
+        job_queue = self._ensure_worker()
+
+        try:
+            if self._full_policy == FullPolicy.BLOCK:
+                job_queue.put((job, args, kwargs), timeout=self._block_timeout)
+            else:
+                job_queue.put_nowait((job, args, kwargs))
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued job has been executed.
+        :return: False if timeout expired before the queue was drained
+        """
+        job_queue = self._queue
+        if job_queue is None or self._pid != os.getpid():
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with job_queue.all_tasks_done:
+            while job_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                job_queue.all_tasks_done.wait(remaining)
+
+        return True
+
+    def close(self, timeout=None):
+        """
+        Flushes pending jobs and stops the worker thread.
+        Jobs submitted after close are dropped.
+        """
+        self._closed = True
+
+        worker = self._worker
+        if worker is None or self._pid != os.getpid():
+            return
+
+        self._queue.put(_STOP)
+        worker.join(timeout)
+        self._worker = None
+
+
+def _close_dispatchers():
+    for dispatcher in list(_dispatchers):
+        dispatcher.close()
+
+
+def _reinit_dispatchers():
+    for dispatcher in list(_dispatchers):
+        dispatcher._reset()
+
+
+atexit.register(_close_dispatchers)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_dispatchers)
@@ -10,3 +10,12 @@ class IFilter(ABC):
         :type log_record: LogRecord
         """
         pass  # pragma: nocover
+
+    def compile(self, pipeline):
+        """
+        Registers the stages applying this filter to pipeline, by default
+        filter itself. Only IFilter subclasses are compiled this way
+        :param pipeline: The pipeline being built
+        :type pipeline: FilterPipeline
+        """
+        pipeline.add_stage(self.filter)
@@ -0,0 +1,588 @@
+import json
+import re
+
+from ..formatters.backends import get_backend
+from .matcher import compile_literals
+
+_TOKEN = re.compile(
+    r"""
+    [ \t\n\r]*
+    (?:
+        ("[ !\#-\[\]-~]*")                      # 1: printable ASCII string, no escapes
+      | ("[^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*")  # 2: any other string
+      | ([{}\[\],:])                            # 3: structural character
+      | (-?[1-9][0-9]*|0)(?![.eE0-9])           # 4: canonical integer
+      | (-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)  # 5: any other number
+      | (true|false|null)                       # 6: literal
+    )
+    """,
+    re.VERBOSE,
+)
+
+# Floats printed the same way by dumps: fixed notation, at most 15
+# significant digits and no trailing zeros
+_CANONICAL_FLOAT = r"-?(?:[1-9][0-9]{0,6}\.(?:0|[0-9]{0,7}[1-9])|0\.(?:0|0{0,3}[1-9](?:[0-9]{0,3}[1-9])?))"
+
+# Runs of tokens copied unchanged, made of complete members or elements
+# that may open containers, not close them. Strings holding brackets are
+# left out so that brackets in a run are the containers it opens.
+_RUN_STRING = r'"[ !\#-Z\^-z|~]*"'
+_RUN_SCALAR = r"(?:%s|(?:-?[1-9][0-9]*|0|%s)(?![.eE0-9])|true|false|null)" % (
+    _RUN_STRING,
+    _CANONICAL_FLOAT,
+)
+_OBJECT_BODY = r"(?:{k}:{v},)*(?:{k}:{v}|{k}:{o})?"
+_ARRAY_BODY = r"(?:{v},)*(?:{v}|{o})?"
+_NESTED_BODIES = r"(?:(?<=\{{)%s|(?<=\[)%s)*" % (_OBJECT_BODY, _ARRAY_BODY)
+# Groups match the openers of the containers a run opens
+_OBJECT_RUN = re.compile(
+    (_OBJECT_BODY + _NESTED_BODIES).format(k=_RUN_STRING, v=_RUN_SCALAR, o=r"([{\[])")
+)
+_ARRAY_RUN = re.compile(
+    (_ARRAY_BODY + _NESTED_BODIES).format(k=_RUN_STRING, v=_RUN_SCALAR, o=r"([{\[])")
+)
+_OPENER = re.compile(r"[{\[]")
+
+# Keys that can only appear verbatim in JSON text, or through \u escapes
+# of printable ASCII characters
+_VERBATIM_KEY = re.compile(r"[ !#-.0-\[\]-~]*$")
+_ESCAPED_ASCII = re.compile(r"\\u00[2-7][0-9a-fA-F]")
+
+_PLAIN_STRING = 1
+_STRING = 2
+_STRUCTURAL = 3
+_INTEGER = 4
+_NUMBER = 5
+
+_REDACT = object()
+
+# What a container expects next
+_OPEN = 0  # first member or end, right after the opening bracket
+_KEY = 1
+_COLON = 2
+_VALUE = 3
+_AFTER = 4  # separator or end, after a value
+
+# Writes tokens as rapidjson does, which the redacted text matches
+_STDLIB = get_backend("json")
+
+
+def _normalize(token):
+    return _STDLIB.dumps(json.loads(token), str)
+
+
+WILDCARD = "*"
+RECURSIVE_PREFIX = ".."
+KEY_ESCAPE = "\\"
+
+# Name of WILDCARD once parsed, so that it cannot be mistaken for a key
+_ANY_KEY = object()
+
+
+def parse_schema_key(key):
+    """
+    Splits a body schema key: WILDCARD stands for any key, RECURSIVE_PREFIX
+    + key for key at any depth, where key may be WILDCARD too. KEY_ESCAPE in
+    front of either takes the rest of the key literally, e.g. "\\*" for the
+    key "*", "\\..key" for the key "..key" and "\\\\key" for "\\key".
+
+    :return: whether the key is recursive and the key name, _ANY_KEY for
+        WILDCARD
+    """
+    recursive = key.startswith(RECURSIVE_PREFIX)
+    if recursive:
+        key = key[len(RECURSIVE_PREFIX) :]
+
+    if key == WILDCARD:
+        return recursive, _ANY_KEY
+    if key.startswith(KEY_ESCAPE):
+        key = key[len(KEY_ESCAPE) :]
+    return recursive, key
+
+
+class _SchemaNode:
+    """
+    One level of a body schema, keys parsed by parse_schema_key.
+    Values are nested schemas, anything else redacts the value.
+    """
+
+    __slots__ = ("children", "wildcard", "descendants")
+
+    def __init__(self, schema):
+        self.children = {}
+        self.wildcard = []
+        self.descendants = []
+
+        for key, value in schema.items():
+            target = _SchemaNode(value) if isinstance(value, dict) else _REDACT
+
+            recursive, name = parse_schema_key(key)
+            if recursive:
+                self.descendants.append((name, target))
+            elif name is _ANY_KEY:
+                self.wildcard.append(target)
+            else:
+                self.children[name] = target
+
+
+class _State:
+    """
+    Set of schema nodes that apply to the current object, or to each
+    element of the current array, plus the recursive keys active below them.
+    Transitions are computed on first use and cached.
+    """
+
+    __slots__ = (
+        "_automaton",
+        "_nodes",
+        "_descendants",
+        "_named",
+        "_transitions",
+        "_other",
+    )
+
+    def __init__(self, automaton, nodes, descendants):
+        self._automaton = automaton
+        self._nodes = nodes
+        self._descendants = descendants
+        self._named = frozenset(key for node in nodes for key in node.children).union(
+            name for name, _ in descendants
+        )
+        self._transitions = {}
+        self._other = False
+
+    def _next(self, key):
+        targets = []
+        for node in self._nodes:
+            if key is not None and key in node.children:
+                targets.append(node.children[key])
+            targets.extend(node.wildcard)
+
+        for name, target in self._descendants:
+            if name is _ANY_KEY or name == key:
+                targets.append(target)
+
+        if _REDACT in targets:
+            return _REDACT
+
+        return self._automaton.state(targets, self._descendants)
+
+    def enter(self, key):
+        """
+        :return: the state of the value at key, _REDACT or None if the value
+            is not affected by the schema
+        """
+        try:
+            return self._transitions[key]
+        except KeyError:
+            pass
+
+        if key not in self._named:
+            # Every key not named by the schema leads to the same state
+            if self._other is False:
+                self._other = self._next(None)
+            return self._other
+
+        state = self._transitions[key] = self._next(key)
+        return state
+
+
+class SchemaAutomaton:
+    """
+    Body schema compiled into states, so that the document is redacted in a
+    single traversal whatever the number of paths, wildcards and recursive
+    keys. Arrays are transparent: their elements are in the array's state.
+    """
+
+    def __init__(self, schema):
+        self._states = {}
+        self.root = self.state([_SchemaNode(schema)], ())
+
+    def state(self, nodes, descendants):
+        nodes = tuple(
+            n for i, n in enumerate(nodes) if all(n is not m for m in nodes[:i])
+        )
+        descendants = list(descendants)
+        for node in nodes:
+            descendants.extend(d for d in node.descendants if d not in descendants)
+        descendants = tuple(descendants)
+
+        if not nodes and not descendants:
+            return None
+
+        key = (
+            tuple(id(n) for n in nodes),
+            tuple((name, id(t)) for name, t in descendants),
+        )
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _State(self, nodes, descendants)
+        return state
+
+
+def leaf_keys(schema):
+    """
+    :return: the set of keys whose values a schema redacts, at any depth,
+        as parsed by parse_schema_key
+    """
+    keys = set()
+    for key, value in schema.items():
+        key = parse_schema_key(key)[1]
+
+        if isinstance(value, dict):
+            keys.update(leaf_keys(value))
+        else:
+            keys.add(key)
+    return keys
+
+
+class KeyIndex:
+    """
+    Tells from the raw text whether a JSON document may hold any of the keys
+    a schema redacts, without tokenizing it.
+    """
+
+    def __init__(self, schema):
+        keys = leaf_keys(schema)
+
+        # Keys that could be spelled with short escapes, or any key at all,
+        # are always looked for
+        any_key = _ANY_KEY in keys
+        keys.discard(_ANY_KEY)
+        self._always = any_key or not all(_VERBATIM_KEY.match(key) for key in keys)
+        self._matcher = compile_literals(['"{}"'.format(key) for key in keys])
+
+    def may_match(self, text):
+        if self._always:
+            return True
+        if self._matcher is None:
+            return False
+
+        return (
+            self._matcher.search(text) is not None
+            or _ESCAPED_ASCII.search(text) is not None
+        )
+
+
+def redact(text, schema, replacement, partial=False):
+    """
+    Redacts the values of the JSON document text selected by schema in a
+    single pass over its tokens, without building the document tree.
+    The output is the same as dumping the loaded document after redaction,
+    but spans of text that are already in that form are copied as is.
+    :param schema: SchemaAutomaton, or a schema dict to compile
+    :param replacement: JSON text written in place of redacted values
+    :param partial: Whether to return the redacted prefix of a document that
+        is truncated or otherwise invalid, instead of raising ValueError.
+        Anything but whitespace after a complete document raises anyway,
+        the other values it holds are never redacted
+    """
+    if not isinstance(schema, SchemaAutomaton):
+        schema = SchemaAutomaton(schema)
+
+    redaction = _Redaction(text, schema.root, replacement)
+    try:
+        redaction.run()
+    except ValueError:
+        if not partial:
+            raise
+        # Nothing past the last complete token was written
+        return "".join(redaction.out)
+
+    return redaction.finish(partial)
+
+
+class _Redaction:
+    """
+    State of a redact() pass over text.
+    """
+
+    __slots__ = (
+        "text",
+        "replacement",
+        "out",
+        "span",
+        "pos",
+        "stack",
+        "frame",
+        "state",
+        "done",
+    )
+
+    def __init__(self, text, root, replacement):
+        self.text = text
+        self.replacement = replacement
+        self.out = []
+        self.span = 0  # start of the input not yet copied to out
+        self.pos = 0
+        # Containers affected by the schema as [state, is object, expected token]
+        self.stack = []
+        self.frame = None
+        self.state = root  # state of the next value
+        self.done = False  # whether the root value is complete
+
+    def run(self):
+        """
+        Redacts tokens up to the end of the root value, or up to the first
+        one that can't be read.
+        """
+        text = self.text
+        match = _TOKEN.match
+
+        while not self.done:
+            m = match(text, self.pos)
+            if m is None:
+                return
+
+            kind = m.lastindex
+            start = m.start(kind)
+            self.pos = m.end()
+
+            if start != m.start():
+                # Whitespace is dropped
+                self.out.append(text[self.span : m.start()])
+                self.span = start
+
+            frame = self.frame
+            if kind == _STRUCTURAL and self._punctuation(text[start], start):
+                continue
+
+            if frame is None:
+                self._value(m, kind, start)
+            elif frame[2] == _VALUE or frame[2] == _OPEN and not frame[1]:
+                self._value(m, kind, start)
+            elif frame[2] != _AFTER:
+                self._key(kind, start)
+            else:
+                raise ValueError(
+                    "Expected ',' or end of container at offset {}".format(start)
+                )
+
+    def finish(self, partial):
+        text, pos, out = self.text, self.pos, self.out
+
+        if self.done:
+            if text[pos:].strip(" \t\n\r"):
+                raise ValueError(
+                    "Unexpected data after the JSON document at offset {}".format(pos)
+                )
+        elif not partial:
+            raise ValueError("Invalid JSON at offset {}".format(pos))
+        elif self.state is _REDACT:
+            # The value to redact is cut
+            out.append(text[self.span : pos])
+            out.append(self.replacement)
+            return "".join(out)
+
+        out.append(text[self.span : pos])
+        return "".join(out)
+
+    def _normalized(self, start):
+        self.out.append(self.text[self.span : start])
+        self.out.append(_normalize(self.text[start : self.pos]))
+        self.span = self.pos
+
+    def _close(self):
+        self.stack.pop()
+        self.frame = self.stack[-1] if self.stack else None
+        self.state = None
+        self.done = self.frame is None
+
+    def _key(self, kind, start):
+        """
+        Object key, followed by ':'.
+        """
+        text = self.text
+        if kind == _PLAIN_STRING:
+            key = text[start + 1 : self.pos - 1]
+        elif kind == _STRING:
+            key = json.loads(text[start : self.pos])
+            self._normalized(start)
+        else:
+            raise ValueError("Expected object key at offset {}".format(start))
+
+        self.frame[2] = _VALUE
+        self.state = self.frame[0].enter(key)
+
+        m = _TOKEN.match(text, self.pos)
+        if m is None or m.lastindex != _STRUCTURAL or text[m.start(_STRUCTURAL)] != ":":
+            raise ValueError("Expected ':' at offset {}".format(self.pos))
+        if m.start(_STRUCTURAL) != m.start():
+            self.out.append(text[self.span : m.start()])
+            self.span = m.start(_STRUCTURAL)
+        self.pos = m.end()
+
+    def _punctuation(self, char, start):
+        """
+        Handles separators and the end of containers affected by the schema.
+        :return: False if char opens a value
+        """
+        if char == "{" or char == "[":
+            return False
+
+        frame = self.frame
+        if frame is not None and frame[2] == _AFTER and char == ",":
+            if frame[1]:
+                frame[2] = _KEY
+            else:
+                frame[2] = _VALUE
+                self.state = frame[0]
+            return True
+
+        if (
+            frame is not None
+            and (frame[2] == _AFTER or frame[2] == _OPEN)
+            and char == "}]"[not frame[1]]
+        ):
+            self._close()
+            return True
+
+        raise ValueError("Unexpected '{}' at offset {}".format(char, start))
+
+    def _value(self, m, kind, start):
+        """
+        Value whose first token is m.
+        """
+        text, state, frame = self.text, self.state, self.frame
+        if frame is not None:
+            frame[2] = _AFTER
+
+        if state is _REDACT:
+            self.out.append(text[self.span : start])
+            self.out.append(self.replacement)
+            self.pos = self.span = _skip_value(text, m, self.pos)
+        elif kind == _STRUCTURAL:
+            if state is not None:
+                is_object = text[start] == "{"
+                self.frame = [state, is_object, _OPEN]
+                self.stack.append(self.frame)
+                # The first element of an array
+                self.state = None if is_object else state
+                return
+
+            self.pos, self.span = _copy_container(
+                text, self.pos, self.span, self.out.append
+            )
+        elif kind == _STRING or kind == _NUMBER:
+            self._normalized(start)
+
+        self.state = None
+        self.done = frame is None
+
+
+def _copy_container(text, pos, span, append):
+    """
+    Copies the container opened right before pos, which is not affected by
+    the schema, normalizing only the tokens that are not already canonical.
+    :return: the position after the container and the new span start
+    """
+    stack = [text[pos - 1] == "{"]  # whether each open container is an object
+    is_object = stack[-1]
+    expect = _OPEN
+    match = _TOKEN.match
+
+    while True:
+        if expect == _AFTER:
+            char = text[pos : pos + 1]
+            if char == ",":
+                pos += 1
+                expect = _KEY if is_object else _VALUE
+            elif char == "}]"[not is_object]:
+                pos += 1
+                stack.pop()
+                if not stack:
+                    return pos, span
+                is_object = stack[-1]
+                continue
+
+        if expect == _OPEN or expect == (_KEY if is_object else _VALUE):
+            run = (_OBJECT_RUN if is_object else _ARRAY_RUN).match(text, pos)
+            if run.end() != pos:
+                pos = run.end()
+                if run.lastindex:
+                    _push_opened(text, run.start(1), pos, stack)
+                    is_object = stack[-1]
+                char = text[pos - 1]
+                if char == ",":
+                    expect = _KEY if is_object else _VALUE
+                elif char == "{" or char == "[":
+                    expect = _OPEN
+                else:
+                    expect = _AFTER
+                    continue
+
+        m = match(text, pos)
+        if m is None:
+            # Complete tokens are kept for partial redaction
+            append(text[span:pos])
+            raise ValueError("Invalid JSON at offset {}".format(pos))
+
+        kind = m.lastindex
+        start = m.start(kind)
+        pos = m.end()
+
+        if start != m.start():
+            append(text[span : m.start()])
+            span = start
+
+        if kind == _STRUCTURAL:
+            char = text[start]
+            if char == "," and expect == _AFTER:
+                expect = _KEY if is_object else _VALUE
+            elif char == ":" and expect == _COLON:
+                expect = _VALUE
+            elif (char == "{" or char == "[") and (
+                expect == _VALUE or expect == _OPEN and not is_object
+            ):
+                is_object = char == "{"
+                stack.append(is_object)
+                expect = _OPEN
+            elif char == "}]"[not is_object] and (expect == _AFTER or expect == _OPEN):
+                stack.pop()
+                if not stack:
+                    return pos, span
+                is_object = stack[-1]
+                expect = _AFTER
+            else:
+                append(text[span:start])
+                raise ValueError("Unexpected '{}' at offset {}".format(char, start))
+            continue
+
+        if expect == _VALUE or expect == _OPEN and not is_object:
+            expect = _AFTER
+        elif kind <= _STRING and (expect == _KEY or expect == _OPEN):
+            expect = _COLON
+        else:
+            append(text[span:start])
+            raise ValueError("Unexpected token at offset {}".format(start))
+
+        if kind == _STRING or kind == _NUMBER:
+            append(text[span:start])
+            append(_normalize(text[start:pos]))
+            span = pos
+
+
+def _push_opened(text, start, end, stack):
+    """
+    Pushes the containers opened by the run of tokens text[start:end].
+    """
+    objects = text.count("{", start, end)
+    arrays = text.count("[", start, end)
+    if objects and arrays:
+        stack.extend(char == "{" for char in _OPENER.findall(text, start, end))
+    elif objects or arrays:
+        stack.extend((arrays == 0,) * (objects + arrays))
+
+
+def _skip_value(text, m, pos):
+    """
+    :return: the position right after the value whose first token is m
+    """
+    if m.lastindex != _STRUCTURAL:
+        return pos
+
+    return _copy_container(text, pos, pos, _discard)[0]
+
+
+def _discard(value):
+    pass
@@ -0,0 +1,85 @@
+import re
+
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+def is_literal(pattern):
+    return bool(pattern) and not REGEX_METACHARACTERS.intersection(pattern)
+
+
+def _trie_regex(literals):
+    """
+    Builds a regex equivalent to "|".join(literals) out of a trie, so that
+    re only follows the characters actually shared by the literals instead
+    of trying every alternative at every position.
+    """
+    trie = {}
+
+    for literal in literals:
+        node = trie
+        for char in literal:
+            if "" in node:
+                # An earlier literal is a prefix of this one and always wins
+                break
+            node = node.setdefault(char, {})
+        else:
+            node[""] = True
+
+    # Leftmost-first alternation of literals picks, at any position, the
+    # first listed literal that matches. Once literals shadowed by an
+    # earlier prefix are gone, that is always the longest one, which is
+    # what a greedy trie regex picks.
+    return _node_regex(trie)
+
+
+def _node_regex(node):
+    parts = []
+
+    # Follow single-child chains iteratively, literals can be long
+    while len(node) == 1 and "" not in node:
+        (char, node), = node.items()
+        parts.append(re.escape(char))
+
+    branches = [
+        re.escape(char) + _node_regex(child)
+        for char, child in node.items()
+        if char != ""
+    ]
+
+    if branches:
+        group = (
+            "(?:{})".format("|".join(branches))
+            if len(branches) > 1 or "" in node
+            else branches[0]
+        )
+        if "" in node:
+            group += "?"
+        parts.append(group)
+
+    return "".join(parts)
+
+
+def compile_literals(literals):
+    """
+    Compiles a list of strings into a single regex matching any of them.
+    :return: None if literals is empty
+    """
+    if not literals:
+        return None
+
+    return re.compile(_trie_regex(literals))
+
+
+def compile_patterns(patterns):
+    """
+    Compiles a list of patterns into a single regex matching like
+    "|".join(patterns). Plain literals are compiled as a trie.
+    :return: None if patterns is empty
+    """
+    if not patterns:
+        return None
+
+    if all(is_literal(pattern) for pattern in patterns):
+        return compile_literals(patterns)
+
+    return re.compile("|".join(patterns))
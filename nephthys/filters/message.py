@@ -1,20 +1,50 @@
-import re
-
 from .filter import IFilter
-from .. import LogRecord
+from .matcher import compile_patterns
+from .. import LogRecord, RequestLogRecord
 
 FILTER_STRING = "<filtered>"
 
 
 class MessageBlacklist(IFilter):
-    def __init__(self, blacklist=None):
+    def __init__(self, blacklist=None, filter_bodies=False):
+        """
+        :param blacklist: Patterns replaced with FILTER_STRING, plain strings
+            are matched with a trie instead of a regex alternation
+        :type blacklist: list
+        :param filter_bodies: Whether to also scrub request and response bodies
+        :type filter_bodies: bool
+        """
         self._blacklist = blacklist or []
-        self._blacklist_string = "|".join(self._blacklist)
+        self._matcher = compile_patterns(self._blacklist)
+        self._filter_bodies = filter_bodies
+
+    def _filter_text(self, text, content_type=None):
+        if not isinstance(text, str):
+            return text
+
+        return self._matcher.sub(FILTER_STRING, text)
 
     def filter(self, log_record):
-        if not isinstance(log_record, LogRecord):
+        if not isinstance(log_record, LogRecord) or self._matcher is None:
             return
 
-        log_record._message = re.sub(
-            self._blacklist_string, FILTER_STRING, log_record._message
-        )
+        log_record._message = self._filter_text(log_record._message)
+
+        if self._filter_bodies and isinstance(log_record, RequestLogRecord):
+            if log_record._req_body:
+                log_record._req_body = self._filter_text(log_record._req_body)
+            if log_record._res_body:
+                log_record._res_body = self._filter_text(log_record._res_body)
+
+    def _filter_message(self, log_record):
+        if isinstance(log_record, LogRecord):
+            log_record._message = self._filter_text(log_record._message)
+
+    def compile(self, pipeline):
+        if self._matcher is None:
+            return
+
+        pipeline.add_stage(self._filter_message, barrier=False)
+
+        if self._filter_bodies:
+            pipeline.add_body_filter(self._filter_text)
@@ -1,7 +1,8 @@
-import rapidjson
+import json
 from enum import Enum
 
 from .filter import IFilter
+from .jsonstream import KeyIndex, SchemaAutomaton, redact
 from .. import RequestLogRecord
 
 
@@ -22,6 +23,9 @@ def filter_json_body(s, r):
 
 
 def find_content_type(headers):
+    if headers is None:
+        return ""
+
     return ",".join(headers.getall("Content-Type"))
 
 
@@ -30,6 +34,14 @@ class RequestType(Enum):
     REQUEST = 2
     RESPONSE = 3
 
+    @property
+    def request(self):
+        return self == RequestType.REQUEST or self == RequestType.ALL
+
+    @property
+    def response(self):
+        return self == RequestType.RESPONSE or self == RequestType.ALL
+
 
 class HeaderFilter(IFilter):
     def __init__(self, headers=None, req_type=RequestType.ALL):
@@ -37,10 +49,12 @@ class HeaderFilter(IFilter):
         self._req_type = req_type
 
     def _filter_headers(self, headers):
+        if headers is None:
+            return
+
         for hf in self._headers:
-            hft = hf.title()
-            if hft in headers:
-                headers[hft] = HEADER_FILTERED
+            if hf in headers:
+                headers[hf] = HEADER_FILTERED
 
     def filter(self, log_record):
         if not isinstance(log_record, RequestLogRecord):
@@ -52,12 +66,23 @@ class HeaderFilter(IFilter):
         if self._req_type == RequestType.RESPONSE or self._req_type == RequestType.ALL:
             self._filter_headers(log_record._res_headers)
 
+    def compile(self, pipeline):
+        pipeline.add_header_filter(
+            self._headers,
+            HEADER_FILTERED,
+            request=self._req_type.request,
+            response=self._req_type.response,
+        )
+
 
 class QueryStringFilter(IFilter):
     def __init__(self, keys=None):
         self._keys = keys or []
 
     def _filter_keys(self, keys):
+        if keys is None:
+            return
+
         for kf in self._keys:
             if kf in keys:
                 keys[kf] = QS_FILTERED
@@ -68,14 +93,22 @@ class QueryStringFilter(IFilter):
 
         self._filter_keys(log_record._req_query)
 
+    def compile(self, pipeline):
+        pipeline.add_query_filter(self._keys, QS_FILTERED)
+
 
 class BodyTypeFilter(IFilter):
     def __init__(self, allowed_types=None, req_type=RequestType.ALL):
         self._allowed_types = LOGGABLE_TYPES if allowed_types is None else allowed_types
         self._req_type = req_type
 
+    def is_loggable(self, content_type):
+        return bool(content_type) and any(
+            valid_type in content_type for valid_type in self._allowed_types
+        )
+
     def _filter_body(self, body, content_type):
-        if content_type and any(valid_type in content_type for valid_type in self._allowed_types):
+        if self.is_loggable(content_type):
             return body
 
         return BODY_NOT_LOGGABLE.format(content_type)
@@ -88,23 +121,46 @@ class BodyTypeFilter(IFilter):
             self._req_type == RequestType.REQUEST or self._req_type == RequestType.ALL
         ):
             content_type = find_content_type(log_record._req_headers)
-            log_record._req_body = self._filter_body(
-                log_record._req_body, content_type
-            )
+            log_record._req_body = self._filter_body(log_record._req_body, content_type)
 
         if log_record._res_body and (
             self._req_type == RequestType.RESPONSE or self._req_type == RequestType.ALL
         ):
             content_type = find_content_type(log_record._res_headers)
-            log_record._res_body = self._filter_body(
-                log_record._res_body, content_type
-            )
+            log_record._res_body = self._filter_body(log_record._res_body, content_type)
+
+    def compile(self, pipeline):
+        pipeline.add_body_filter(
+            self._filter_body,
+            request=self._req_type.request,
+            response=self._req_type.response,
+            replaces=True,
+        )
 
 
 class JsonBodyFilter(IFilter):
+    """
+    body_schema maps keys to nested schemas, or to any other value to redact
+    the value at that key. "*" stands for any key and "..key" for key at any
+    depth, arrays are transparent: {"items": {"iban": True}} also redacts
+    {"items": [{"iban": ...}]}. A backslash in front takes the rest of the
+    key literally: "\\*" is the key "*" and "\\..key" the key "..key".
+    Bodies that do not contain any key redacted by body_schema are left
+    untouched, skipped and processed count how many bodies took each path.
+    Bodies truncated when captured are redacted up to the point where they
+    stop being valid JSON, other bodies that are not valid JSON raise
+    ValueError.
+    """
+
     def __init__(self, body_schema, req_type=RequestType.ALL):
         self._body_schema = body_schema or {}
         self._req_type = req_type
+        self._replacement = json.dumps(JSON_BODY_FILTERED)
+        self._automaton = SchemaAutomaton(self._body_schema)
+        self._key_index = KeyIndex(self._body_schema)
+
+        self.skipped = 0
+        self.processed = 0
 
     def filter(self, log_record):
         if not isinstance(log_record, RequestLogRecord):
@@ -114,14 +170,31 @@ class JsonBodyFilter(IFilter):
             self._req_type == RequestType.REQUEST or self._req_type == RequestType.ALL
         ):
             if "application/json" in find_content_type(log_record._req_headers):
-                req_body = rapidjson.loads(log_record._req_body)
-                filter_json_body(self._body_schema, req_body)
-                log_record._req_body = rapidjson.dumps(req_body)
+                log_record._req_body = self._filter_body(
+                    log_record._req_body, truncated=log_record._req_body_truncated
+                )
 
         if log_record._res_body and (
             self._req_type == RequestType.RESPONSE or self._req_type == RequestType.ALL
         ):
             if "application/json" in find_content_type(log_record._res_headers):
-                res_body = rapidjson.loads(log_record._res_body)
-                filter_json_body(self._body_schema, res_body)
-                log_record._res_body = rapidjson.dumps(res_body)
+                log_record._res_body = self._filter_body(
+                    log_record._res_body, truncated=log_record._res_body_truncated
+                )
+
+    def _filter_body(self, body, content_type=None, truncated=False):
+        if not self._key_index.may_match(body):
+            self.skipped += 1
+            return body
+
+        self.processed += 1
+        return redact(body, self._automaton, self._replacement, partial=truncated)
+
+    def compile(self, pipeline):
+        pipeline.add_body_filter(
+            self._filter_body,
+            request=self._req_type.request,
+            response=self._req_type.response,
+            content_type="application/json",
+            truncated=True,
+        )
@@ -0,0 +1,277 @@
+import enum
+import json
+import re
+from math import isfinite
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import rapidjson
+except ImportError:
+    rapidjson = None
+
+
+class JSONBackend:
+    """
+    Serializes log dicts with a JSON library.
+    Every backend renders the same document as rapidjson: compact, or
+    indented with ": " after keys, uppercase unicode escapes, non ASCII
+    characters escaped unless ensure_ascii is False, number keys coerced to
+    strings, NaN and Infinity written as such and Enums that are not ints,
+    strs or floats handed to the default hook like any other object the
+    library can't serialize.
+    """
+
+    name = None
+    module = None
+    # Whether dumpb gets bytes from the library without encoding a str
+    bytes_native = False
+    # Errors on which the document is rendered by StdlibBackend instead
+    fallback_errors = ()
+
+    @classmethod
+    def available(cls):
+        return cls.module is not None
+
+    def supports(self, indent):
+        return True
+
+    def dumps(self, content, default, sort_keys=False, indent=None, ensure_ascii=True):
+        """
+        :param default: Called with objects that can't be serialized,
+            returns a serializable replacement
+        :param ensure_ascii: Whether non ASCII characters are escaped
+        :rtype: str
+        """
+        try:
+            return self._dumps(content, default, sort_keys, indent, ensure_ascii)
+        except self.fallback_errors:
+            return _STDLIB.dumps(content, default, sort_keys, indent, ensure_ascii)
+
+    def dumpb(self, content, default, sort_keys=False, indent=None, ensure_ascii=True):
+        """
+        Same as dumps, encoded in UTF-8.
+        :rtype: bytes
+        """
+        try:
+            return self._dumpb(content, default, sort_keys, indent, ensure_ascii)
+        except self.fallback_errors:
+            return _STDLIB.dumpb(content, default, sort_keys, indent, ensure_ascii)
+
+    def loads(self, text):
+        return self.module.loads(text)
+
+    def _dumps(self, content, default, sort_keys, indent, ensure_ascii):
+        raise NotImplementedError
+
+    def _dumpb(self, content, default, sort_keys, indent, ensure_ascii):
+        # Lone surrogates end up as \u escapes, which are valid in JSON strings
+        return self._dumps(content, default, sort_keys, indent, ensure_ascii).encode(
+            "utf-8", "backslashreplace"
+        )
+
+
+# Escapes written differently from rapidjson, which writes unicode escapes in
+# uppercase, does not escape DEL and escapes characters beyond the BMP as
+# surrogate pairs
+_ESCAPE = re.compile(r"\\(?:u([0-9a-f]{4})|.)")
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_NON_ASCII_BYTES = re.compile(rb"[\x80-\xff]")
+
+
+def _rapidjson_escape(match):
+    code = match.group(1)
+    if code is None:
+        return match.group(0)
+    if code == "007f":
+        return "\x7f"
+    return "\\u" + code.upper()
+
+
+def _ascii_escape(match):
+    code = ord(match.group(0))
+    if code > 0xFFFF:
+        code -= 0x10000
+        return "\\u{:04X}\\u{:04X}".format(0xD800 | code >> 10, 0xDC00 | code & 0x3FF)
+    return "\\u{:04X}".format(code)
+
+
+def _rapidjson_escapes(text):
+    if "\\u" in text:
+        return _ESCAPE.sub(_rapidjson_escape, text)
+    return text
+
+
+class StdlibBackend(JSONBackend):
+    name = "json"
+    module = json
+
+    def _dumps(self, content, default, sort_keys, indent, ensure_ascii):
+        text = json.dumps(
+            content,
+            default=default,
+            sort_keys=sort_keys,
+            indent=indent,
+            ensure_ascii=ensure_ascii,
+            separators=(",", ": ") if indent is not None else (",", ":"),
+        )
+        return _rapidjson_escapes(text)
+
+
+class RapidjsonBackend(JSONBackend):
+    name = "rapidjson"
+    module = rapidjson
+    # Lone surrogates
+    fallback_errors = (UnicodeEncodeError,)
+
+    def _dumps(self, content, default, sort_keys, indent, ensure_ascii):
+        return rapidjson.dumps(
+            content,
+            default=default,
+            sort_keys=sort_keys,
+            indent=indent,
+            ensure_ascii=ensure_ascii,
+            mapping_mode=rapidjson.MM_COERCE_KEYS_TO_STRINGS,
+        )
+
+
+class _NonFiniteFloat(Exception):
+    pass
+
+
+_SCALARS = frozenset((str, int, bool, type(None)))
+
+
+def _orjson_content(value, default):
+    """
+    :return: value with the Enums orjson would write as their value
+        replaced by default's result, copying only the containers holding
+        any
+    :raise _NonFiniteFloat: on NaN or infinite floats, which orjson writes
+        as null
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    elif value.__class__ is float:
+        if not isfinite(value):
+            raise _NonFiniteFloat
+        return value
+    elif isinstance(value, enum.Enum) and not isinstance(value, (int, str, float)):
+        return default(value)
+    else:
+        return value
+
+    copy = None
+    for key, item in items:
+        cls = item.__class__
+        # Most values are scalars, checked without a call
+        if cls in _SCALARS:
+            continue
+        if cls is float:
+            if not isfinite(item):
+                raise _NonFiniteFloat
+            continue
+
+        new_item = _orjson_content(item, default)
+        if new_item is not item:
+            if copy is None:
+                copy = dict(value) if isinstance(value, dict) else list(value)
+            copy[key] = new_item
+    return value if copy is None else copy
+
+
+class OrjsonBackend(JSONBackend):
+    name = "orjson"
+    module = orjson
+    bytes_native = True
+    # orjson.JSONEncodeError: integers over 64 bits, lone surrogates
+    fallback_errors = (TypeError, _NonFiniteFloat)
+
+    def __init__(self):
+        # datetimes and dataclasses are handed to default, as by the other libraries
+        self._option = (
+            orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+
+    def supports(self, indent):
+        return indent is None or indent == 2
+
+    def _dumps(self, content, default, sort_keys, indent, ensure_ascii):
+        return self._dumpb(content, default, sort_keys, indent, ensure_ascii).decode(
+            "utf-8"
+        )
+
+    def _dumpb(self, content, default, sort_keys, indent, ensure_ascii):
+        option = self._option
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent is not None:
+            option |= orjson.OPT_INDENT_2
+        # orjson has no option to hand Enums to default
+        data = orjson.dumps(
+            _orjson_content(content, default), default=default, option=option
+        )
+
+        # orjson always writes UTF-8, and control characters in lowercase \u
+        # escapes: documents needing either are rewritten
+        non_ascii = ensure_ascii and _NON_ASCII_BYTES.search(data) is not None
+        if not non_ascii and b"\\u" not in data:
+            return data
+
+        text = _rapidjson_escapes(data.decode("utf-8"))
+        if non_ascii:
+            text = _NON_ASCII.sub(_ascii_escape, text)
+        return text.encode("utf-8")
+
+
+# In order of preference. orjson comes after rapidjson as looking for
+# Enums and non finite floats in Python makes it slower on log records.
+BACKENDS = (RapidjsonBackend, OrjsonBackend, StdlibBackend)
+
+_STDLIB = StdlibBackend()
+_instances = {}
+
+
+def available_backends():
+    """
+    :return: names of the installed backends, fastest first
+    """
+    return [backend.name for backend in BACKENDS if backend.available()]
+
+
+def get_backend(name=None, indent=None):
+    """
+    :param name: Name of the backend, defaults to the fastest installed one
+        that supports indent
+    :param indent: Indentation the backend will be used with
+    :rtype: JSONBackend
+    """
+    for backend in BACKENDS:
+        if name is not None and backend.name != name:
+            continue
+        if not backend.available():
+            if name is not None:
+                raise ValueError("JSON backend {} is not installed".format(name))
+            continue
+
+        instance = _instances.get(backend)
+        if instance is None:
+            instance = _instances[backend] = backend()
+
+        if instance.supports(indent):
+            return instance
+        if name is not None:
+            raise ValueError(
+                "JSON backend {} does not support indent {}".format(name, indent)
+            )
+
+    if name is not None:
+        raise ValueError("Unknown JSON backend {}".format(name))
+    return _STDLIB
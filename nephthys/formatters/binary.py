@@ -0,0 +1,429 @@
+"""
+Compact binary encoding of log records.
+
+A stream is a sequence of frames, each one a LEB128 varint length followed
+by a flags byte and a MessagePack value: the dict JSONFormatter would
+render. Map keys go through a per-stream key dictionary: a key is written
+once as an ext of type KEY_DEFINITION, which gives it the next index, and
+then as that positive integer. Integers beyond 64 bits are written as an
+ext of type BIG_INTEGER holding their decimal digits.
+Frames flagged RESET clear the dictionary before being decoded, streams
+start with one and then one every reset_every records, so that reading can
+start at any of them.
+"""
+import struct
+import sys
+import threading
+
+from .json import JSONFormatter, JSONRenderer
+
+RESET = 1
+
+KEY_DEFINITION = 0
+BIG_INTEGER = 1
+
+_pack_double = struct.Struct(">d").pack
+_unpack_double = struct.Struct(">d").unpack_from
+_INT_FORMATS = (
+    (0, 0xFF, 0xCC, ">B"),
+    (0, 0xFFFF, 0xCD, ">H"),
+    (0, 0xFFFFFFFF, 0xCE, ">I"),
+    (0, 0xFFFFFFFFFFFFFFFF, 0xCF, ">Q"),
+    (-0x80, 0x7F, 0xD0, ">b"),
+    (-0x8000, 0x7FFF, 0xD1, ">h"),
+    (-0x80000000, 0x7FFFFFFF, 0xD2, ">i"),
+    (-0x8000000000000000, 0x7FFFFFFFFFFFFFFF, 0xD3, ">q"),
+)
+
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _json_key(key):
+    # The keys json.dumps would write
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    return str(key)
+
+
+class BinaryEncoder:
+    """
+    Encodes values into frames of a stream, keeping its key dictionary.
+    Frames must be written in the order they are encoded.
+    """
+
+    def __init__(self, default=str, reset_every=1024, max_keys=1024):
+        """
+        :param default: Called with objects that can't be encoded, returns
+            an encodable replacement
+        :param reset_every: Number of frames between dictionary resets
+        :type reset_every: int
+        :param max_keys: Size of the dictionary, further keys are written
+            as strings every time
+        :type max_keys: int
+        """
+        self._default = default
+        self._reset_every = reset_every
+        self._max_keys = max_keys
+        self._keys = {}
+        # Keys defined by the frame being encoded
+        self._added = []
+        self._frames = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Makes the next frame a RESET one.
+        """
+        with self._lock:
+            self._frames = 0
+
+    def encode_frame(self, value):
+        """
+        The dictionary is left as it was if encoding raises, e.g. from
+        default, as the frame is never written.
+        :rtype: bytes
+        """
+        with self._lock:
+            frames = self._frames
+            flags = 0
+            if frames % self._reset_every == 0:
+                self._keys.clear()
+                flags = RESET
+            self._frames += 1
+
+            out = bytearray((flags,))
+            del self._added[:]
+            try:
+                self._encode(value, out)
+            except BaseException:
+                # Keys get consecutive indexes: the ones of this frame are
+                # the last ones
+                for key in self._added:
+                    del self._keys[key]
+                # A failed RESET frame leaves the next one to reset
+                self._frames = frames
+                raise
+
+        return _varint(len(out)) + out
+
+    def _encode(self, value, out):
+        cls = value.__class__
+
+        if cls is str:
+            self._encode_str(value, out)
+        elif value is None:
+            out.append(0xC0)
+        elif cls is bool:
+            out.append(0xC3 if value else 0xC2)
+        elif cls is int:
+            self._encode_int(value, out)
+        elif cls is float:
+            out.append(0xCB)
+            out += _pack_double(value)
+        elif cls is dict:
+            self._encode_header(len(value), 0x80, 0xDE, out)
+            for key, item in value.items():
+                self._encode_key(key if key.__class__ is str else _json_key(key), out)
+                self._encode(item, out)
+        elif cls is list or cls is tuple:
+            self._encode_header(len(value), 0x90, 0xDC, out)
+            for item in value:
+                self._encode(item, out)
+        # Subclasses are encoded as their base type, as json.dumps does
+        elif isinstance(value, str):
+            self._encode_str(str.__str__(value), out)
+        elif isinstance(value, int):
+            self._encode_int(int(value), out)
+        elif isinstance(value, float):
+            self._encode(float(value), out)
+        elif isinstance(value, dict):
+            self._encode(dict(value), out)
+        elif isinstance(value, (list, tuple)):
+            self._encode(list(value), out)
+        else:
+            self._encode(self._default(value), out)
+
+    def _encode_str(self, value, out):
+        data = value.encode("utf-8", "surrogatepass")
+        size = len(data)
+        if size < 32:
+            out.append(0xA0 | size)
+        elif size <= 0xFF:
+            out.append(0xD9)
+            out.append(size)
+        elif size <= 0xFFFF:
+            out.append(0xDA)
+            out += struct.pack(">H", size)
+        else:
+            out.append(0xDB)
+            out += struct.pack(">I", size)
+        out += data
+
+    def _encode_int(self, value, out):
+        if 0 <= value < 0x80:
+            out.append(value)
+            return
+        if -32 <= value < 0:
+            out.append(value & 0xFF)
+            return
+
+        for low, high, code, fmt in _INT_FORMATS:
+            if low <= value <= high:
+                out.append(code)
+                out += struct.pack(fmt, value)
+                return
+
+        self._encode_ext(BIG_INTEGER, str(value).encode("ascii"), out)
+
+    @staticmethod
+    def _encode_header(size, fix, code16, out):
+        if size < 16:
+            out.append(fix | size)
+        elif size <= 0xFFFF:
+            out.append(code16)
+            out += struct.pack(">H", size)
+        else:
+            out.append(code16 + 1)
+            out += struct.pack(">I", size)
+
+    @staticmethod
+    def _encode_ext(ext_type, data, out):
+        size = len(data)
+        if size <= 0xFF:
+            out.append(0xC7)
+            out.append(size)
+        elif size <= 0xFFFF:
+            out.append(0xC8)
+            out += struct.pack(">H", size)
+        else:
+            out.append(0xC9)
+            out += struct.pack(">I", size)
+        out.append(ext_type)
+        out += data
+
+    def _encode_key(self, key, out):
+        keys = self._keys
+        index = keys.get(key)
+        if index is not None:
+            self._encode_int(index, out)
+        elif len(keys) < self._max_keys:
+            keys[key] = len(keys)
+            self._added.append(key)
+            self._encode_ext(KEY_DEFINITION, key.encode("utf-8", "surrogatepass"), out)
+        else:
+            self._encode_str(key, out)
+
+
+class BinaryReader:
+    """
+    Decodes the frames of a stream, possibly split over several files read
+    in order, e.g. rotated ones from the oldest.
+    Frames before the first RESET one can't be decoded and are skipped.
+    """
+
+    def __init__(self):
+        self._keys = None
+        self.skipped = 0
+
+    def read(self, fp):
+        """
+        :param fp: Binary file object
+        :return: iterator over the decoded values
+        """
+        read = fp.read
+        while True:
+            size, shift = 0, 0
+            while True:
+                byte = read(1)
+                if not byte:
+                    if shift:
+                        raise ValueError("Truncated frame length")
+                    return
+                size |= (byte[0] & 0x7F) << shift
+                shift += 7
+                if not byte[0] & 0x80:
+                    break
+
+            frame = read(size)
+            if not size or len(frame) < size:
+                raise ValueError("Truncated frame")
+
+            if frame[0] & RESET:
+                self._keys = []
+            elif self._keys is None:
+                self.skipped += 1
+                continue
+
+            value, pos = self._decode(frame, 1)
+            if pos != size:
+                raise ValueError("Trailing data in frame")
+            yield value
+
+    def _decode(self, data, pos):
+        code = data[pos]
+        pos += 1
+
+        if code < 0x80:
+            return code, pos
+        if code >= 0xE0:
+            return code - 0x100, pos
+        if 0xA0 <= code <= 0xBF:
+            end = pos + (code & 0x1F)
+            return data[pos:end].decode("utf-8", "surrogatepass"), end
+        if 0x80 <= code <= 0x8F:
+            return self._decode_map(data, pos, code & 0x0F)
+        if 0x90 <= code <= 0x9F:
+            return self._decode_array(data, pos, code & 0x0F)
+
+        if code == 0xC0:
+            return None, pos
+        if code == 0xC2:
+            return False, pos
+        if code == 0xC3:
+            return True, pos
+        if code == 0xCB:
+            return _unpack_double(data, pos)[0], pos + 8
+        if 0xCC <= code <= 0xD3:
+            fmt = _INT_FORMATS[code - 0xCC][3]
+            return struct.unpack_from(fmt, data, pos)[0], pos + struct.calcsize(fmt)
+        if 0xD9 <= code <= 0xDB:
+            size, pos = self._size(data, pos, code - 0xD9)
+            return data[pos : pos + size].decode("utf-8", "surrogatepass"), pos + size
+        if code in (0xDC, 0xDD):
+            size, pos = self._size(data, pos, code - 0xDC + 1)
+            return self._decode_array(data, pos, size)
+        if code in (0xDE, 0xDF):
+            size, pos = self._size(data, pos, code - 0xDE + 1)
+            return self._decode_map(data, pos, size)
+        if 0xC7 <= code <= 0xC9:
+            size, pos = self._size(data, pos, code - 0xC7)
+            ext_type = data[pos]
+            pos += 1
+            return self._decode_ext(ext_type, data[pos : pos + size]), pos + size
+
+        raise ValueError("Unsupported type 0x{:02x} at offset {}".format(code, pos - 1))
+
+    @staticmethod
+    def _size(data, pos, width):
+        if width == 0:
+            return data[pos], pos + 1
+        if width == 1:
+            return struct.unpack_from(">H", data, pos)[0], pos + 2
+        return struct.unpack_from(">I", data, pos)[0], pos + 4
+
+    def _decode_ext(self, ext_type, data):
+        if ext_type == KEY_DEFINITION:
+            key = data.decode("utf-8", "surrogatepass")
+            self._keys.append(key)
+            return key
+        if ext_type == BIG_INTEGER:
+            return int(data.decode("ascii"))
+        raise ValueError("Unsupported ext type {}".format(ext_type))
+
+    def _decode_array(self, data, pos, size):
+        items = []
+        for _ in range(size):
+            item, pos = self._decode(data, pos)
+            items.append(item)
+        return items, pos
+
+    def _decode_map(self, data, pos, size):
+        items = {}
+        keys = self._keys
+        for _ in range(size):
+            key, pos = self._decode(data, pos)
+            if key.__class__ is int:
+                key = keys[key]
+            items[key], pos = self._decode(data, pos)
+        return items, pos
+
+
+class BinaryFormatter(JSONFormatter):
+    """
+    Formatter encoding the dict JSONFormatter renders as a frame of a binary
+    stream, to be written by a handler calling format_bytes such as
+    nephthys.handlers.BatchFileHandler.
+    Frames are binary and length-prefixed: format raises TypeError, as
+    handlers writing text add a terminator that breaks the stream.
+    """
+
+    # Frames depend on the previous ones: handlers must write them in the
+    # order they are formatted
+    stateful = True
+    # Frames are length-prefixed
+    record_separator = b""
+
+    def __init__(self, *args, **kwargs):
+        reset_every = kwargs.pop("reset_every", 1024)
+        max_keys = kwargs.pop("max_keys", 1024)
+        super().__init__(*args, **kwargs)
+
+        self._encoder = BinaryEncoder(self._renderer.default, reset_every, max_keys)
+
+    def reset(self):
+        """
+        Makes the next frame a RESET one, as handlers do for the first
+        record of a new file.
+        """
+        self._encoder.reset()
+
+    def format(self, record):
+        raise TypeError(
+            "BinaryFormatter needs a handler calling format_bytes, e.g. BatchFileHandler"
+        )
+
+    def format_bytes(self, record):
+        return self._format(record, self._encoder.encode_frame)
+
+
+def to_json_lines(sources, out, renderer=None):
+    """
+    Converts binary streams back to JSON Lines.
+    :param sources: Binary file objects of one stream, in order
+    :param out: Text file object
+    :type renderer: nephthys.formatters.json.JSONRenderer
+    :return: the BinaryReader used, e.g. for its skipped count
+    """
+    renderer = renderer or JSONRenderer()
+    reader = BinaryReader()
+    for source in sources:
+        for value in reader.read(source):
+            out.write(renderer(value))
+            out.write("\n")
+    return reader
+
+
+def main(argv=None):
+    """
+    python -m nephthys.formatters.binary FILE [FILE ...] > records.jsonl
+    """
+    paths = (argv if argv is not None else sys.argv[1:]) or ["-"]
+    sources = []
+    try:
+        for path in paths:
+            sources.append(sys.stdin.buffer if path == "-" else open(path, "rb"))
+        reader = to_json_lines(sources, sys.stdout)
+    finally:
+        for source in sources:
+            if source is not sys.stdin.buffer:
+                source.close()
+
+    if reader.skipped:
+        sys.stderr.write(
+            "Skipped {} frames before the first reset\n".format(reader.skipped)
+        )
+
+
+if __name__ == "__main__":
+    main()
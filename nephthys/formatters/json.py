@@ -1,36 +1,68 @@
 import logging
-import rapidjson
 import re
 
+from .backends import JSONBackend, get_backend
+from .timestamp import ISOTimeMixin, ISOTimestamp
+
 
 class JSONRenderer:
-    def __init__(self, sort_keys=False, indent=None):
+    def __init__(self, sort_keys=False, indent=None, backend=None, ensure_ascii=True):
+        """
+        :param backend: JSONBackend, or the name of one, defaults to the
+            fastest installed library supporting indent
+        :param ensure_ascii: Whether non ASCII characters are escaped,
+            otherwise they are written as is, e.g. for UTF-8 output
+        :type ensure_ascii: bool
+        """
         self._sort_keys = sort_keys
         self._indent = indent
+        self._ensure_ascii = ensure_ascii
+        if not isinstance(backend, JSONBackend):
+            backend = get_backend(backend, indent)
+        self.backend = backend
 
     def __call__(self, content):
-        return rapidjson.dumps(
-            content,
-            default=self.default,
-            sort_keys=self._sort_keys,
-            indent=self._indent,
+        return self.backend.dumps(
+            content, self.default, self._sort_keys, self._indent, self._ensure_ascii
+        )
+
+    def render_bytes(self, content):
+        """
+        Same as calling the renderer, UTF-8 encoded. Backends producing
+        bytes natively skip decoding and encoding a str.
+        """
+        return self.backend.dumpb(
+            content, self.default, self._sort_keys, self._indent, self._ensure_ascii
         )
 
     def default(self, content):
+        # bytes are written as text, as rapidjson does natively
+        if isinstance(content, (bytes, bytearray)):
+            return content.decode("utf-8")
         return str(content)
 
 
-class JSONFormatter(logging.Formatter):
+class JSONFormatter(ISOTimeMixin, logging.Formatter):
     def __init__(self, *args, **kwargs):
         self.render_exc = kwargs.pop("render_exc", True)
+        if kwargs.pop("iso_time", False):
+            self._iso_timestamp = ISOTimestamp()
 
         sort_keys = kwargs.pop("json_sort_keys", False)
         indent = kwargs.pop("json_indent", None)
+        backend = kwargs.pop("json_backend", None)
+        ensure_ascii = kwargs.pop("json_ensure_ascii", True)
 
         super().__init__(*args, **kwargs)
 
-        self._renderer = JSONRenderer(indent=indent, sort_keys=sort_keys)
+        self._renderer = JSONRenderer(
+            indent=indent,
+            sort_keys=sort_keys,
+            backend=backend,
+            ensure_ascii=ensure_ascii,
+        )
         self._required_fields = self._parse()
+        self._uses_asctime = "asctime" in self._required_fields
 
     def _parse(self):
         """
@@ -51,12 +83,25 @@ class JSONFormatter(logging.Formatter):
 
     def format(self, record):
         """Formats a log record and serializes to json"""
+        return self._format(record, self._renderer)
+
+    def format_bytes(self, record):
+        """
+        Same as format, UTF-8 encoded. Backends producing bytes natively
+        skip decoding and encoding a str.
+        """
+        return self._format(record, self._renderer.render_bytes)
+
+    def _format(self, record, render):
         message_dict = {}
         if isinstance(record.msg, dict):
             message_dict = record.msg
         else:
             record.message = record.getMessage()
 
+        if self._uses_asctime:
+            record.asctime = self.formatTime(record, self.datefmt)
+
         if self.render_exc:
             # Display formatted exception, but allow overriding it in the
             # user-supplied dict.
@@ -74,4 +119,4 @@ class JSONFormatter(logging.Formatter):
 
         self._add_fields(log_record, record, message_dict)
 
-        return self._renderer(log_record)
+        return render(log_record)
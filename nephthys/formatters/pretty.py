@@ -1,13 +1,23 @@
 import logging
 import copy
 from .json import JSONRenderer
+from .timestamp import ISOTimeMixin, ISOTimestamp
 
 
-class PrettyFormatter(logging.Formatter):
+class PrettyFormatter(ISOTimeMixin, logging.Formatter):
     def __init__(self, *args, **kwargs):
+        if kwargs.pop("iso_time", False):
+            self._iso_timestamp = ISOTimestamp()
         sort_keys = kwargs.pop("json_sort_keys", True)
         indent = kwargs.pop("json_indent", 2)
-        self._renderer = JSONRenderer(indent=indent, sort_keys=sort_keys)
+        backend = kwargs.pop("json_backend", None)
+        ensure_ascii = kwargs.pop("json_ensure_ascii", True)
+        self._renderer = JSONRenderer(
+            indent=indent,
+            sort_keys=sort_keys,
+            backend=backend,
+            ensure_ascii=ensure_ascii,
+        )
 
         super().__init__(*args, **kwargs)
 
@@ -0,0 +1,45 @@
+import time
+
+ISO_SECOND_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class ISOTimestamp:
+    """
+    Renders record creation times as ISO-8601 UTC timestamps with
+    milliseconds, e.g. 2019-01-31T12:00:00.123Z.
+    The formatted second is cached, strftime only runs once per second of
+    records instead of once per record.
+    """
+
+    def __init__(self):
+        self._cache = (None, None)
+
+    def __call__(self, created, msecs=None):
+        """
+        :param created: Seconds since the epoch, as in LogRecord.created
+        :param msecs: Milliseconds part, computed from created when None
+        """
+        second = int(created)
+        cached_second, prefix = self._cache
+        if second != cached_second:
+            prefix = time.strftime(ISO_SECOND_FORMAT, time.gmtime(second))
+            # A single tuple is swapped so threads never see a mixed state
+            self._cache = (second, prefix)
+
+        if msecs is None:
+            msecs = (created - second) * 1000
+        return "%s.%03dZ" % (prefix, msecs)
+
+
+class ISOTimeMixin:
+    """
+    Makes logging.Formatter.formatTime render ISO-8601 UTC timestamps through
+    an ISOTimestamp when no datefmt is given.
+    """
+
+    _iso_timestamp = None
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt is None and self._iso_timestamp is not None:
+            return self._iso_timestamp(record.created, record.msecs)
+        return super().formatTime(record, datefmt)
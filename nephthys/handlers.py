@@ -0,0 +1,283 @@
+import gzip
+import logging
+import os
+import shutil
+import threading
+
+from .dispatch import FullPolicy, LogDispatcher
+from .periodic import PeriodicFlusher, _report_error
+
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+
+
+def _write_all(fd, chunks, size):
+    """
+    Writes chunks with a single writev, or a single write of their
+    concatenation where writev is not available.
+    """
+    if hasattr(os, "writev") and len(chunks) <= _IOV_MAX:
+        written = os.writev(fd, chunks)
+        if written == size:
+            return
+        data = memoryview(b"".join(chunks))[written:]
+    else:
+        data = memoryview(b"".join(chunks))
+
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+class BatchFileHandler(logging.Handler):
+    """
+    Handler appending formatted records to a file, one per line as JSON Lines
+    with a JSONFormatter. Records are formatted on the logging thread and
+    buffered, a background flusher writes the buffer every flush_interval
+    seconds or as soon as it holds buffer_size bytes, with one system call.
+    Pending records are written when the interpreter exits.
+    With max_bytes and backup_count the file is rotated as RotatingFileHandler
+    does, backups are gzip compressed on a LogDispatcher worker thread.
+    With stateful formatters files are rotated before the record that would
+    exceed max_bytes, whose frame is encoded after the formatter's reset so
+    that every file can be read on its own.
+    The file must not be written by several processes.
+    """
+
+    def __init__(
+        self,
+        filename,
+        buffer_size=64 * 1024,
+        flush_interval=1.0,
+        max_bytes=0,
+        backup_count=0,
+        compress=True,
+        encoding="utf-8",
+        level=logging.NOTSET,
+    ):
+        """
+        :param buffer_size: Buffered bytes waking the flusher up
+        :type buffer_size: int
+        :param flush_interval: Maximum seconds a record waits to be written
+        :type flush_interval: float
+        :param max_bytes: Size the file is rotated at, 0 never rotates
+        :type max_bytes: int
+        :param backup_count: Number of rotated files kept, 0 never rotates
+        :type backup_count: int
+        :param compress: Whether rotated files are gzip compressed
+        :type compress: bool
+        :param encoding: Encoding of the records of formatters without
+            format_bytes
+        :type encoding: string
+        """
+        super().__init__(level=level)
+
+        self.baseFilename = os.path.abspath(os.fspath(filename))
+        self._buffer_size = buffer_size
+        # Callers write the buffer themselves past it, when the flusher lags
+        self._max_pending = 4 * buffer_size
+        self._flush_interval = flush_interval
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._compress = compress
+        self._encoding = encoding
+        self._compressor = LogDispatcher(queue_size=0, full_policy=FullPolicy.BLOCK)
+        self._rotations = 0
+        self._closed = False
+
+        self._fd = None
+        self._file_size = 0
+        self._open()
+        self._reset()
+
+        self._flusher = PeriodicFlusher(
+            self._write_pending,
+            flush_interval,
+            "nephthys-file-flusher",
+            on_exit=self.close,
+            on_fork=self._reset,
+        )
+
+    def _reset(self):
+        # Records buffered by the parent of a forked child are the parent's
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._chunks = []
+        self._size = 0
+        # Indexes of the chunks starting a new file
+        self._breaks = []
+        # Size of the last file once the buffer is written
+        self._planned_size = self._file_size
+
+    def _open(self):
+        self._fd = os.open(
+            self.baseFilename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        self._file_size = os.fstat(self._fd).st_size
+
+    def _encode(self, record):
+        format_bytes = getattr(self.formatter, "format_bytes", None)
+        if format_bytes is not None:
+            return format_bytes(record) + getattr(
+                self.formatter, "record_separator", b"\n"
+            )
+        return (self.format(record) + "\n").encode(self._encoding, "backslashreplace")
+
+    def emit(self, record):
+        self._flusher.start()
+
+        try:
+            if getattr(self.formatter, "stateful", False):
+                # Frames are buffered in the order they are encoded
+                with self._buffer_lock:
+                    data = self._encode(record)
+                    if self._should_rotate(self._planned_size, len(data)):
+                        self.formatter.reset()
+                        data = self._encode(record)
+                        self._breaks.append(len(self._chunks))
+                        self._planned_size = 0
+                    previous = self._append(data)
+            else:
+                data = self._encode(record)
+                with self._buffer_lock:
+                    previous = self._append(data)
+        except Exception:
+            self.handleError(record)
+            return
+
+        size = previous + len(data)
+
+        if self._closed:
+            self._write_pending()
+        elif size >= self._max_pending:
+            self._write_pending()
+        elif previous < self._buffer_size <= size:
+            # Only the record filling the buffer wakes the flusher up
+            self._flusher.wake()
+
+    def _append(self, data):
+        self._chunks.append(data)
+        self._planned_size += len(data)
+        previous = self._size
+        self._size = previous + len(data)
+        return previous
+
+    def _take(self):
+        with self._buffer_lock:
+            chunks, size, breaks = self._chunks, self._size, self._breaks
+            self._chunks = []
+            self._size = 0
+            self._breaks = []
+        return chunks, size, breaks
+
+    def _write_pending(self):
+        # Buffers are taken under the write lock so they are written in order
+        with self._write_lock:
+            chunks, size, breaks = self._take()
+            if not chunks:
+                return
+
+            if self._fd is None:
+                self._open()
+
+            if breaks:
+                # Files start where the records were encoded for
+                start = 0
+                for end in breaks:
+                    self._write(chunks[start:end])
+                    self._rotate()
+                    start = end
+                self._write(chunks[start:])
+            else:
+                if not getattr(
+                    self.formatter, "stateful", False
+                ) and self._should_rotate(self._file_size, size):
+                    self._rotate()
+                _write_all(self._fd, chunks, size)
+                self._file_size += size
+
+            if self._closed:
+                # Nothing closes the file again once the handler is closed
+                os.close(self._fd)
+                self._fd = None
+
+    def _write(self, chunks):
+        size = sum(len(chunk) for chunk in chunks)
+        if size:
+            _write_all(self._fd, chunks, size)
+            self._file_size += size
+
+    def _should_rotate(self, file_size, size):
+        if self._max_bytes <= 0 or self._backup_count <= 0:
+            return False
+        # A batch larger than max_bytes still goes to a file of its own
+        return file_size > 0 and file_size + size > self._max_bytes
+
+    def _backup_name(self, index):
+        name = "{}.{}".format(self.baseFilename, index)
+        return name + ".gz" if self._compress else name
+
+    def _rotate(self):
+        """
+        Moves the file aside and reopens it, the backups are shifted and
+        compressed on the compressor thread.
+        """
+        os.close(self._fd)
+        self._fd = None
+
+        self._rotations += 1
+        rotated = "{}.rotating-{}-{}".format(
+            self.baseFilename, os.getpid(), self._rotations
+        )
+        os.replace(self.baseFilename, rotated)
+        self._open()
+
+        if not self._compressor.submit(self._archive, rotated):
+            self._archive(rotated)
+
+    def _archive(self, rotated):
+        for index in range(self._backup_count - 1, 0, -1):
+            source = self._backup_name(index)
+            if os.path.exists(source):
+                os.replace(source, self._backup_name(index + 1))
+
+        target = self._backup_name(1)
+        if not self._compress:
+            os.replace(rotated, target)
+            return
+
+        # Readers never see a partially compressed backup
+        partial = target + ".tmp"
+        with open(rotated, "rb") as source, gzip.open(partial, "wb") as dest:
+            shutil.copyfileobj(source, dest)
+        os.replace(partial, target)
+        os.remove(rotated)
+
+    def flush(self):
+        """
+        Writes the buffered records.
+        """
+        try:
+            self._write_pending()
+        except Exception:
+            _report_error("BatchFileHandler")
+
+    def close(self, timeout=None):
+        """
+        Writes the buffered records, waits for pending compressions and
+        closes the file. Records emitted afterwards are written right away,
+        the file being opened and closed again for each of them.
+        """
+        self._closed = True
+        self._flusher.close(timeout)
+
+        self.flush()
+        self._compressor.close(timeout)
+
+        with self._write_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+        super().close()
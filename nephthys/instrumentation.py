@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+
+from .clock import perf_counter_ns
+
+# Without the indirection of clock.perf_counter_ns where available
+_now = getattr(time, "perf_counter_ns", perf_counter_ns)
+
+STATS_MESSAGE = "nephthys stats"
+
+
+class _Timer:
+    __slots__ = ("calls", "errors", "total_ns", "max_ns", "last_error")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.last_error = None
+
+    def asdict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": self.total_ns / 10 ** 6,
+            "max_ms": self.max_ns / 10 ** 6,
+            "avg_ms": self.total_ns / self.calls / 10 ** 6 if self.calls else None,
+            "last_error": self.last_error,
+        }
+
+
+class Instrumentation:
+    """
+    Counts calls, exceptions, cumulative and maximum time of the filters and
+    processing phases of a FilterLoggerAdapter it is given to:
+    filter.<index>.<filter class> for each filter, log_filter.<index>.<filter
+    class> for the filters of FilterableLogs and phase.<name> for
+    phase.filters, phase.asdict, phase.log (the whole logging call) and
+    phase.format once instrument_formatter is called.
+    Calls are those of the filter's stages in the pipeline, filters whose
+    stages are merged are timed together under their names joined by "+".
+    With emit_interval, the stats are logged as their own record by the
+    adapter's logger at most every emit_interval seconds.
+    """
+
+    def __init__(self, emit_interval=None, level=logging.INFO, clock=time.monotonic):
+        """
+        :param emit_interval: Seconds between stats records, None never logs them
+        :type emit_interval: float
+        :param level: Level of the stats records
+        :type level: int
+        """
+        self.level = level
+        self._emit_interval = emit_interval
+        self._clock = clock
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._next_emit = None if emit_interval is None else clock() + emit_interval
+
+    def timer(self, name):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = _Timer()
+            return timer
+
+    def add(self, timer, elapsed_ns, error=None):
+        with self._lock:
+            timer.calls += 1
+            timer.total_ns += elapsed_ns
+            if elapsed_ns > timer.max_ns:
+                timer.max_ns = elapsed_ns
+            if error is not None:
+                timer.errors += 1
+                timer.last_error = repr(error)
+
+    def wrap(self, name, func):
+        """
+        :return: func timed under name
+        """
+        timer = self.timer(name)
+
+        def timed(*args, **kwargs):
+            start = _now()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as exc:
+                self.add(timer, _now() - start, exc)
+                raise
+            self.add(timer, _now() - start)
+            return result
+
+        return timed
+
+    def instrument_formatter(self, formatter):
+        """
+        Times format, and format_bytes if any, of formatter under phase.format.
+        :type formatter: logging.Formatter
+        :return: formatter
+        """
+        formatter.format = self.wrap("phase.format", formatter.format)
+        format_bytes = getattr(formatter, "format_bytes", None)
+        if format_bytes is not None:
+            formatter.format_bytes = self.wrap("phase.format", format_bytes)
+        return formatter
+
+    def stats(self):
+        """
+        :return: dict of the stats of each filter and phase called so far,
+            by name
+        """
+        with self._lock:
+            return {
+                name: timer.asdict()
+                for name, timer in self._timers.items()
+                if timer.calls
+            }
+
+    def reset(self):
+        with self._lock:
+            # Timers are held by the stages and wrappers timing into them
+            for timer in self._timers.values():
+                timer.__init__()
+
+    def due(self):
+        """
+        :return: whether the stats have to be logged now
+        """
+        if self._next_emit is None:
+            return False
+
+        now = self._clock()
+        if now < self._next_emit:
+            return False
+        with self._lock:
+            if now < self._next_emit:
+                return False
+            self._next_emit = now + self._emit_interval
+        return True
+
+    def summary(self):
+        return {"message": STATS_MESSAGE, "nephthys_stats": self.stats()}
+
+
+class TimedStage:
+    """
+    FilterPipeline stage timed by an Instrumentation.
+    """
+
+    __slots__ = ("_stage", "_instrumentation", "_timer", "names")
+
+    def __init__(self, stage, instrumentation, name):
+        self._stage = stage
+        self._instrumentation = instrumentation
+        self._timer = instrumentation.timer(name)
+        self.names = [name]
+
+    def add_name(self, name):
+        """
+        Accounts the stage to one more filter, once merged with its stage.
+        """
+        if name not in self.names:
+            self.names.append(name)
+            self._timer = self._instrumentation.timer("+".join(self.names))
+
+    def __call__(self, log_record, context):
+        start = _now()
+        try:
+            self._stage(log_record, context)
+        except Exception as exc:
+            self._instrumentation.add(self._timer, _now() - start, exc)
+            raise
+        self._instrumentation.add(self._timer, _now() - start)
@@ -0,0 +1,113 @@
+class MultiDict:
+    """
+    Ordered multi-value mapping stored as a flat list of (name, value) pairs.
+    Names are normalized and values converted to strings only when read.
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self):
+        self._items = []
+
+    # str() returns str names unchanged, subclasses normalize them
+    _key = staticmethod(str)
+    _display = staticmethod(str)
+
+    def add(self, name, value):
+        self._items.append((name, value))
+
+    def getall(self, name):
+        key, norm = self._key(name), self._key
+        return [str(v) for n, v in self._items if norm(n) == key]
+
+    def __contains__(self, name):
+        key, norm = self._key(name), self._key
+        for n, _ in self._items:
+            if norm(n) == key:
+                return True
+        return False
+
+    def __getitem__(self, name):
+        key, norm = self._key(name), self._key
+        for n, v in reversed(self._items):
+            if norm(n) == key:
+                return str(v)
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        """
+        Replaces every value of name with value, keeping the position of
+        the first occurrence.
+        """
+        key, norm = self._key(name), self._key
+        items = []
+        found = False
+
+        for item in self._items:
+            if norm(item[0]) != key:
+                items.append(item)
+            elif not found:
+                items.append((item[0], value))
+                found = True
+
+        if not found:
+            items.append((name, value))
+
+        self._items = items
+
+    def replace_all(self, keys, value):
+        """
+        Same as self[name] = value for every name whose normalized form is in keys.
+        :type keys: set
+        :return: whether anything was replaced
+        """
+        norm = self._key
+        items = []
+        replaced = set()
+
+        for item in self._items:
+            key = norm(item[0])
+            if key not in keys:
+                items.append(item)
+            elif key not in replaced:
+                items.append((item[0], value))
+                replaced.add(key)
+
+        if replaced:
+            self._items = items
+
+        return bool(replaced)
+
+    def __len__(self):
+        return len(self._items)
+
+    def items(self):
+        return [(name, str(v)) for name, v in self._items]
+
+    def joined(self):
+        """
+        :return: dict of name to its comma-joined values
+        """
+        display = self._display
+        joined = {}
+
+        for name, value in self._items:
+            # Names equal once normalized are also equal once displayed
+            name = display(name)
+            if name in joined:
+                joined[name] = joined[name] + "," + str(value)
+            else:
+                joined[name] = str(value)
+
+        return joined
+
+
+class HeaderDict(MultiDict):
+    """
+    MultiDict with case-insensitive lookup, names are title-cased when joined.
+    """
+
+    __slots__ = ()
+
+    _key = staticmethod(str.lower)
+    _display = staticmethod(str.title)
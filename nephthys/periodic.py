@@ -0,0 +1,140 @@
+import atexit
+import logging
+import os
+import sys
+import threading
+import traceback
+import weakref
+
+_flushers = weakref.WeakSet()
+
+
+class PeriodicFlusher:
+    """
+    Calls a method every interval seconds, or as soon as it is woken up, on
+    a daemon thread started on first use and again in forked children.
+    Only a weak reference to the method's object is kept: the thread ends
+    once the object is gone. When the interpreter exits, threads are
+    stopped and on_exit is called.
+    """
+
+    def __init__(
+        self, method, interval, name="nephthys-flusher", on_exit=None, on_fork=None
+    ):
+        """
+        :param method: Bound method called periodically
+        :param interval: Seconds between calls
+        :type interval: float
+        :param on_exit: Bound method called when the interpreter exits
+        :param on_fork: Bound method called in forked children, e.g. to
+            replace locks another thread of the parent may hold
+        """
+        self._method = weakref.WeakMethod(method)
+        self._on_exit = None if on_exit is None else weakref.WeakMethod(on_exit)
+        self._on_fork = None if on_fork is None else weakref.WeakMethod(on_fork)
+        self._interval = interval
+        self._name = name
+        self._closed = False
+        self._reset()
+
+        _flushers.add(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: the parent's thread does not run here
+                self._thread = None
+
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name=self._name, daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def wake(self):
+        """
+        Makes the thread call the method without waiting for the interval.
+        """
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            if self._closed:
+                return
+
+            method = self._method()
+            if method is None:
+                return
+            try:
+                method()
+            except Exception:
+                _report_error(self._name)
+            del method
+
+    def close(self, timeout=None):
+        """
+        Stops the thread, without calling the method.
+        """
+        self._closed = True
+        self._wakeup.set()
+
+        thread = self._thread
+        if (
+            thread is not None
+            and self._pid == os.getpid()
+            and thread is not threading.current_thread()
+        ):
+            thread.join(timeout)
+        self._thread = None
+        _flushers.discard(self)
+
+    def _exit(self):
+        self.close()
+        self._call(self._on_exit)
+
+    def _fork(self):
+        self._reset()
+        self._call(self._on_fork)
+
+    def _call(self, ref):
+        method = ref() if ref is not None else None
+        if method is not None:
+            try:
+                method()
+            except Exception:
+                _report_error(self._name)
+
+
+def _report_error(name):
+    # Same as logging.Handler.handleError, without a record to report
+    if logging.raiseExceptions and sys.stderr:
+        sys.stderr.write("--- Logging error in {} ---\n".format(name))
+        traceback.print_exc(file=sys.stderr)
+
+
+def _exit_flushers():
+    for flusher in list(_flushers):
+        flusher._exit()
+
+
+def _reinit_flushers():
+    for flusher in list(_flushers):
+        flusher._fork()
+
+
+atexit.register(_exit_flushers)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_flushers)
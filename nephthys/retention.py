@@ -0,0 +1,74 @@
+from enum import Enum
+from urllib.parse import urlparse
+
+
+class Retention(Enum):
+    FULL = 1
+    MINIMAL = 2
+    DROP = 3
+
+
+class RetentionPolicy:
+    """
+    Tail-based retention of request logs: the detail a request is logged
+    with is decided once it is over, from its duration, status and outcome.
+    Requests that raised are always kept in full.
+    """
+
+    def __init__(
+        self,
+        slow_time=None,
+        route_slow_times=None,
+        status_ranges=((500, 600),),
+        otherwise=Retention.MINIMAL,
+    ):
+        """
+        :param slow_time: Request time in milliseconds from which requests are
+            kept in full, None disables it
+        :type slow_time: float
+        :param route_slow_times: slow_time by route, or by path for requests
+            without a route
+        :type route_slow_times: dict
+        :param status_ranges: (start, stop) status code ranges kept in full,
+            stop excluded
+        :type status_ranges: list
+        :param otherwise: Retention of every other request
+        :type otherwise: Retention
+        """
+        self._slow_time = slow_time
+        self._route_slow_times = route_slow_times or {}
+        self._status_ranges = list(status_ranges or [])
+        self._otherwise = otherwise
+
+    def slow_time(self, route=None):
+        return self._route_slow_times.get(route, self._slow_time)
+
+    def retention(self, route=None, time=None, status_code=None, exception=False):
+        """
+        :param time: Request time in milliseconds
+        :rtype: Retention
+        """
+        if exception:
+            return Retention.FULL
+
+        if status_code is not None:
+            for start, stop in self._status_ranges:
+                if start <= status_code < stop:
+                    return Retention.FULL
+
+        slow_time = self.slow_time(route)
+        if slow_time is not None and time is not None and time >= slow_time:
+            return Retention.FULL
+
+        return self._otherwise
+
+    def request_retention(
+        self, url, route=None, time=None, status_code=None, exception=False
+    ):
+        """
+        Same as retention, for an outgoing request whose route may be unset.
+        """
+        if route is None and self._route_slow_times:
+            route = urlparse(url).path
+
+        return self.retention(route, time, status_code, exception)
@@ -0,0 +1,113 @@
+import logging
+import random
+from urllib.parse import urlparse
+from zlib import crc32
+
+_HASH_SPACE = 2 ** 32
+
+
+class Sampler:
+    """
+    Head-based sampling of request logs: whether a request is logged is
+    decided before anything is captured from it.
+    Errors are always logged, whatever the rate.
+    """
+
+    def __init__(
+        self,
+        rate=1.0,
+        route_rates=None,
+        host_rates=None,
+        key_header=None,
+        error_status=400,
+    ):
+        """
+        :param rate: Fraction of requests logged, between 0 and 1
+        :type rate: float
+        :param route_rates: Rates by route, or by path for requests without a
+            route, e.g. {"/health": 0.01}
+        :type route_rates: dict
+        :param host_rates: Rates by host, for requests without a route rate
+        :type host_rates: dict
+        :param key_header: Header whose value, or the user_uuid when missing,
+            is hashed instead of drawing a random number, so that every
+            service sharing it takes the same decision for a request
+        :type key_header: string
+        :param error_status: Lowest status code always logged, client errors
+            included by default
+        :type error_status: int
+        """
+        self._rate = rate
+        self._route_rates = route_rates or {}
+        self._host_rates = host_rates or {}
+        self._key_header = key_header
+        self._error_status = error_status
+
+        self.dropped = 0
+
+    def rate(self, route=None, host=None):
+        if route is not None and route in self._route_rates:
+            return self._route_rates[route]
+        if host is not None and host in self._host_rates:
+            return self._host_rates[host]
+        return self._rate
+
+    def key(self, headers=None, user_uuid=None):
+        """
+        :return: the sampling key of a request, None if it has none
+        """
+        if self._key_header is not None and headers and self._key_header in headers:
+            return headers[self._key_header]
+        return user_uuid
+
+    def sample(self, route=None, host=None, key=None):
+        """
+        :param key: Sampling key, requests sharing a key are sampled together
+        :return: whether to log the request
+        """
+        rate = self.rate(route, host)
+
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            sampled = False
+        elif key is None:
+            # Sampling needs no cryptographic randomness
+            sampled = random.random() < rate  # nosec B311
+        else:
+            sampled = crc32(str(key).encode("utf-8")) < rate * _HASH_SPACE
+
+        if not sampled:
+            self.dropped += 1
+        return sampled
+
+    def sample_request(self, url, route=None, headers=None):
+        """
+        Samples an outgoing request from what is known before sending it.
+        """
+        if route is None and (self._route_rates or self._host_rates):
+            parsed_url = urlparse(url)
+            route, host = parsed_url.path, parsed_url.netloc
+        else:
+            host = urlparse(url).netloc if self._host_rates else None
+
+        return self.sample(route, host, self.key(headers))
+
+    def is_error(self, status_code=None, exception=False):
+        return bool(exception) or (
+            status_code is not None and status_code >= self._error_status
+        )
+
+    def keep(self, log_record, level=logging.INFO):
+        """
+        Samples an already built RequestLogRecord.
+        :return: whether to log it
+        """
+        log_record.materialize()
+
+        if level >= logging.ERROR or self.is_error(log_record._status_code):
+            return True
+
+        route = log_record._route if log_record._route is not None else log_record._path
+        key = self.key(log_record._req_headers, log_record._user_uuid)
+        return self.sample(route, log_record._host, key)
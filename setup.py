@@ -29,6 +29,11 @@ setup(
         "Operating System :: OS Independent",
     ],
     packages=find_packages(exclude=["tests", "requirements"]),
-    install_requires=["webob"],
-    extras_require={"JSON": ["python-rapidjson"], "requests": ["requests"]},
+    install_requires=[],
+    extras_require={
+        "JSON": ["python-rapidjson"],
+        "orjson": ["orjson"],
+        "requests": ["requests"],
+        "httpx": ["httpx"],
+    },
 )
@@ -1,8 +1,16 @@
 import logging
 import pytest
+from unittest.mock import patch
 
 from nephthys.filters.message import MessageBlacklist
-from nephthys import FilterLoggerAdapter, FilterableLog, Log, LogRecord
+from nephthys import (
+    FilterLoggerAdapter,
+    FilterableLog,
+    Log,
+    LogRecord,
+    RequestLogRecord,
+)
+from nephthys.sampling import Sampler
 
 
 @pytest.fixture
@@ -57,3 +65,30 @@ def test_process(logger, filters, message, output):
     log_dict, kwargs = base_logger.process(message, {})
 
     assert log_dict == output
+
+
+def test_dropped_log_is_not_materialized(logger):
+    filt_log = FilterableLog(LogRecord(message="test"))
+    filt_log.drop = True
+
+    with patch.object(LogRecord, "materialize") as materialize:
+        FilterLoggerAdapter(logger).critical(filt_log)
+
+    assert not materialize.called
+
+
+def test_sampler(logger, caplog):
+    caplog.set_level(logging.INFO, logger="test_logger")
+    adapter = FilterLoggerAdapter(logger, sampler=Sampler(rate=0.0))
+
+    for status_code in (200, 500):
+        rec = RequestLogRecord()
+        rec.status_code = status_code
+        adapter.info(Log(rec))
+    adapter.error(Log(RequestLogRecord()))
+    adapter.info("message")
+
+    assert [
+        rec.msg.get("response", {}).get("status_code") for rec in caplog.records
+    ] == [500, None, None]
+    assert adapter._sampler.dropped == 1
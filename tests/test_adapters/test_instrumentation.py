@@ -0,0 +1,165 @@
+import logging
+
+import pytest
+
+from nephthys import (
+    FilterableLog,
+    FilterLoggerAdapter,
+    FilterPipeline,
+    Log,
+    RequestLogRecord,
+)
+from nephthys.filters.message import MessageBlacklist
+from nephthys.filters.requests import BodyTypeFilter, HeaderFilter, QueryStringFilter
+from nephthys.formatters.json import JSONFormatter
+from nephthys.instrumentation import STATS_MESSAGE, Instrumentation, TimedStage
+
+
+@pytest.fixture
+def logger():
+    log = logging.getLogger("test_instrumentation")
+    log.setLevel(logging.INFO)
+    return log
+
+
+def make_record():
+    rec = RequestLogRecord(message="secret")
+    rec.add_request_header("Authorization", "token")
+    rec.add_request_header("Content-Type", "application/json")
+    rec.add_request_querystring("password", "pwd")
+    rec.request_body = '{"key": "value"}'
+    return rec
+
+
+def failing_filter(log_record):
+    raise ValueError("broken filter")
+
+
+def test_disabled_pipeline_is_not_wrapped():
+    pipeline = FilterPipeline(
+        [HeaderFilter(["Authorization"]), MessageBlacklist(["secret"])]
+    )
+    assert not any(isinstance(stage, TimedStage) for stage in pipeline._stages)
+
+
+def test_filter_stats(logger, caplog):
+    caplog.set_level(logging.INFO)
+    instrumentation = Instrumentation()
+    adapter = FilterLoggerAdapter(
+        logger,
+        filters=[
+            BodyTypeFilter(),
+            QueryStringFilter(["password"]),
+            MessageBlacklist(["secret"]),
+        ],
+        instrumentation=instrumentation,
+    )
+
+    for _ in range(3):
+        adapter.info(Log(make_record()))
+
+    stats = instrumentation.stats()
+    assert set(stats) == {
+        "filter.0.BodyTypeFilter",
+        "filter.1.QueryStringFilter",
+        "filter.2.MessageBlacklist",
+        "phase.filters",
+        "phase.asdict",
+        "phase.log",
+    }
+    for name, stat in stats.items():
+        assert stat["calls"] == 3
+        assert stat["errors"] == 0
+        assert 0 < stat["max_ms"] <= stat["total_ms"]
+        assert stat["avg_ms"] == pytest.approx(stat["total_ms"] / 3)
+    # The filters still apply
+    assert caplog.records[-1].msg["message"] == "<filtered>"
+    assert caplog.records[-1].msg["request"]["query"] == {"password": "<filtered>"}
+
+
+def test_merged_stages_are_timed_together(logger):
+    instrumentation = Instrumentation()
+    adapter = FilterLoggerAdapter(
+        logger,
+        filters=[
+            HeaderFilter(["Authorization"]),
+            HeaderFilter(["X-Api-Key"]),
+            failing_filter,
+        ],
+        instrumentation=instrumentation,
+    )
+
+    with pytest.raises(ValueError):
+        adapter.process(Log(make_record()), {})
+
+    stats = instrumentation.stats()
+    assert stats["filter.0.HeaderFilter+filter.1.HeaderFilter"]["calls"] == 1
+    assert "filter.0.HeaderFilter" not in stats
+    failing = stats["filter.2.failing_filter"]
+    assert failing["calls"] == 1
+    assert failing["errors"] == 1
+    assert failing["last_error"] == "ValueError('broken filter')"
+    assert stats["phase.filters"]["errors"] == 1
+
+
+def test_filterable_log_filters(logger):
+    instrumentation = Instrumentation()
+    adapter = FilterLoggerAdapter(logger, instrumentation=instrumentation)
+
+    log = FilterableLog(make_record())
+    log.add_filters([MessageBlacklist(["secret"])])
+    log_dict, _ = adapter.process(log, {})
+
+    assert log_dict["message"] == "<filtered>"
+    assert instrumentation.stats()["log_filter.0.MessageBlacklist"]["calls"] == 1
+
+
+def test_disabled_level_not_timed(logger):
+    instrumentation = Instrumentation()
+    adapter = FilterLoggerAdapter(logger, instrumentation=instrumentation)
+
+    adapter.debug(Log(make_record()))
+    assert instrumentation.stats() == {}
+
+
+def test_periodic_stats_record(logger, caplog):
+    caplog.set_level(logging.INFO)
+    now = [0]
+    instrumentation = Instrumentation(
+        emit_interval=10, level=logging.WARNING, clock=lambda: now[0]
+    )
+    adapter = FilterLoggerAdapter(logger, instrumentation=instrumentation)
+
+    adapter.info("first")
+    now[0] = 10
+    adapter.info("second")
+    now[0] = 15
+    adapter.info("third")
+
+    messages = [record.msg for record in caplog.records]
+    assert [message["message"] for message in messages] == [
+        "first",
+        "second",
+        STATS_MESSAGE,
+        "third",
+    ]
+    stats_record = caplog.records[2]
+    assert stats_record.levelno == logging.WARNING
+    assert stats_record.msg["nephthys_stats"]["phase.log"]["calls"] == 2
+
+
+def test_formatter_and_reset(logger):
+    instrumentation = Instrumentation()
+    formatter = instrumentation.instrument_formatter(JSONFormatter())
+    record = logging.LogRecord(
+        "test", logging.INFO, __file__, 1, make_record(), [], None
+    )
+
+    formatter.format(record)
+    formatter.format_bytes(record)
+    assert instrumentation.stats()["phase.format"]["calls"] == 2
+
+    instrumentation.reset()
+    assert instrumentation.stats() == {}
+    formatter.format(record)
+    assert instrumentation.stats()["phase.format"]["calls"] == 1
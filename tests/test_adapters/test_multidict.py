@@ -0,0 +1,55 @@
+from nephthys.multidict import HeaderDict, MultiDict
+
+
+def test_multidict_joined():
+    md = MultiDict()
+    md.add("key", "value1")
+    md.add("other", 2)
+    md.add("key", "value2")
+
+    assert md.joined() == {"key": "value1,value2", "other": "2"}
+
+
+def test_multidict_case_sensitive():
+    md = MultiDict()
+    md.add("Key", "value")
+
+    assert "Key" in md
+    assert "key" not in md
+    assert md.getall("key") == []
+
+
+def test_multidict_setitem():
+    md = MultiDict()
+    md.add("key", "value1")
+    md.add("other", "value")
+    md.add("key", "value2")
+
+    md["key"] = "replaced"
+
+    assert md.items() == [("key", "replaced"), ("other", "value")]
+    assert md["key"] == "replaced"
+
+
+def test_multidict_setitem_missing():
+    md = MultiDict()
+    md["key"] = "value"
+
+    assert md.items() == [("key", "value")]
+
+
+def test_header_dict_case_insensitive():
+    headers = HeaderDict()
+    headers.add("content-type", "application/json")
+    headers.add("X-CUSTOM", "value1")
+    headers.add("x-custom", "value2")
+
+    assert "Content-Type" in headers
+    assert headers.getall("CONTENT-TYPE") == ["application/json"]
+    assert headers.joined() == {
+        "Content-Type": "application/json",
+        "X-Custom": "value1,value2",
+    }
+
+    headers["X-Custom"] = "filtered"
+    assert headers.joined()["X-Custom"] == "filtered"
@@ -0,0 +1,206 @@
+import logging
+
+import pytest
+import rapidjson
+
+from nephthys import (
+    FilterableLog,
+    FilterLoggerAdapter,
+    FilterPipeline,
+    LogRecord,
+    RequestLogRecord,
+    apply_filters,
+)
+from nephthys.filters.message import MessageBlacklist
+from nephthys.filters.requests import (
+    BODY_NOT_LOGGABLE,
+    BodyTypeFilter,
+    HeaderFilter,
+    JsonBodyFilter,
+    QueryStringFilter,
+    RequestType,
+)
+
+
+def req_rec_generator(content_type="application/json"):
+    req_rec = RequestLogRecord(message="secret message")
+    for add_header in (req_rec.add_request_header, req_rec.add_response_header):
+        add_header("Content-Type", content_type)
+        add_header("Authorization", "token")
+        add_header("X-Api-Key", "key")
+        add_header("x-api-key", "key2")
+        add_header("X-Other", "value")
+    req_rec.add_request_querystring("password", "pwd")
+    req_rec.add_request_querystring("user", "me")
+    req_rec.request_body = rapidjson.dumps({"key": "value", "other": 1})
+    req_rec.response_body = rapidjson.dumps({"key": {"key": "value"}})
+    return req_rec
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        [],
+        [
+            HeaderFilter(["authorization"]),
+            HeaderFilter(["X-API-KEY"], RequestType.RESPONSE),
+        ],
+        [
+            BodyTypeFilter(),
+            HeaderFilter(["Authorization"]),
+            JsonBodyFilter({"key": True}, RequestType.REQUEST),
+            HeaderFilter(["X-Api-Key"]),
+            QueryStringFilter(["password"]),
+            MessageBlacklist(["secret"]),
+        ],
+        [HeaderFilter(["Content-Type"]), BodyTypeFilter(), HeaderFilter(["X-Other"])],
+        [
+            BodyTypeFilter(),
+            HeaderFilter(["Content-Type"]),
+            JsonBodyFilter({"key": True}),
+        ],
+        [
+            JsonBodyFilter({"key": {"key": True}}),
+            QueryStringFilter(["user"]),
+            QueryStringFilter(["password"]),
+        ],
+        [
+            HeaderFilter(["X-Other"]),
+            lambda rec: rec.add_request_header("X-Added", "v"),
+            HeaderFilter(["X-Added"]),
+        ],
+    ],
+)
+def test_pipeline_matches_apply_filters(filters):
+    expected = req_rec_generator()
+    apply_filters(expected, filters)
+
+    out = req_rec_generator()
+    FilterPipeline(filters)(out)
+
+    assert out.asdict() == expected.asdict()
+
+
+def test_pipeline_merges_header_filters():
+    pipeline = FilterPipeline(
+        [
+            HeaderFilter(["A"]),
+            BodyTypeFilter(),
+            HeaderFilter(["B"], RequestType.RESPONSE),
+        ]
+    )
+
+    assert len(pipeline._stages) == 2
+    assert pipeline._stages[0].keys == [{"a"}, {"a", "b"}]
+
+
+def test_pipeline_skips_json_of_replaced_body():
+    rec = req_rec_generator()
+    FilterPipeline(
+        [BodyTypeFilter(allowed_types=["text/plain"]), JsonBodyFilter({"key": True})]
+    )(rec)
+
+    assert rec._req_body == BODY_NOT_LOGGABLE.format("application/json")
+    assert rec._res_body == BODY_NOT_LOGGABLE.format("application/json")
+
+
+class UpperHeaderFilter(HeaderFilter):
+    def filter(self, log_record):
+        super().filter(log_record)
+        log_record.add_request_header("X-Filtered", "yes")
+
+
+class UpperQueryStringFilter(QueryStringFilter):
+    def filter(self, log_record):
+        log_record.add_request_querystring("filtered", "yes")
+
+
+class CountingBodyTypeFilter(BodyTypeFilter):
+    calls = 0
+
+    def filter(self, log_record):
+        self.calls += 1
+        super().filter(log_record)
+
+
+class SkippingJsonBodyFilter(JsonBodyFilter):
+    def filter(self, log_record):
+        pass
+
+
+class CompilingHeaderFilter(UpperHeaderFilter):
+    def compile(self, pipeline):
+        pipeline.add_header_filter(["x-api-key"], "<filtered>")
+
+
+def test_pipeline_calls_overridden_filter():
+    body_type_filter = CountingBodyTypeFilter(allowed_types=["application/json"])
+    rec = req_rec_generator()
+    FilterPipeline(
+        [
+            UpperHeaderFilter(["Authorization"]),
+            UpperQueryStringFilter(["password"]),
+            body_type_filter,
+            SkippingJsonBodyFilter({"key": True}),
+        ]
+    )(rec)
+
+    assert rec._req_headers["X-Filtered"] == "yes"
+    assert rec._req_headers["Authorization"] == "<filtered>"
+    assert rec._req_query["filtered"] == "yes"
+    assert rec._req_query["password"] == "pwd"
+    assert body_type_filter.calls == 1
+    assert rapidjson.loads(rec._req_body)["key"] == "value"
+
+
+def test_pipeline_compiles_overridden_compile():
+    rec = req_rec_generator()
+    FilterPipeline([CompilingHeaderFilter(["Authorization"])])(rec)
+
+    assert rec._req_headers["X-Api-Key"] == "<filtered>"
+    assert rec._req_headers["Authorization"] == "token"
+    assert "X-Filtered" not in rec._req_headers
+
+
+class ForeignCompileFilter:
+    """Not an IFilter: compile is an unrelated helper"""
+
+    def __init__(self):
+        self.compiled = False
+
+    def compile(self, pipeline):
+        self.compiled = True
+
+    def filter(self, log_record):
+        log_record._message = "<filtered>"
+
+
+def test_pipeline_ignores_foreign_compile():
+    foreign = ForeignCompileFilter()
+    rec = LogRecord(message="secret")
+    FilterPipeline([foreign])(rec)
+
+    assert rec.asdict()["message"] == "<filtered>"
+    assert not foreign.compiled
+
+
+def test_pipeline_plain_record():
+    rec = LogRecord(message="secret")
+    FilterPipeline([HeaderFilter(["A"]), MessageBlacklist(["secret"])])(rec)
+
+    assert rec.asdict()["message"] == "<filtered>"
+
+
+def test_adapter_appends_log_filters():
+    adapter = FilterLoggerAdapter(
+        logging.getLogger("test_logger"), filters=[BodyTypeFilter()]
+    )
+    filt_log = FilterableLog(req_rec_generator())
+    filt_log.add_filters(
+        [HeaderFilter(["Authorization"]), JsonBodyFilter({"key": True})]
+    )
+
+    log_dict, kwargs = adapter.process(filt_log, {})
+
+    assert log_dict["request"]["header"]["Authorization"] == "<filtered>"
+    assert rapidjson.loads(log_dict["request"]["body"])["key"] == "<filtered>"
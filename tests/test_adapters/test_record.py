@@ -0,0 +1,65 @@
+import pytest
+
+from nephthys import LogRecord, RecordPool, RequestLogRecord
+
+
+def test_record_has_no_dict():
+    assert not hasattr(LogRecord(), "__dict__")
+    assert not hasattr(RequestLogRecord(), "__dict__")
+
+
+def test_lazy_containers():
+    rec = RequestLogRecord()
+
+    assert rec._req_headers is None
+    assert rec._req_query is None
+    assert rec._res_headers is None
+
+    log = rec.asdict()
+    assert log["request"]["header"] == {}
+    assert log["request"]["query"] == {}
+    assert log["request"]["route_match"] == {}
+    assert log["response"]["header"] == {}
+
+
+def test_pool_recycles_records():
+    pool = RecordPool(RequestLogRecord)
+
+    rec = pool.acquire()
+    rec.method = "get"
+    rec.add_request_header("key", "value")
+    rec.add_tags("tag")
+    tags = rec.asdict()["extra_tags"]
+    pool.release(rec)
+
+    recycled = pool.acquire()
+    assert recycled is rec
+    assert recycled.asdict() == RequestLogRecord().asdict()
+    assert tags == ["tag"]
+
+
+def test_pool_acquire_arguments():
+    pool = RecordPool(LogRecord)
+    pool.release(LogRecord(message="old"))
+
+    assert pool.acquire(message="new").asdict()["message"] == "new"
+
+
+@pytest.mark.parametrize("max_size,expected", [(0, 0), (1, 1), (2, 2)])
+def test_pool_max_size(max_size, expected):
+    pool = RecordPool(LogRecord, max_size=max_size)
+    for _ in range(3):
+        pool.release(LogRecord())
+
+    assert len(pool._free) == expected
+
+
+def test_request_timing_uses_duration():
+    rec = RequestLogRecord()
+    # Wall clock stepped back during the request
+    rec.set_request_timing(100.0, 99.0, 1500000)
+
+    log = rec.asdict()
+    assert log["request"]["start"] == 100.0
+    assert log["request"]["end"] == 99.0
+    assert log["request"]["time"] == 1.5
@@ -0,0 +1,168 @@
+import json
+import logging
+import random
+import time
+
+import pytest
+
+from nephthys import RequestLogRecord
+from nephthys.aggregation import AggregationHandler, LatencyAggregator, LatencyHistogram
+
+
+def test_histogram_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in range(1, 101):
+        histogram.record(value)
+
+    assert (histogram.count, histogram.min, histogram.max) == (100, 1, 100)
+    assert histogram.percentile(50) == 50
+    assert histogram.percentile(99) == 99
+    assert histogram.percentile(100) == 100
+
+
+def test_histogram_relative_error():
+    rnd = random.Random(0)
+    values = sorted(int(rnd.lognormvariate(10, 2)) for _ in range(10000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for percent in (50, 90, 99):
+        exact = values[-(-len(values) * percent // 100) - 1]
+        assert abs(histogram.percentile(percent) - exact) <= exact / 64
+
+
+def test_histogram_fixed_memory():
+    histogram = LatencyHistogram(max_value=1000)
+    size = len(histogram._counts)
+
+    histogram.record(10 ** 9)
+
+    assert len(histogram._counts) == size
+    assert histogram.percentile(100) == 10 ** 9
+
+
+def test_histogram_merge():
+    first, second, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for value in range(1000):
+        (first if value % 2 else second).record(value * 37)
+        both.record(value * 37)
+
+    first.merge(second)
+    merged = LatencyHistogram.from_snapshot(json.loads(json.dumps(both.snapshot())))
+
+    for histogram in (first, merged):
+        assert histogram.snapshot() == both.snapshot()
+        assert histogram.percentile(90) == both.percentile(90)
+
+
+def test_histogram_merge_layout():
+    with pytest.raises(ValueError):
+        LatencyHistogram(sub_bucket_bits=7).merge(LatencyHistogram(sub_bucket_bits=8))
+
+
+def make_record(route, time_ms, status_code=200):
+    rec = RequestLogRecord()
+    rec.method = "get"
+    rec.url = "https://ovalmoney.com" + route
+    rec.route = route
+    rec.status_code = status_code
+    rec.request_start = 1.0
+    rec.request_end = 1.0 + time_ms / 1000
+    return rec
+
+
+def test_aggregator_summaries():
+    aggregator = LatencyAggregator()
+    for i in range(100):
+        aggregator.add_record(make_record("/user", i + 1, 500 if i < 3 else 200))
+    aggregator.add_record(make_record("/health", 2))
+
+    summaries = {
+        summary["route"]: summary for summary in aggregator.summaries(reset=True)
+    }
+
+    user = summaries["/user"]
+    assert (user["host"], user["method"], user["count"], user["errors"]) == (
+        "ovalmoney.com",
+        "GET",
+        100,
+        3,
+    )
+    assert user["p50"] == pytest.approx(50, rel=0.01)
+    assert user["p99"] == pytest.approx(99, rel=0.01)
+    assert user["max"] == pytest.approx(100)
+    assert summaries["/health"]["count"] == 1
+    assert len(aggregator) == 0
+
+
+def test_aggregator_merge():
+    workers = [LatencyAggregator() for _ in range(3)]
+    for i, worker in enumerate(workers):
+        worker.add(10 * (i + 1), route="/user", method="GET")
+
+    total = LatencyAggregator()
+    for worker in workers:
+        total.merge(json.loads(json.dumps(worker.snapshot(reset=True))))
+
+    summary, = total.summaries()
+    assert summary["count"] == 3
+    assert summary["max"] == pytest.approx(30)
+    assert all(len(worker) == 0 for worker in workers)
+
+
+def test_aggregator_merge_key_fields():
+    with pytest.raises(ValueError):
+        LatencyAggregator().merge(LatencyAggregator(key_fields=("route",)).snapshot())
+
+
+def test_aggregation_handler(caplog):
+    caplog.set_level(logging.INFO, logger="summaries")
+    source = logging.getLogger("aggregated")
+    source.propagate = False
+    source.setLevel(logging.INFO)
+    handler = AggregationHandler(logging.getLogger("summaries"), interval=3600)
+    source.addHandler(handler)
+
+    try:
+        for i in range(10):
+            source.info(make_record("/user", 5).asdict())
+        source.info("not a request")
+        assert not caplog.records
+
+        handler.flush()
+    finally:
+        source.removeHandler(handler)
+        source.propagate = True
+        source.setLevel(logging.NOTSET)
+
+    summary, = [rec.msg for rec in caplog.records]
+    assert (summary["route"], summary["count"], summary["errors"]) == ("/user", 10, 0)
+
+
+def test_aggregation_handler_flushes_without_records(caplog):
+    caplog.set_level(logging.INFO, logger="summaries")
+    handler = AggregationHandler(logging.getLogger("summaries"), interval=0.05)
+
+    try:
+        handler.handle(logging.makeLogRecord({"msg": make_record("/user", 5).asdict()}))
+        deadline = time.monotonic() + 5
+        while not caplog.records and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        handler.close()
+
+    summary = caplog.records[0].msg
+    assert (summary["route"], summary["count"]) == ("/user", 1)
+
+
+def test_aggregation_handler_flushes_on_close(caplog):
+    caplog.set_level(logging.INFO, logger="summaries")
+    handler = AggregationHandler(logging.getLogger("summaries"), interval=3600)
+
+    handler.handle(logging.makeLogRecord({"msg": make_record("/user", 5).asdict()}))
+    assert not caplog.records
+    handler.close()
+
+    summary, = [rec.msg for rec in caplog.records]
+    assert (summary["route"], summary["count"]) == ("/user", 1)
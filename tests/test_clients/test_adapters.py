@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+import requests
+
+from nephthys.clients.adapters import ConnectionTimings, NephthysHTTPAdapter
+from nephthys.clients.requests import Session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(0.2)
+
+        body = b"x" * 1000
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_adapter_timings(server_url):
+    session = requests.Session()
+    session.mount("http://", NephthysHTTPAdapter())
+
+    first = session.get(server_url + "/first")
+    second = session.get(server_url + "/second")
+
+    assert isinstance(first.nephthys_timings, ConnectionTimings)
+    assert first.request.nephthys_timings is first.nephthys_timings
+
+    timings = first.nephthys_timings.asdict()
+    assert timings["connection_reused"] is False
+    assert timings["connect"] > 0
+    assert timings["tls"] is None
+    assert 0 < timings["headers"]
+    assert timings["body"] >= 0
+
+    timings = second.nephthys_timings.asdict()
+    assert timings["connection_reused"] is True
+    assert timings["connect"] == 0
+
+
+def test_adapter_stream(server_url):
+    session = requests.Session()
+    session.mount("http://", NephthysHTTPAdapter())
+
+    response = session.get(server_url, stream=True)
+
+    timings = response.nephthys_timings.asdict()
+    assert timings["headers"] is not None
+    assert timings["body"] is None
+    response.close()
+
+
+def test_adapter_connection_error():
+    session = requests.Session()
+    session.mount("http://", NephthysHTTPAdapter(max_retries=0))
+    request = requests.Request("GET", "http://127.0.0.1:1").prepare()
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        session.send(request)
+
+    timings = request.nephthys_timings.asdict()
+    assert timings["connection_reused"] is False
+    assert timings["headers"] is None
+
+
+def test_session_log_timings(caplog, server_url):
+    caplog.set_level(logging.INFO, logger="requests_out")
+
+    Session().get(server_url)
+
+    timings = caplog.records[0].msg["request"]["timings"]
+    assert set(timings) == {
+        "pool_wait",
+        "pool_maxsize",
+        "pool_in_use",
+        "connection_reused",
+        "connect",
+        "tls",
+        "headers",
+        "body",
+    }
+    assert timings["connection_reused"] is False
+
+
+def test_adapter_pool_stats(server_url):
+    adapter = NephthysHTTPAdapter(pool_maxsize=1, pool_block=True)
+    session = requests.Session()
+    session.mount("http://", adapter)
+
+    responses = []
+    threads = [
+        threading.Thread(
+            target=lambda: responses.append(session.get(server_url + "/slow"))
+        )
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats, = adapter.pool_stats().values()
+    assert stats["acquired"] == 2
+    assert stats["exhausted"] == 1
+    assert stats["reused"] == 1
+    assert stats["maxsize"] == stats["in_use_max"] == 1
+    assert stats["wait_max"] >= 100
+
+    timings = sorted(
+        (r.nephthys_timings.asdict() for r in responses), key=lambda t: t["pool_wait"]
+    )
+    assert [t["pool_in_use"] for t in timings] == [1, 1]
+    assert timings[1]["pool_wait"] >= 100
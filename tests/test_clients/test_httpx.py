@@ -0,0 +1,141 @@
+import asyncio
+import logging
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from nephthys.clients.httpx import (  # noqa: E402
+    AsyncClient,
+    decorate_log_request,
+    decorate_log_response,
+)
+from nephthys import RequestLogRecord  # noqa: E402
+from nephthys.dispatch import LogDispatcher  # noqa: E402
+from nephthys.filters.requests import BODY_NOT_LOGGABLE, JsonBodyFilter  # noqa: E402
+from nephthys.sampling import Sampler  # noqa: E402
+
+
+def handler(request):
+    if request.url.path == "/fail":
+        raise httpx.ConnectTimeout("timeout", request=request)
+    if request.url.path == "/video":
+        return httpx.Response(
+            200, headers={"Content-Type": "video/mp4"}, content=b"\xff\x8f"
+        )
+    return httpx.Response(
+        200,
+        headers={"Content-Type": "application/json"},
+        content=b'{"key": "secret", "other": 1}',
+    )
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = LogDispatcher()
+    yield dispatcher
+    dispatcher.close()
+
+
+def run(dispatcher, *calls, **client_kwargs):
+    async def main():
+        async with AsyncClient(
+            transport=httpx.MockTransport(handler),
+            log_dispatcher=dispatcher,
+            **client_kwargs
+        ) as client:
+            for method, url, kwargs in calls:
+                try:
+                    await client.request(method, url, **kwargs)
+                except httpx.HTTPError:
+                    pass
+
+    asyncio.run(main())
+    assert dispatcher.flush(timeout=5)
+
+
+def test_decorate_log_request():
+    request = httpx.Request(
+        "post",
+        "https://ovalmoney.com/user?a=1&a=2",
+        headers={"X-Key": "value"},
+        content=b"body",
+    )
+    log_rec = RequestLogRecord()
+    decorate_log_request(log_rec, request)
+    log = log_rec.asdict()["request"]
+
+    assert log["method"] == "POST"
+    assert log["query"] == {"a": "1,2"}
+    assert log["header"]["X-Key"] == "value"
+    assert (log["body"], log["body_size"]) == ("body", 4)
+
+
+def test_decorate_log_response_limit():
+    response = httpx.Response(
+        200, headers={"Content-Type": "text/plain"}, content=b"Response"
+    )
+    log_rec = RequestLogRecord()
+    decorate_log_response(log_rec, response, body_limit=4)
+    log = log_rec.asdict()["response"]
+
+    assert (
+        log["status_code"],
+        log["body"],
+        log["body_size"],
+        log["body_truncated"],
+    ) == (200, "Resp", 8, True)
+
+
+def test_client_log(caplog, dispatcher):
+    caplog.set_level(logging.INFO, logger="httpx_out")
+
+    run(
+        dispatcher,
+        ("GET", "https://ovalmoney.com/user?q=1", {"route": "/user"}),
+        log_filters=[JsonBodyFilter({"key": True})],
+    )
+
+    log_rec, = caplog.records
+    assert log_rec.threadName == "nephthys-dispatcher"
+    log = log_rec.msg
+    assert log["request"]["route"] == "/user"
+    assert log["request"]["query"] == {"q": "1"}
+    assert "X-Route-Header" not in log["request"]["header"]
+    assert log["response"]["status_code"] == 200
+    assert log["response"]["body"] == '{"key":"<filtered>","other":1}'
+    assert log["request"]["time"] is not None
+
+
+def test_client_not_loggable_body(caplog, dispatcher):
+    caplog.set_level(logging.INFO, logger="httpx_out")
+
+    run(dispatcher, ("GET", "https://ovalmoney.com/video", {}))
+
+    assert caplog.records[0].msg["response"]["body"] == BODY_NOT_LOGGABLE.format(
+        "video/mp4"
+    )
+
+
+def test_client_exception(caplog, dispatcher):
+    caplog.set_level(logging.INFO, logger="httpx_out")
+
+    run(dispatcher, ("GET", "https://ovalmoney.com/fail", {}))
+
+    log_rec, = caplog.records
+    assert log_rec.levelno == logging.ERROR
+    assert isinstance(log_rec.exc_info[1], httpx.ConnectTimeout)
+    assert log_rec.msg["request"]["path"] == "/fail"
+
+
+def test_client_sampler(caplog, dispatcher):
+    caplog.set_level(logging.INFO, logger="httpx_out")
+
+    run(
+        dispatcher,
+        ("GET", "https://ovalmoney.com/health", {}),
+        ("GET", "https://ovalmoney.com/user", {}),
+        log_sampler=Sampler(route_rates={"/health": 0.0}),
+    )
+
+    assert [rec.msg["request"]["path"] for rec in caplog.records] == ["/user"]
@@ -8,13 +8,19 @@ from unittest.mock import MagicMock, call
 import pytest
 import requests
 
+from nephthys import RecordPool, RequestLogRecord
 from nephthys.clients.requests import (
+    DEFAULT_ALLOWED_TYPES,
     catch_logger_exception,
+    decode_body,
     decorate_log_request,
     decorate_log_response,
     Session,
 )
-from nephthys.filters.requests import BODY_NOT_LOGGABLE
+from nephthys.dispatch import LogDispatcher
+from nephthys.retention import Retention, RetentionPolicy
+from nephthys.sampling import Sampler
+from nephthys.filters.requests import BODY_NOT_LOGGABLE, BodyTypeFilter, JsonBodyFilter
 
 
 @pytest.fixture
@@ -347,7 +353,7 @@ def test_route_plus_custom_header(caplog, m):
     m.get(test_path, status_code=200)
 
     s = Session()
-    route="test/route"
+    route = "test/route"
     response = s.get(test_path, route=route, headers={"sweeties": "chocolate"})
 
     log = [rec.msg for rec in caplog.records][0]
@@ -368,3 +374,282 @@ def test_custom_header(m):
     response = s.get(test_path, headers={"sweeties": "chocolate"})
 
     assert response.status_code == 200
+
+
+def test_session_dispatcher_log(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get(
+        "https://ovalmoney.com/user",
+        json={"test": True},
+        headers={"Content-Type": "application/json"},
+    )
+
+    dispatcher = LogDispatcher()
+    s = Session(log_dispatcher=dispatcher)
+    s.get("https://ovalmoney.com/user")
+    dispatcher.flush(timeout=5)
+
+    log = [rec.msg for rec in caplog.records][0]
+    assert log["request"]["url"] == "https://ovalmoney.com/user"
+    assert log["response"]["body"] == '{"test": true}'
+    dispatcher.close()
+
+
+def test_session_dispatcher_exception_log(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/user", exc=requests.exceptions.ConnectTimeout)
+
+    dispatcher = LogDispatcher()
+    s = Session(log_dispatcher=dispatcher)
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        s.get("https://ovalmoney.com/user")
+    dispatcher.flush(timeout=5)
+
+    log_rec = [rec for rec in caplog.records][0]
+    assert isinstance(log_rec.exc_info[1], requests.exceptions.ConnectTimeout)
+    dispatcher.close()
+
+
+def test_send_log_record_disabled(m, monkeypatch):
+    m.get("https://ovalmoney.com/user", status_code=200)
+    decorate = MagicMock()
+    monkeypatch.setattr("nephthys.clients.requests.decorate_log_request", decorate)
+
+    s = Session()
+    s._logger.logger.setLevel(logging.WARNING)
+    try:
+        s.get("https://ovalmoney.com/user")
+    finally:
+        s._logger.logger.setLevel(logging.NOTSET)
+
+    assert not decorate.called
+
+
+def test_deferred_decoration():
+    request = MagicMock(
+        url="https://ovalmoney.com/user", method="get", headers=None, body=None
+    )
+    log_rec = RequestLogRecord()
+    log_rec.defer(decorate_log_request, request)
+
+    assert log_rec._method is None
+    assert log_rec.asdict()["request"]["method"] == "GET"
+
+
+def test_session_record_pool(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/user", status_code=200)
+
+    pool = RecordPool(RequestLogRecord)
+    s = Session(log_record_pool=pool)
+    s.get("https://ovalmoney.com/user")
+    s.get("https://ovalmoney.com/user?key=value")
+
+    logs = [rec.msg for rec in caplog.records]
+    assert logs[0]["request"]["query"] == {}
+    assert logs[1]["request"]["query"] == {"key": "value"}
+    assert len(pool._free) == 1
+
+
+@pytest.mark.parametrize(
+    "content,limit,expected,truncated",
+    [
+        (b"abcdef", None, "abcdef", False),
+        (b"abcdef", 6, "abcdef", False),
+        (b"abcdef", 4, "abcd", True),
+        ("aè".encode("utf-8"), 2, "a", True),
+    ],
+)
+def test_decode_body(content, limit, expected, truncated):
+    assert decode_body(content, "utf-8", limit) == (expected, truncated)
+
+
+def test_session_response_body_limit(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get(
+        "https://ovalmoney.com/text_data",
+        headers={"Content-Type": "text/plain"},
+        text="Response",
+    )
+
+    s = Session(log_response_body_limit=4)
+    s.get("https://ovalmoney.com/text_data")
+
+    log = caplog.records[0].msg
+    assert log["response"]["body"] == "Resp"
+    assert log["response"]["body_size"] == 8
+    assert log["response"]["body_truncated"] is True
+
+
+@pytest.mark.parametrize("data", ["ab" * 10, b"ab" * 10])
+def test_session_request_body_limit(caplog, m, data):
+    caplog.set_level(logging.INFO)
+    m.post("https://ovalmoney.com/text_data")
+
+    s = Session(log_request_body_limit=5)
+    s.post(
+        "https://ovalmoney.com/text_data",
+        headers={"Content-Type": "text/plain"},
+        data=data,
+    )
+
+    log = caplog.records[0].msg
+    assert log["request"]["body"] == "ababa"
+    assert log["request"]["body_size"] == 20
+    assert log["request"]["body_truncated"] is True
+
+
+def test_session_body_under_limit(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.post(
+        "https://ovalmoney.com/text_data",
+        headers={"Content-Type": "text/plain"},
+        text="ok",
+    )
+
+    s = Session(log_request_body_limit=100, log_response_body_limit=100)
+    s.post(
+        "https://ovalmoney.com/text_data",
+        headers={"Content-Type": "text/plain"},
+        data="è",
+    )
+
+    log = caplog.records[0].msg
+    assert log["request"]["body"] == "è"
+    assert (log["request"]["body_size"], log["request"]["body_truncated"]) == (2, False)
+    assert (log["response"]["body_size"], log["response"]["body_truncated"]) == (
+        2,
+        False,
+    )
+
+
+def test_not_loggable_body_is_not_decoded():
+    log_rec = RequestLogRecord()
+    content = MagicMock(spec=bytes)
+    content.__len__.return_value = 10
+    response = MagicMock(
+        status_code=200, headers={"Content-Type": "video"}, content=content
+    )
+
+    decorate_log_response(
+        log_rec, response, body_type_filter=BodyTypeFilter(DEFAULT_ALLOWED_TYPES)
+    )
+
+    assert not content.decode.called
+    assert log_rec.asdict()["response"]["body"] == BODY_NOT_LOGGABLE.format("video")
+
+
+def test_truncated_json_body_is_redacted(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get(
+        "https://ovalmoney.com/json",
+        headers={"Content-Type": "application/json"},
+        text='{"user": "me", "password": "secret"}',
+    )
+
+    s = Session(
+        log_filters=[JsonBodyFilter({"password": True})], log_response_body_limit=31
+    )
+    s.get("https://ovalmoney.com/json")
+
+    log = caplog.records[0].msg
+    assert log["response"]["body"] == '{"user":"me","password":"<filtered>"'
+    assert log["response"]["body_truncated"] is True
+
+
+def test_session_sampler(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/health", status_code=200)
+    m.get("https://ovalmoney.com/fail", status_code=500)
+    m.get("https://ovalmoney.com/user", status_code=200)
+    decorate = MagicMock()
+
+    s = Session(log_sampler=Sampler(route_rates={"/health": 0.0, "/fail": 0.0}))
+    s._decorate_request = decorate
+    s.get("https://ovalmoney.com/health")
+
+    assert not caplog.records
+    assert not decorate.called
+
+    s = Session(log_sampler=Sampler(route_rates={"/health": 0.0, "/fail": 0.0}))
+    s.get("https://ovalmoney.com/fail")
+    s.get("https://ovalmoney.com/user")
+
+    assert [rec.msg["request"]["path"] for rec in caplog.records] == ["/fail", "/user"]
+
+
+def test_session_sampler_keeps_exceptions(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/user", exc=requests.exceptions.ConnectTimeout)
+
+    s = Session(log_sampler=Sampler(rate=0.0))
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        s.get("https://ovalmoney.com/user")
+
+    assert len(caplog.records) == 1
+
+
+def test_session_retention(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/ok", headers={"Content-Type": "text/plain"}, text="ok")
+    m.get(
+        "https://ovalmoney.com/fail",
+        headers={"Content-Type": "text/plain"},
+        text="ko",
+        status_code=500,
+    )
+
+    s = Session(log_retention=RetentionPolicy())
+    s.get("https://ovalmoney.com/ok", headers={"Authorization": "token"})
+    s.get("https://ovalmoney.com/fail")
+
+    minimal, full = [rec.msg for rec in caplog.records]
+    assert minimal["request"]["path"] == "/ok"
+    assert minimal["request"]["method"] == "GET"
+    assert minimal["request"]["header"] == {}
+    assert minimal["response"]["status_code"] == 200
+    assert minimal["response"]["body"] is None
+    assert full["response"]["status_code"] == 500
+    assert full["response"]["body"] == "ko"
+
+
+def test_session_retention_drop(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/ok", status_code=200)
+    m.get("https://ovalmoney.com/fail", exc=requests.exceptions.ConnectTimeout)
+
+    s = Session(log_retention=RetentionPolicy(otherwise=Retention.DROP))
+    s.get("https://ovalmoney.com/ok")
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        s.get("https://ovalmoney.com/fail")
+
+    assert [rec.msg["request"]["path"] for rec in caplog.records] == ["/fail"]
+
+
+def test_session_retention_dispatcher(caplog, m):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/ok", headers={"Content-Type": "text/plain"}, text="ok")
+    dispatcher = LogDispatcher()
+
+    s = Session(log_dispatcher=dispatcher, log_retention=RetentionPolicy())
+    s.get("https://ovalmoney.com/ok")
+    dispatcher.flush(timeout=5)
+
+    log = caplog.records[0].msg
+    assert log["response"]["status_code"] == 200
+    assert log["response"]["body"] is None
+    dispatcher.close()
+
+
+def test_session_time_is_monotonic(caplog, m, monkeypatch):
+    caplog.set_level(logging.INFO)
+    m.get("https://ovalmoney.com/user", status_code=200)
+
+    counter = iter([10 ** 9, 10 ** 9 + 2500000])
+    monkeypatch.setattr("nephthys.clock.perf_counter_ns", lambda: next(counter))
+
+    Session().get("https://ovalmoney.com/user")
+
+    log = caplog.records[0].msg
+    assert log["request"]["time"] == 2.5
+    assert log["request"]["start"] <= log["request"]["end"]
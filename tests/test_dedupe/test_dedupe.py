@@ -0,0 +1,152 @@
+import logging
+import subprocess
+import sys
+import time
+
+from nephthys import FilterLoggerAdapter, Log, RequestLogRecord
+from nephthys.dedupe import Deduplicator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_dict(path="/poll", status_code=200, time=10, body=None):
+    return {
+        "extra_tags": ["tag"],
+        "request": {"method": "GET", "path": path, "time": time, "body": body},
+        "response": {"status_code": status_code},
+    }
+
+
+def test_first_occurrence_then_summary():
+    clock = Clock()
+    dedupe = Deduplicator(window=60, clock=clock)
+
+    assert dedupe.add(make_dict(time=10), logging.INFO) == (True, [])
+    assert dedupe.add(make_dict(time=20), logging.INFO) == (False, [])
+    assert dedupe.add(make_dict(time=40), logging.INFO) == (False, [])
+    assert dedupe.add(make_dict(status_code=500), logging.INFO) == (True, [])
+
+    clock.now = 61
+    emit, summaries = dedupe.add(make_dict(), logging.INFO)
+
+    assert emit
+    (level, summary), = summaries
+    assert level == logging.INFO
+    assert summary["message"] == "repeated 2 times"
+    assert summary["extra_tags"] == ["tag"]
+    assert summary["fingerprint"]["request.path"] == "/poll"
+    assert summary["time"] == {"min": 20, "max": 40, "avg": 30}
+
+
+def test_long_values_are_hashed():
+    dedupe = Deduplicator(fields=("request.body",))
+
+    assert dedupe.add(make_dict(body="a" * 1000), logging.INFO)[0]
+    assert not dedupe.add(make_dict(body="a" * 1000), logging.INFO)[0]
+    assert dedupe.add(make_dict(body="a" * 999 + "b"), logging.INFO)[0]
+
+    (_, summary), = dedupe.flush()
+    assert summary["fingerprint"]["request.body"].startswith("blake2b:")
+
+
+def test_lru_eviction():
+    dedupe = Deduplicator(max_size=2)
+
+    dedupe.add(make_dict(path="/a"), logging.INFO)
+    dedupe.add(make_dict(path="/b"), logging.INFO)
+    dedupe.add(make_dict(path="/a"), logging.INFO)
+    dedupe.add(make_dict(path="/b"), logging.INFO)
+    dedupe.add(make_dict(path="/a"), logging.INFO)
+
+    emit, summaries = dedupe.add(make_dict(path="/c"), logging.INFO)
+
+    assert emit
+    assert len(dedupe) == 2
+    assert [summary["fingerprint"]["request.path"] for _, summary in summaries] == [
+        "/b"
+    ]
+
+
+def test_adapter_dedupe(caplog):
+    caplog.set_level(logging.INFO, logger="dedupe_logger")
+    adapter = FilterLoggerAdapter(
+        logging.getLogger("dedupe_logger"), dedupe=Deduplicator()
+    )
+
+    for _ in range(3):
+        rec = RequestLogRecord()
+        rec.url = "https://ovalmoney.com/poll"
+        rec.status_code = 200
+        adapter.info(Log(rec))
+    try:
+        raise ValueError()
+    except ValueError:
+        adapter.exception(Log(RequestLogRecord()))
+        adapter.exception(Log(RequestLogRecord()))
+
+    assert len(caplog.records) == 3
+
+    adapter.flush_repeated()
+
+    assert caplog.records[-1].msg["message"] == "repeated 2 times"
+    assert caplog.records[-1].levelno == logging.INFO
+
+
+def test_expire():
+    clock = Clock()
+    dedupe = Deduplicator(window=60, clock=clock)
+
+    dedupe.add(make_dict(), logging.INFO)
+    dedupe.add(make_dict(), logging.INFO)
+    dedupe.add(make_dict(path="/other"), logging.WARNING)
+    assert dedupe.expire() == []
+
+    clock.now = 60
+    (level, summary), = dedupe.expire()
+    assert (level, summary["message"]) == (logging.INFO, "repeated 1 times")
+    assert len(dedupe) == 0
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_adapter_logs_expired_windows(caplog):
+    caplog.set_level(logging.INFO, logger="dedupe_expired")
+    adapter = FilterLoggerAdapter(
+        logging.getLogger("dedupe_expired"), dedupe=Deduplicator(window=0.05)
+    )
+
+    adapter.info(make_dict())
+    adapter.info(make_dict())
+
+    # Without any other record logged
+    assert wait_for(lambda: len(caplog.records) == 2)
+    assert caplog.records[-1].msg["message"] == "repeated 1 times"
+
+
+def test_adapter_logs_pending_windows_at_exit():
+    script = """
+import logging, sys
+from nephthys import FilterLoggerAdapter
+from nephthys.dedupe import Deduplicator
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO, format="%(message)s")
+adapter = FilterLoggerAdapter(logging.getLogger("exit"), dedupe=Deduplicator(window=3600))
+for _ in range(3):
+    adapter.info({"request": {"path": "/poll"}})
+"""
+    out = subprocess.check_output(
+        [sys.executable, "-c", script], universal_newlines=True
+    )
+
+    assert "'message': 'repeated 2 times'" in out.splitlines()[-1]
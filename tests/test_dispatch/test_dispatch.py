@@ -0,0 +1,111 @@
+import threading
+
+from nephthys.dispatch import FullPolicy, LogDispatcher
+
+
+def test_submit_runs_on_worker():
+    dispatcher = LogDispatcher()
+    threads = []
+
+    dispatcher.submit(lambda: threads.append(threading.current_thread()))
+    assert dispatcher.flush(timeout=5)
+
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+    dispatcher.close()
+
+
+def test_submit_args():
+    dispatcher = LogDispatcher()
+    out = []
+
+    dispatcher.submit(out.append, "value")
+    dispatcher.flush(timeout=5)
+
+    assert out == ["value"]
+    dispatcher.close()
+
+
+def test_drop_when_full():
+    dispatcher = LogDispatcher(queue_size=1, full_policy=FullPolicy.DROP)
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait(5)
+
+    dispatcher.submit(blocking_job)
+    started.wait(5)
+
+    assert dispatcher.submit(lambda: None)
+    assert not dispatcher.submit(lambda: None)
+    assert dispatcher.dropped == 1
+
+    release.set()
+    dispatcher.close()
+
+
+def test_block_timeout_when_full():
+    dispatcher = LogDispatcher(
+        queue_size=1, full_policy=FullPolicy.BLOCK, block_timeout=0.01
+    )
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait(5)
+
+    dispatcher.submit(blocking_job)
+    started.wait(5)
+    dispatcher.submit(lambda: None)
+
+    assert not dispatcher.submit(lambda: None)
+    assert dispatcher.dropped == 1
+
+    release.set()
+    dispatcher.close()
+
+
+def test_close_flushes_pending_jobs():
+    dispatcher = LogDispatcher()
+    out = []
+
+    for i in range(100):
+        dispatcher.submit(out.append, i)
+    dispatcher.close()
+
+    assert out == list(range(100))
+    assert not dispatcher.submit(out.append, 100)
+
+
+def test_job_exception_does_not_stop_worker(caplog):
+    dispatcher = LogDispatcher()
+    out = []
+
+    def failing_job():
+        raise Exception()
+
+    dispatcher.submit(failing_job)
+    dispatcher.submit(out.append, "after")
+    dispatcher.flush(timeout=5)
+
+    assert out == ["after"]
+    assert any(rec.msg == "Failed to log" for rec in caplog.records)
+    dispatcher.close()
+
+
+def test_restart_after_fork():
+    dispatcher = LogDispatcher()
+    dispatcher.submit(lambda: None)
+    dispatcher.flush(timeout=5)
+
+    # Simulate running in a forked child
+    dispatcher._pid = -1
+    out = []
+    dispatcher.submit(out.append, "child")
+    dispatcher.flush(timeout=5)
+
+    assert out == ["child"]
+    dispatcher.close()
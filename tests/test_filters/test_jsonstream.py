@@ -0,0 +1,282 @@
+import json
+
+import pytest
+import rapidjson
+
+from nephthys import FilterPipeline, RequestLogRecord
+from nephthys.filters.jsonstream import KeyIndex, SchemaAutomaton, redact
+from nephthys.filters.requests import (
+    JSON_BODY_FILTERED,
+    JsonBodyFilter,
+    filter_json_body,
+)
+
+REPLACEMENT = rapidjson.dumps(JSON_BODY_FILTERED)
+
+
+def tree_redact(text, schema):
+    body = rapidjson.loads(text)
+    filter_json_body(schema, body)
+    return rapidjson.dumps(body)
+
+
+@pytest.mark.parametrize(
+    "schema,body",
+    [
+        ({}, {"key": "value"}),
+        ({"key": True}, {"key": "value", "key2": "value"}),
+        ({"key": True}, {"key": {"nested": [1, 2, {"a": "b"}]}, "key2": [{"key": 1}]}),
+        (
+            {"key": {"key": True}},
+            {"key": {"key": 1.5, "other": None}, "other": {"key": 1}},
+        ),
+        ({"key": {"key": True}}, {"key": "not an object"}),
+        ({"key": True}, "string"),
+        ({"clé": True, 'k"q': True}, {"clé": "é", 'k"q': "\u0001", "other": "\\/"}),
+        (
+            {"key": True},
+            {"n": [0, -0.0, 1e20, 1e-07, 0.1, 100.0, 123456789012345678901234567890]},
+        ),
+        ({"key": True}, {"s": "{[x]}", "t": "]", "key": "}"}),
+    ],
+)
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_redact_matches_tree_filter(schema, body, indent, ensure_ascii):
+    text = json.dumps(body, indent=indent, ensure_ascii=ensure_ascii)
+
+    assert redact(text, schema, REPLACEMENT) == tree_redact(text, schema)
+
+
+def test_redact_copies_canonical_text():
+    text = '{"key":"value","items":[{"a":1,"b":[true,null]}],"f":1.25}'
+
+    assert redact(text, {"other": True}, REPLACEMENT) == text
+
+
+@pytest.mark.parametrize(
+    "schema,body,expected",
+    [
+        (
+            {"key": True},
+            [{"key": 1}, {"other": 2}],
+            [{"key": "<filtered>"}, {"other": 2}],
+        ),
+        (
+            {"items": {"iban": True}},
+            {"items": [{"iban": "IT60"}, [{"iban": "IT61"}], 1], "iban": "IT62"},
+            {
+                "items": [{"iban": "<filtered>"}, [{"iban": "<filtered>"}], 1],
+                "iban": "IT62",
+            },
+        ),
+        ({"items": True}, {"items": [1, {"a": 2}]}, {"items": "<filtered>"}),
+        (
+            {"*": {"card": True}},
+            {"a": {"card": 1, "b": 2}, "b": [{"card": 3}], "card": 4},
+            {
+                "a": {"card": "<filtered>", "b": 2},
+                "b": [{"card": "<filtered>"}],
+                "card": 4,
+            },
+        ),
+        (
+            {"a": {"*": True}},
+            {"a": {"b": 1, "c": [2]}, "d": 3},
+            {"a": {"b": "<filtered>", "c": "<filtered>"}, "d": 3},
+        ),
+        (
+            {"..password": True},
+            {"password": 1, "a": [{"b": {"password": 2}}], "c": {"password": {"x": 3}}},
+            {
+                "password": "<filtered>",
+                "a": [{"b": {"password": "<filtered>"}}],
+                "c": {"password": "<filtered>"},
+            },
+        ),
+        (
+            {"user": {"..token": True}},
+            {"token": 1, "user": {"token": 2, "session": {"token": 3}}},
+            {
+                "token": 1,
+                "user": {"token": "<filtered>", "session": {"token": "<filtered>"}},
+            },
+        ),
+        (
+            {"..card": {"number": True}, "card": {"cvv": True}},
+            {
+                "card": {"number": 1, "cvv": 2, "exp": 3},
+                "x": {"card": {"number": 4, "cvv": 5}},
+            },
+            {
+                "card": {"number": "<filtered>", "cvv": "<filtered>", "exp": 3},
+                "x": {"card": {"number": "<filtered>", "cvv": 5}},
+            },
+        ),
+        ({"..*": True}, {"a": 1}, {"a": "<filtered>"}),
+        ({"*": True}, [], []),
+        ({"\\*": True}, {"*": 1, "a": 2}, {"*": "<filtered>", "a": 2}),
+        (
+            {"\\..a": True},
+            {"..a": 1, "a": 2, "b": {"a": 3}},
+            {"..a": "<filtered>", "a": 2, "b": {"a": 3}},
+        ),
+        (
+            {"..\\*": True},
+            {"*": 1, "b": {"*": 2, "c": 3}},
+            {"*": "<filtered>", "b": {"*": "<filtered>", "c": 3}},
+        ),
+        ({"\\\\a": True}, {"\\a": 1, "a": 2}, {"\\a": "<filtered>", "a": 2}),
+    ],
+)
+def test_redact_paths(schema, body, expected):
+    text = json.dumps(body, indent=2)
+
+    assert json.loads(redact(text, SchemaAutomaton(schema), REPLACEMENT)) == expected
+
+
+def test_redact_long_array():
+    automaton = SchemaAutomaton({"items": {"iban": True}})
+    text = json.dumps({"items": [{"iban": "IT60", "n": i} for i in range(20000)]})
+
+    assert json.loads(redact(text, automaton, REPLACEMENT)) == {
+        "items": [{"iban": "<filtered>", "n": i} for i in range(20000)]
+    }
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"key": 1',
+        '{"key" 1}',
+        "[1, 2",
+        '{"key": 1} x',
+        "{1: 2}",
+        "nope",
+        '{"key":1 2}',
+        '{"key":1,}',
+        '{"key":1]',
+        '{"a":[1 2]}',
+        '{"a":{"b":1]}',
+        '{"a":{"b":1,}}',
+        '{"a":{"b" 1}}',
+        '{"a":{"b":}}',
+        '{"a":[1,,2]}',
+        '{"a":{"b":1}]',
+        '{"a":"\\x"}',
+        '{"key":{"b":1]}',
+        '{"key":[1 2]}',
+        '{"key":"\\x"}',
+        "[1,]",
+        "[1 2]",
+        "[,1]",
+    ],
+)
+def test_redact_invalid(text):
+    with pytest.raises(ValueError):
+        redact(text, {"key": True}, REPLACEMENT)
+
+
+@pytest.mark.parametrize(
+    "schema,text,expected",
+    [
+        ({"key": True}, '{"other": "keys"}', False),
+        ({"key": True}, '{"other": 1, "key": 2}', True),
+        ({"a": {"key": True}}, '{"a": {"b": 1}}', False),
+        ({"a": {"key": True}}, '{"a": {"key": 1}}', True),
+        ({"key": True}, '{"k\\u0065y": 1}', True),
+        ({"a/b": True}, '{"a\\/b": 1}', True),
+        ({}, '{"key": 1}', False),
+        ({"a": {}}, '{"a": 1}', False),
+        ({"..key": True}, '{"a": {"key": 1}}', True),
+        ({"..key": True}, '{"a": {"b": 1}}', False),
+        ({"a": {"*": True}}, '{"b": 1}', True),
+        ({"\\*": True}, '{"b": 1}', False),
+        ({"\\*": True}, '{"*": 1}', True),
+    ],
+)
+def test_key_index(schema, text, expected):
+    assert KeyIndex(schema).may_match(text) == expected
+
+
+def test_json_body_filter_skips_bodies_without_keys():
+    body_filter = JsonBodyFilter({"key": True})
+    body = '{ "other" : 1.50 }'
+
+    assert body_filter._filter_body(body) is body
+    assert body_filter._filter_body('{"key": 1}') == '{"key":"<filtered>"}'
+    assert (body_filter.skipped, body_filter.processed) == (1, 1)
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ('{"key": "sec', '{"key":"<filtered>"'),
+        ('{"key": {"a": [1, 2', '{"key":"<filtered>"'),
+        ('{"other": [1, 2], "ke', '{"other":[1,2],'),
+        ('{"other": {"a": "b", "c', '{"other":{"a":"b",'),
+    ],
+)
+def test_redact_partial(text, expected):
+    assert redact(text, {"key": True}, REPLACEMENT, partial=True) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"a":1} {"password":"x"}',
+        '{"a":1}\n{"password":"hunter2"}',
+        '{"password":"x"}{"password":"y"}',
+        "[1] [2]",
+        "1 2",
+        '"a" "b"',
+        '{"a": [1, {"b": 2}]} x',
+    ],
+)
+@pytest.mark.parametrize("partial", [False, True])
+def test_redact_rejects_data_after_document(text, partial):
+    with pytest.raises(ValueError):
+        redact(text, {"password": True}, REPLACEMENT, partial=partial)
+
+
+def test_redact_allows_trailing_whitespace():
+    assert (
+        redact('{"password": "x"} \n', {"password": True}, REPLACEMENT)
+        == '{"password":"<filtered>"}'
+    )
+    assert redact(" 1 ", {"password": True}, REPLACEMENT) == "1"
+
+
+def test_json_body_filter_rejects_concatenated_bodies():
+    rec = RequestLogRecord()
+    rec.add_request_header("Content-Type", "application/json")
+    rec.request_body = '{"a":1}\n{"password":"hunter2"}'
+
+    with pytest.raises(ValueError):
+        JsonBodyFilter({"password": True}).filter(rec)
+
+
+def filter_directly(body_filter, rec):
+    body_filter.filter(rec)
+
+
+def filter_compiled(body_filter, rec):
+    FilterPipeline([body_filter])(rec)
+
+
+@pytest.mark.parametrize("apply", [filter_directly, filter_compiled])
+def test_json_body_filter_partial_only_when_truncated(apply):
+    rec = RequestLogRecord()
+    rec.add_request_header("Content-Type", "application/json")
+    rec.add_response_header("Content-Type", "application/json")
+    rec.request_body = '{"other": 1, "key": "sec'
+    rec.request_body_truncated = True
+    rec.response_body = '{"other": 1, "key": "sec'
+
+    with pytest.raises(ValueError):
+        apply(JsonBodyFilter({"key": True}), rec)
+
+    rec.response_body_truncated = True
+    apply(JsonBodyFilter({"key": True}), rec)
+    assert rec._req_body == '{"other":1,"key":"<filtered>"'
+    assert rec._res_body == '{"other":1,"key":"<filtered>"'
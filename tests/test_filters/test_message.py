@@ -0,0 +1,60 @@
+import re
+
+import pytest
+
+from nephthys import FilterPipeline, LogRecord, RequestLogRecord
+from nephthys.filters.matcher import compile_patterns
+from nephthys.filters.message import FILTER_STRING, MessageBlacklist
+
+
+@pytest.mark.parametrize(
+    "patterns,text",
+    [
+        (["ab", "abc"], "abcd ab abc"),
+        (["abc", "ab"], "abcd ab abc"),
+        (["abcd", "ab", "abc"], "abce abcd abc"),
+        (["a.b", "c"], "a.b axb c"),
+        (
+            ["host.example.com", "customer-1"],
+            "host.example.com hostxexample.com customer-12",
+        ),
+        (["x+y", r"\d+"], "x+y xy 123"),
+    ],
+)
+def test_compile_patterns_matches_alternation(patterns, text):
+    expected = re.sub("|".join(patterns), FILTER_STRING, text)
+
+    assert compile_patterns(patterns).sub(FILTER_STRING, text) == expected
+
+
+def test_compile_patterns_empty():
+    assert compile_patterns([]) is None
+
+
+def test_empty_blacklist():
+    rec = LogRecord(message="message")
+    MessageBlacklist().filter(rec)
+
+    assert rec.asdict()["message"] == "message"
+
+
+@pytest.mark.parametrize(
+    "filter_bodies,expected", [(False, "id-1 body"), (True, "<filtered> body")]
+)
+def test_filter_bodies(filter_bodies, expected):
+    blacklist = MessageBlacklist(["id-1"], filter_bodies=filter_bodies)
+
+    rec = RequestLogRecord(message="id-1 message")
+    rec.request_body = "id-1 body"
+    rec.response_body = "id-1 body"
+    blacklist.filter(rec)
+
+    piped = RequestLogRecord(message="id-1 message")
+    piped.request_body = "id-1 body"
+    piped.response_body = "id-1 body"
+    FilterPipeline([blacklist])(piped)
+
+    for log in (rec.asdict(), piped.asdict()):
+        assert log["message"] == "<filtered> message"
+        assert log["request"]["body"] == expected
+        assert log["response"]["body"] == expected
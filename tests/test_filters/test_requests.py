@@ -2,7 +2,12 @@ import rapidjson
 import pytest
 
 from nephthys import RequestLogRecord, LogRecord
-from nephthys.filters.requests import HeaderFilter, BodyTypeFilter, JsonBodyFilter, QueryStringFilter
+from nephthys.filters.requests import (
+    HeaderFilter,
+    BodyTypeFilter,
+    JsonBodyFilter,
+    QueryStringFilter,
+)
 from nephthys.filters.requests import (
     RequestType,
     QS_FILTERED,
@@ -17,7 +22,11 @@ def rec_generator():
 
 
 def req_rec_generator(
-    request_headers=None, response_headers=None, request_body=None, response_body=None, qs=None
+    request_headers=None,
+    response_headers=None,
+    request_body=None,
+    response_body=None,
+    qs=None,
 ):
     req_rec = RequestLogRecord()
 
@@ -46,7 +55,7 @@ def req_rec_generator(
                     ("QSfiltered", "value2"),
                     ("QSNotFiltered", "value3"),
                     ("QSfiltered2", "value4"),
-                ],
+                ]
             ),
             req_rec_generator(
                 qs=[
@@ -54,7 +63,7 @@ def req_rec_generator(
                     ("QSfiltered", "value2"),
                     ("QSNotFiltered", "value3"),
                     ("QSfiltered2", QS_FILTERED),
-                ],
+                ]
             ),
         ),
         (
@@ -65,7 +74,7 @@ def req_rec_generator(
                     ("QSfiltered", "value2"),
                     ("QSNotFiltered", "value3"),
                     ("QSfiltered2", "value4"),
-                ],
+                ]
             ),
             req_rec_generator(
                 qs=[
@@ -73,7 +82,7 @@ def req_rec_generator(
                     ("QSfiltered", "value2"),
                     ("QSNotFiltered", "value3"),
                     ("QSfiltered2", "value4"),
-                ],
+                ]
             ),
         ),
         (["QSFiltered"], rec_generator(), rec_generator()),
@@ -0,0 +1,200 @@
+import datetime
+import enum
+import subprocess
+import sys
+
+import pytest
+
+from nephthys.formatters.backends import (
+    BACKENDS,
+    StdlibBackend,
+    available_backends,
+    get_backend,
+)
+from nephthys.formatters.json import JSONRenderer
+
+INSTALLED = available_backends()
+
+CONTENT = {
+    "message": "Café ☕ \U0001F600 \x1f\x7f \\u00e9",
+    "request": {
+        "time": 1.5,
+        "start": 1548936000.123,
+        "status": 200,
+        "body": None,
+        "ok": True,
+    },
+    "tags": ["a", "b"],
+    "date": datetime.datetime(2019, 1, 31, 12, 0),
+    "complex": 2 + 1j,
+}
+
+
+def test_available_backends():
+    assert INSTALLED[-1] == "json"
+    assert INSTALLED == [
+        backend.name for backend in BACKENDS if backend.name in INSTALLED
+    ]
+
+
+def test_default_is_fastest():
+    assert get_backend().name == INSTALLED[0]
+    assert JSONRenderer().backend is get_backend()
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+@pytest.mark.parametrize("sort_keys", [False, True])
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_backends_render_the_same(name, sort_keys, indent, ensure_ascii):
+    expected = JSONRenderer(
+        sort_keys=sort_keys, indent=indent, backend="json", ensure_ascii=ensure_ascii
+    )(CONTENT)
+    renderer = JSONRenderer(
+        sort_keys=sort_keys, indent=indent, backend=name, ensure_ascii=ensure_ascii
+    )
+
+    assert renderer(CONTENT) == expected
+    assert renderer.render_bytes(CONTENT) == expected.encode("utf-8")
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+def test_non_ascii_is_escaped_by_default(name):
+    renderer = JSONRenderer(backend=name)
+    expected = '{"message":"Caf\\u00E9 \\uD83D\\uDE00 \\u001F\x7f"}'
+
+    assert renderer({"message": "Café \U0001F600 \x1f\x7f"}) == expected
+    assert renderer.render_bytes(
+        {"message": "Café \U0001F600 \x1f\x7f"}
+    ) == expected.encode("ascii")
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+def test_non_ascii_output_is_opt_in(name):
+    renderer = JSONRenderer(backend=name, ensure_ascii=False)
+
+    assert renderer({"message": "Café \U0001F600"}) == '{"message":"Café \U0001F600"}'
+    assert renderer.render_bytes({"message": "Café"}) == '{"message":"Café"}'.encode(
+        "utf-8"
+    )
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+def test_default_hook(name):
+    renderer = JSONRenderer(backend=name)
+
+    assert renderer({"date": datetime.date(2019, 1, 31)}) == '{"date":"2019-01-31"}'
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+class Size(enum.IntEnum):
+    SMALL = 2
+
+
+class Kind(str, enum.Enum):
+    USER = "user"
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+@pytest.mark.parametrize(
+    "content,expected",
+    [
+        ({"value": Color.RED}, '{"value":"Color.RED"}'),
+        (
+            {"value": [Color.RED, (Color.RED,)], "other": 1},
+            '{"value":["Color.RED",["Color.RED"]],"other":1}',
+        ),
+        ({"value": {"nested": Color.RED}}, '{"value":{"nested":"Color.RED"}}'),
+        ({"value": Size.SMALL, "kind": Kind.USER}, '{"value":2,"kind":"user"}'),
+        (
+            {"value": b"ab", "array": bytearray(b"\xc3\xa9")},
+            '{"value":"ab","array":"\\u00E9"}',
+        ),
+        (
+            {"value": [float("nan"), float("inf"), -float("inf")]},
+            '{"value":[NaN,Infinity,-Infinity]}',
+        ),
+        (
+            {"value": {"nested": float("nan")}, "enum": Color.RED},
+            '{"value":{"nested":NaN},"enum":"Color.RED"}',
+        ),
+    ],
+)
+def test_backends_write_special_values_alike(name, content, expected):
+    renderer = JSONRenderer(backend=name)
+
+    assert renderer(content) == expected
+    assert renderer.render_bytes(content) == expected.encode("utf-8")
+
+
+@pytest.mark.skipif("orjson" not in INSTALLED, reason="orjson is not installed")
+def test_orjson_enum_leaves_content_unchanged():
+    content = {"value": [Color.RED], "other": {"key": "value"}}
+    JSONRenderer(backend="orjson")(content)
+
+    assert content == {"value": [Color.RED], "other": {"key": "value"}}
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+def test_non_string_keys(name):
+    assert JSONRenderer(backend=name)({1: "a", 2.5: "b"}) == '{"1":"a","2.5":"b"}'
+
+
+@pytest.mark.parametrize("name", INSTALLED)
+@pytest.mark.parametrize("value", [2 ** 70, "lone \udc80"])
+def test_fallback(name, value):
+    renderer = JSONRenderer(backend=name)
+    expected = JSONRenderer(backend="json")({"value": value})
+
+    assert renderer({"value": value}) == expected
+    assert renderer.render_bytes({"value": value}) == expected.encode(
+        "utf-8", "backslashreplace"
+    )
+
+
+def test_indent_selects_backend():
+    assert get_backend(indent=1).supports(1)
+    assert JSONRenderer(indent=1)({"a": 1}) == '{\n "a": 1\n}'
+
+
+def test_get_backend_errors():
+    with pytest.raises(ValueError):
+        get_backend("unknown")
+
+
+@pytest.mark.skipif("orjson" not in INSTALLED, reason="orjson is not installed")
+def test_orjson_indent():
+    with pytest.raises(ValueError):
+        get_backend("orjson", indent=4)
+
+
+def test_backend_instance():
+    backend = StdlibBackend()
+    assert JSONRenderer(backend=backend).backend is backend
+
+
+def test_without_optional_libraries():
+    script = """
+import sys
+sys.modules["orjson"] = sys.modules["rapidjson"] = None
+
+from nephthys import RequestLogRecord
+from nephthys.filters.requests import JsonBodyFilter
+from nephthys.formatters.json import JSONRenderer
+
+rec = RequestLogRecord()
+rec.add_request_header("Content-Type", "application/json")
+rec.request_body = '{"key": "value", "other": 1}'
+JsonBodyFilter({"key": True}).filter(rec)
+
+renderer = JSONRenderer()
+print(renderer.backend.name, renderer({"body": rec.asdict()["request"]["body"]}))
+"""
+    out = subprocess.check_output(
+        [sys.executable, "-c", script], universal_newlines=True
+    )
+
+    assert out == 'json {"body":"{\\"key\\":\\"<filtered>\\",\\"other\\":1}"}\n'
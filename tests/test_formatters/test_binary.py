@@ -0,0 +1,348 @@
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from nephthys import RequestLogRecord
+from nephthys.formatters.binary import (
+    RESET,
+    BinaryEncoder,
+    BinaryFormatter,
+    BinaryReader,
+    to_json_lines,
+)
+from nephthys.formatters.json import JSONFormatter
+from nephthys.handlers import BatchFileHandler
+
+FMT = "%(asctime)s %(levelname)s %(name)s %(message)s %(exc_info)s"
+
+
+def make_request_record(i=0):
+    rec = RequestLogRecord(extra_tags=["tag"])
+    rec.set_request_timing(1548936000.123, 1548936000.623, 500000123)
+    rec.method = "POST"
+    rec.url = "https://ovalmoney.com/user/{}?key=value&é=ü".format(i)
+    rec.route = "/user/{id}"
+    rec.add_route_match("id", str(i))
+    rec.add_request_querystring("key", "value")
+    rec.add_request_header("content-type", "application/json")
+    rec.add_request_header("X-Repeated", "a")
+    rec.add_request_header("x-repeated", "b")
+    rec.add_timing("connect", 1.25)
+    rec.add_timing("connection_reused", False)
+    rec.user = 123456789012345678901234567890
+    rec.request_body = '{"emoji": "\U0001F600", "control": "\x01"}'
+    rec.request_body_size = 70000
+    rec.status_code = 201
+    rec.add_response_header("Date", datetime.date(2019, 1, 31))
+    rec.response_body = "x" * 300
+    return rec
+
+
+def make_log(msg, exc_info=None):
+    record = logging.LogRecord(
+        "requests_out", logging.INFO, "/app/module", 1, msg, [], exc_info
+    )
+    record.created, record.msecs = 1548936000.25, 250.0
+    return record
+
+
+def read_all(*frames):
+    return list(BinaryReader().read(io.BytesIO(b"".join(frames))))
+
+
+@pytest.mark.parametrize("fmt", [None, FMT])
+def test_round_trip_matches_json(fmt):
+    binary = BinaryFormatter(fmt=fmt)
+    text = JSONFormatter(fmt=fmt)
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        exc_info = sys.exc_info()
+
+    records = [
+        make_log(make_request_record().asdict()),
+        make_log(
+            {
+                "int": -2 ** 40,
+                "float": -0.5,
+                "nested": {"1": [None, True]},
+                2: "number key",
+            }
+        ),
+        make_log("message %s"),
+        make_log(make_request_record(1).asdict(), exc_info),
+    ]
+    frames = [binary.format_bytes(record) for record in records]
+
+    assert read_all(*frames) == [json.loads(text.format(record)) for record in records]
+
+
+def test_values():
+    values = [
+        0,
+        127,
+        128,
+        -32,
+        -33,
+        2 ** 64 - 1,
+        -(2 ** 63),
+        2 ** 64,
+        -(2 ** 70),
+        1.5,
+        "",
+        "a" * 31,
+        "a" * 32,
+        "é" * 40000,
+        "\ud800",
+        list(range(16)),
+        [[]] * 70000,
+        {str(i): i for i in range(16)},
+        {},
+        True,
+        False,
+        None,
+    ]
+    encoder = BinaryEncoder()
+    assert read_all(*[encoder.encode_frame(value) for value in values]) == values
+
+
+def test_subclasses_and_default():
+    class Text(str):
+        def __str__(self):
+            return "overridden"
+
+    encoder = BinaryEncoder()
+    frame = encoder.encode_frame(
+        {"text": Text("value"), "tuple": (1, 2), "date": datetime.date(2019, 1, 31)}
+    )
+    assert read_all(frame) == [{"text": "value", "tuple": [1, 2], "date": "2019-01-31"}]
+
+
+def test_keys_written_once():
+    encoder = BinaryEncoder()
+    value = {"header": {"content-type": "application/json"}, "status_code": 200}
+
+    first = encoder.encode_frame(value)
+    second = encoder.encode_frame(value)
+    assert first[1] & RESET
+    assert not second[1] & RESET
+    assert len(second) < len(first)
+    assert b"content-type" in first
+    assert b"content-type" not in second
+    assert read_all(first, second) == [value, value]
+
+
+def test_reset_every():
+    encoder = BinaryEncoder(reset_every=2)
+    frames = [encoder.encode_frame({"index": i}) for i in range(5)]
+    assert [bool(frame[1] & RESET) for frame in frames] == [
+        True,
+        False,
+        True,
+        False,
+        True,
+    ]
+
+    # Reading starts at the first reset frame
+    reader = BinaryReader()
+    assert list(reader.read(io.BytesIO(b"".join(frames[1:])))) == [
+        {"index": i} for i in range(2, 5)
+    ]
+    assert reader.skipped == 1
+
+    encoder.reset()
+    assert encoder.encode_frame({"index": 5})[1] & RESET
+
+
+def test_max_keys():
+    encoder = BinaryEncoder(max_keys=2)
+    value = {"first": 1, "second": 2, "third": 3}
+    frames = [encoder.encode_frame(value) for _ in range(2)]
+    assert frames[1].count(b"third") == 1
+    assert read_all(*frames) == [value, value]
+
+
+def test_truncated():
+    frame = BinaryEncoder().encode_frame({"key": "value"})
+    with pytest.raises(ValueError):
+        read_all(frame[:-1])
+    with pytest.raises(ValueError):
+        read_all(frame, b"\x80")
+
+
+def test_default_raising_leaves_keys_undefined():
+    def default(value):
+        raise TypeError("not encodable")
+
+    encoder = BinaryEncoder(default=default, reset_every=3)
+    first = encoder.encode_frame({"a": 1})
+    with pytest.raises(TypeError):
+        encoder.encode_frame({"b": 1, "c": object()})
+    second = encoder.encode_frame({"b": 2, "a": 3})
+    third = encoder.encode_frame({"b": 4})
+
+    assert read_all(first, second, third) == [{"a": 1}, {"b": 2, "a": 3}, {"b": 4}]
+    assert third[1] & RESET == 0
+
+
+def test_failed_reset_frame_is_retried():
+    def default(value):
+        raise TypeError("not encodable")
+
+    encoder = BinaryEncoder(default=default)
+    with pytest.raises(TypeError):
+        encoder.encode_frame({"a": object()})
+    frame = encoder.encode_frame({"a": 1})
+
+    assert frame[1] & RESET
+    assert read_all(frame) == [{"a": 1}]
+
+
+def test_format_needs_format_bytes():
+    formatter = BinaryFormatter()
+    with pytest.raises(TypeError):
+        formatter.format(make_log("é"))
+
+    # Nothing was encoded
+    assert formatter.format_bytes(make_log("é"))[1] & RESET
+
+
+def test_stream_handler_does_not_write():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(BinaryFormatter())
+    handler.handleError = lambda record: None
+
+    handler.handle(make_log("message"))
+    assert stream.getvalue() == ""
+
+
+def write_stream(tmp_path, records):
+    path = str(tmp_path / "binary.log")
+    handler = BatchFileHandler(path, flush_interval=60)
+    handler.setFormatter(BinaryFormatter(reset_every=3))
+    for record in records:
+        handler.handle(record)
+    handler.close()
+    return path
+
+
+def test_handler_threads(tmp_path):
+    path = str(tmp_path / "binary.log")
+    handler = BatchFileHandler(path, buffer_size=256)
+    handler.setFormatter(BinaryFormatter(reset_every=10))
+
+    def run(thread):
+        for i in range(200):
+            handler.handle(
+                make_log({"thread": thread, "index": i, "key-{}".format(i % 7): i})
+            )
+
+    threads = [threading.Thread(target=run, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler.close()
+
+    with open(path, "rb") as fp:
+        values = list(BinaryReader().read(fp))
+    assert len(values) == 800
+    for thread in range(4):
+        indexes = [value["index"] for value in values if value["thread"] == thread]
+        assert indexes == list(range(200))
+        assert all(
+            value["key-{}".format(value["index"] % 7)] == value["index"]
+            for value in values
+        )
+
+
+@pytest.mark.parametrize("buffer_size", [1, 64 * 1024])
+def test_rotated_files_decode_on_their_own(tmp_path, buffer_size):
+    path = str(tmp_path / "binary.log")
+    handler = BatchFileHandler(
+        path, buffer_size=buffer_size, flush_interval=60, max_bytes=2000, backup_count=1
+    )
+    handler.setFormatter(BinaryFormatter())
+    for i in range(300):
+        handler.handle(make_log({"index": i, "key-{}".format(i % 5): i}))
+        if i % 50 == 49:
+            handler.flush()
+    handler.close()
+
+    # Only the retained files, the older ones are gone
+    backup_reader, reader = BinaryReader(), BinaryReader()
+    with gzip.open(path + ".1.gz", "rb") as fp:
+        backup = list(backup_reader.read(io.BytesIO(fp.read())))
+    with open(path, "rb") as fp:
+        current = list(reader.read(fp))
+
+    assert backup_reader.skipped == reader.skipped == 0
+    assert backup and current
+    indexes = [value["index"] for value in backup + current]
+    assert indexes == list(range(indexes[0], 300))
+    assert all(
+        value["key-{}".format(value["index"] % 5)] == value["index"]
+        for value in backup + current
+    )
+    assert os.path.getsize(path) <= 2000
+
+
+def test_to_json_lines(tmp_path):
+    first = write_stream(
+        tmp_path, [make_log(make_request_record(i).asdict()) for i in range(4)]
+    )
+    os.rename(first, first + ".1")
+    second = write_stream(tmp_path, [make_log("last")])
+
+    out = io.StringIO()
+    with open(first + ".1", "rb") as old, open(second, "rb") as new:
+        reader = to_json_lines([old, new], out)
+    assert reader.skipped == 0
+
+    expected = [
+        json.loads(JSONFormatter().format(make_log(make_request_record(i).asdict())))
+        for i in range(4)
+    ]
+    expected.append({"message": "last"})
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == expected
+
+
+def run_cli(*args, data=b""):
+    return subprocess.run(
+        [sys.executable, "-m", "nephthys.formatters.binary"] + list(args),
+        input=data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+
+
+def test_cli(tmp_path):
+    path = write_stream(tmp_path, [make_log({"index": i}) for i in range(5)])
+
+    result = run_cli(path)
+    expected = [{"message": None, "index": i} for i in range(5)]
+    assert [json.loads(line) for line in result.stdout.splitlines()] == expected
+    assert result.stderr == b""
+
+
+def test_cli_stdin_skips_frames():
+    encoder = BinaryEncoder(reset_every=3)
+    frames = [encoder.encode_frame({"index": i}) for i in range(5)]
+
+    result = run_cli(data=b"".join(frames[1:]))
+    assert [json.loads(line) for line in result.stdout.splitlines()] == [
+        {"index": 3},
+        {"index": 4},
+    ]
+    assert result.stderr == b"Skipped 2 frames before the first reset\n"
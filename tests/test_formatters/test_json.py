@@ -53,6 +53,13 @@ def test_not_a_dict():
     assert out == '{"message":"My message"}'
 
 
+def test_non_ascii():
+    log = LogRecord("test", 20, "/app/module", 1, "Café", [], None)
+
+    assert JSONFormatter().format(log) == '{"message":"Caf\\u00E9"}'
+    assert JSONFormatter(json_ensure_ascii=False).format(log) == '{"message":"Café"}'
+
+
 def test_default(msg):
     formatter = JSONFormatter()
     log = LogRecord("test", 20, "/app/module", 1, msg, [], None)
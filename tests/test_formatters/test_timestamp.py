@@ -0,0 +1,60 @@
+import logging
+from logging import LogRecord
+
+from nephthys.formatters.json import JSONFormatter
+from nephthys.formatters.pretty import PrettyFormatter
+from nephthys.formatters.timestamp import ISOTimestamp
+
+# 2019-01-31T12:00:00Z
+CREATED = 1548936000.0
+
+
+def make_record(created, msg="My message"):
+    record = LogRecord("test", logging.INFO, "/app/module", 1, msg, [], None)
+    record.created = created
+    record.msecs = (created - int(created)) * 1000
+    return record
+
+
+def test_iso_timestamp():
+    timestamp = ISOTimestamp()
+
+    assert timestamp(CREATED) == "2019-01-31T12:00:00.000Z"
+    assert timestamp(CREATED + 0.375) == "2019-01-31T12:00:00.375Z"
+    assert timestamp(CREATED + 61.5) == "2019-01-31T12:01:01.500Z"
+    assert timestamp(CREATED, msecs=7.9) == "2019-01-31T12:00:00.007Z"
+
+
+def test_iso_timestamp_caches_second(monkeypatch):
+    timestamp = ISOTimestamp()
+    calls = []
+    strftime = "nephthys.formatters.timestamp.time.strftime"
+    original = __import__("time").strftime
+    monkeypatch.setattr(strftime, lambda *args: calls.append(args) or original(*args))
+
+    for i in range(10):
+        timestamp(CREATED + i / 10)
+    timestamp(CREATED + 1)
+
+    assert len(calls) == 2
+
+
+def test_json_formatter_iso_time():
+    formatter = JSONFormatter(fmt="%(asctime)s %(message)s", iso_time=True)
+    out = formatter.format(make_record(CREATED + 0.25))
+
+    assert out == '{"asctime":"2019-01-31T12:00:00.250Z","message":"My message"}'
+
+
+def test_json_formatter_datefmt():
+    formatter = JSONFormatter(fmt="%(asctime)s", datefmt="%Y", iso_time=True)
+    out = formatter.format(make_record(CREATED))
+
+    assert out.startswith('{"asctime":"2019"')
+
+
+def test_pretty_formatter_iso_time():
+    formatter = PrettyFormatter(fmt="%(asctime)s %(message)s", iso_time=True)
+    out = formatter.format(make_record(CREATED + 0.5, {"key": "value"}))
+
+    assert out == '2019-01-31T12:00:00.500Z {\n  "key": "value"\n}'
@@ -0,0 +1,241 @@
+import gzip
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from nephthys import FilterLoggerAdapter, Log, RequestLogRecord
+from nephthys.formatters.json import JSONFormatter
+from nephthys.handlers import BatchFileHandler, _write_all
+
+
+def make_record(message, msg=None):
+    return logging.LogRecord(
+        "test",
+        logging.INFO,
+        "/app/module",
+        1,
+        msg if msg is not None else message,
+        [],
+        None,
+    )
+
+
+def read_lines(path):
+    with open(path, "rb") as fp:
+        return fp.read().splitlines()
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "nephthys.log")
+
+
+def test_buffered_until_flush(path):
+    handler = BatchFileHandler(path, flush_interval=60)
+    handler.setFormatter(JSONFormatter())
+
+    handler.handle(make_record("first"))
+    handler.handle(make_record(None, {"key": "é"}))
+    assert read_lines(path) == []
+
+    handler.flush()
+    assert [json.loads(line) for line in read_lines(path)] == [
+        {"message": "first"},
+        {"message": None, "key": "é"},
+    ]
+    handler.close()
+
+
+def test_flush_interval(path):
+    handler = BatchFileHandler(path, flush_interval=0.01)
+    handler.setFormatter(JSONFormatter())
+
+    handler.handle(make_record("message"))
+
+    assert wait_for(lambda: read_lines(path) == [b'{"message":"message"}'])
+    handler.close()
+
+
+def test_buffer_size_wakes_flusher(path):
+    handler = BatchFileHandler(path, buffer_size=1, flush_interval=60)
+    handler.setFormatter(JSONFormatter())
+
+    handler.handle(make_record("message"))
+
+    assert wait_for(lambda: len(read_lines(path)) == 1)
+    handler.close()
+
+
+def test_plain_formatter(path):
+    handler = BatchFileHandler(path, encoding="latin-1")
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+    handler.handle(make_record("café"))
+    handler.close()
+
+    assert read_lines(path) == ["INFO café".encode("latin-1")]
+
+
+def test_request_records(path):
+    handler = BatchFileHandler(path)
+    handler.setFormatter(JSONFormatter())
+    rec = RequestLogRecord()
+    rec.method = "GET"
+
+    handler.handle(make_record(None, rec.asdict()))
+    handler.close()
+
+    assert json.loads(read_lines(path)[0])["request"]["method"] == "GET"
+
+
+def test_emit_after_close(path):
+    handler = BatchFileHandler(path)
+    handler.close()
+
+    handler.handle(make_record("late"))
+    handler.handle(make_record("later"))
+
+    assert read_lines(path) == [b"late", b"later"]
+    # The file is not left open
+    assert handler._fd is None
+    handler.close()
+
+
+def test_logger_integration(path):
+    handler = BatchFileHandler(path)
+    handler.setFormatter(JSONFormatter())
+    log = logging.getLogger("test_batch_handler")
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    try:
+        for i in range(100):
+            log.info({"i": i})
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    assert [json.loads(line)["i"] for line in read_lines(path)] == list(range(100))
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_rotation(path, compress):
+    handler = BatchFileHandler(
+        path, flush_interval=60, max_bytes=100, backup_count=2, compress=compress
+    )
+
+    for i in range(7):
+        # 50 bytes per record, two records per file
+        handler.handle(make_record("{:049d}".format(i)))
+        handler.flush()
+    handler.close()
+
+    def backup(index):
+        name = "{}.{}".format(path, index)
+        if compress:
+            with gzip.open(name + ".gz", "rb") as fp:
+                return fp.read().splitlines()
+        return read_lines(name)
+
+    # The oldest file, holding 0 and 1, is dropped
+    assert [int(line) for line in backup(2)] == [2, 3]
+    assert [int(line) for line in backup(1)] == [4, 5]
+    assert read_lines(path) == ["{:049d}".format(6).encode()]
+    assert sorted(os.listdir(os.path.dirname(path))) == sorted(
+        ["nephthys.log"]
+        + ["nephthys.log.{}{}".format(i, ".gz" if compress else "") for i in (1, 2)]
+    )
+
+
+def test_rotation_of_large_batch(path):
+    handler = BatchFileHandler(path, max_bytes=10, backup_count=1, compress=False)
+
+    handler.handle(make_record("larger than max_bytes"))
+    handler.flush()
+    handler.handle(make_record("next"))
+    handler.close()
+
+    assert read_lines(path + ".1") == [b"larger than max_bytes"]
+    assert read_lines(path) == [b"next"]
+
+
+def test_partial_writev(path, monkeypatch):
+    if not hasattr(os, "writev"):
+        pytest.skip("writev is not available")
+
+    real_write = os.write
+    monkeypatch.setattr(os, "writev", lambda fd, chunks: real_write(fd, chunks[0][:3]))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+    try:
+        _write_all(fd, [b"abcdef\n", b"ghi\n"], 11)
+    finally:
+        os.close(fd)
+
+    assert read_lines(path) == [b"abcdef", b"ghi"]
+
+
+def test_flush_at_exit(path):
+    script = """
+import logging, sys
+from nephthys.handlers import BatchFileHandler
+
+handler = BatchFileHandler(sys.argv[1], flush_interval=60)
+log = logging.getLogger("exit")
+log.addHandler(handler)
+log.warning("pending at exit")
+"""
+    subprocess.check_call([sys.executable, "-c", script, path], cwd=os.getcwd())
+
+    assert read_lines(path) == [b"pending at exit"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_drops_parent_buffer(path):
+    handler = BatchFileHandler(path, flush_interval=60)
+    handler.setFormatter(JSONFormatter())
+    handler.handle(make_record("parent"))
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            handler.handle(make_record("child"))
+            handler.flush()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    handler.close()
+    assert [json.loads(line)["message"] for line in read_lines(path)] == [
+        "child",
+        "parent",
+    ]
+
+
+def test_log_record_adapter(path):
+    handler = BatchFileHandler(path)
+    handler.setFormatter(JSONFormatter())
+    log = logging.getLogger("test_batch_adapter")
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    try:
+        FilterLoggerAdapter(log).info(Log(RequestLogRecord()))
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+    assert json.loads(read_lines(path)[0])["extra_tags"] == ["test_batch_adapter"]
@@ -0,0 +1,48 @@
+import pytest
+
+from nephthys.retention import Retention, RetentionPolicy
+
+
+@pytest.mark.parametrize(
+    "kwargs,expected",
+    [
+        ({"time": 10, "status_code": 200}, Retention.MINIMAL),
+        ({"time": 10, "status_code": 200, "exception": True}, Retention.FULL),
+        ({"time": 10, "status_code": 503}, Retention.FULL),
+        ({"time": 10, "status_code": 404}, Retention.MINIMAL),
+        ({"time": 1000, "status_code": 200}, Retention.FULL),
+        ({"route": "/slow", "time": 1000, "status_code": 200}, Retention.MINIMAL),
+        ({"route": "/fast", "time": 60, "status_code": 200}, Retention.FULL),
+    ],
+)
+def test_retention(kwargs, expected):
+    policy = RetentionPolicy(
+        slow_time=500, route_slow_times={"/slow": 5000, "/fast": 50}
+    )
+
+    assert policy.retention(**kwargs) == expected
+
+
+def test_retention_status_ranges_and_otherwise():
+    policy = RetentionPolicy(status_ranges=[(400, 500)], otherwise=Retention.DROP)
+
+    assert policy.retention(status_code=404) == Retention.FULL
+    assert policy.retention(status_code=500) == Retention.DROP
+    assert policy.retention(time=10 ** 6) == Retention.DROP
+
+
+def test_request_retention_by_path():
+    policy = RetentionPolicy(route_slow_times={"/health": 0})
+
+    assert (
+        policy.request_retention("https://ovalmoney.com/health", time=1)
+        == Retention.FULL
+    )
+    assert (
+        policy.request_retention("https://ovalmoney.com/user", time=1)
+        == Retention.MINIMAL
+    )
+    assert (
+        policy.request_retention("https://ovalmoney.com/health", route="/user", time=1)
+        == Retention.MINIMAL
+    )
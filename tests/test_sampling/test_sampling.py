@@ -0,0 +1,101 @@
+import logging
+
+import pytest
+
+from nephthys import RequestLogRecord
+from nephthys.sampling import Sampler
+
+
+@pytest.mark.parametrize(
+    "route,host,expected",
+    [
+        ("/health", "a.com", 0.0),
+        ("/user", "a.com", 0.5),
+        ("/user", "b.com", 1.0),
+        (None, None, 1.0),
+    ],
+)
+def test_rate(route, host, expected):
+    sampler = Sampler(route_rates={"/health": 0.0}, host_rates={"a.com": 0.5})
+
+    assert sampler.rate(route, host) == expected
+
+
+def test_sample_fixed_rate():
+    assert all(Sampler(rate=1.0).sample() for _ in range(100))
+
+    sampler = Sampler(rate=0.0)
+    assert not any(sampler.sample() for _ in range(100))
+    assert sampler.dropped == 100
+
+
+def test_sample_random_rate():
+    sampler = Sampler(rate=0.5)
+
+    kept = sum(sampler.sample() for _ in range(2000))
+    assert 800 < kept < 1200
+
+
+def test_sample_deterministic_key():
+    first, second = Sampler(rate=0.3), Sampler(rate=0.3)
+    keys = ["id-{}".format(i) for i in range(1000)]
+
+    decisions = [first.sample(key=key) for key in keys]
+    assert decisions == [second.sample(key=key) for key in keys]
+    assert 200 < sum(decisions) < 400
+
+
+def test_key():
+    sampler = Sampler(key_header="X-Correlation-Id")
+
+    assert sampler.key({"X-Correlation-Id": "abc"}, "uuid") == "abc"
+    assert sampler.key({}, "uuid") == "uuid"
+    assert Sampler().key({"X-Correlation-Id": "abc"}) is None
+
+
+def test_sample_request_by_path():
+    sampler = Sampler(route_rates={"/health": 0.0})
+
+    assert not sampler.sample_request("https://ovalmoney.com/health")
+    assert sampler.sample_request("https://ovalmoney.com/user")
+    assert sampler.sample_request("https://ovalmoney.com/health", route="/status")
+
+
+@pytest.mark.parametrize(
+    "status_code,level,expected",
+    [
+        (200, logging.INFO, False),
+        (399, logging.INFO, False),
+        (400, logging.INFO, True),
+        (404, logging.INFO, True),
+        (500, logging.INFO, True),
+        (503, logging.INFO, True),
+        (200, logging.ERROR, True),
+    ],
+)
+def test_keep_errors(status_code, level, expected):
+    rec = RequestLogRecord()
+    rec.status_code = status_code
+
+    assert Sampler(rate=0.0).keep(rec, level) == expected
+
+
+def test_keep_server_errors_only():
+    rec = RequestLogRecord()
+    rec.status_code = 404
+
+    assert not Sampler(rate=0.0, error_status=500).keep(rec)
+    rec.status_code = 500
+    assert Sampler(rate=0.0, error_status=500).keep(rec)
+
+
+def test_keep_uses_record_fields():
+    rec = RequestLogRecord()
+    rec.url = "https://ovalmoney.com/health"
+    rec.status_code = 200
+
+    assert not Sampler(route_rates={"/health": 0.0}).keep(rec)
+    assert Sampler(host_rates={"other.com": 0.0}).keep(rec)
+
+    rec.route = "/status"
+    assert Sampler(route_rates={"/health": 0.0}).keep(rec)